@@ -21,17 +21,23 @@ Define the SupplyChain class.
 
 __all__ = ['SupplyChain']
 
+import functools
+import hashlib
 import logging
+import os
+import time
 import datetime as dt
-from tqdm import tqdm
+import numba
 import numpy as np
 import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from threadpoolctl import threadpool_limits
 
 from climada import CONFIG
 from climada.util import files_handler as u_fh
 import climada.util.coordinates as u_coord
 from climada.engine import Impact
-from climada.entity.exposures.base import Exposures
 
 LOGGER = logging.getLogger(__name__)
 WIOD_FILE_LINK = CONFIG.engine.supplychain.resources.wiod16.str()
@@ -40,6 +46,26 @@ WIOD_FILE_LINK = CONFIG.engine.supplychain.resources.wiod16.str()
 WIOD_DIRECTORY = CONFIG.engine.supplychain.local_data.wiod.dir()
 """Directory where WIOD tables are downloaded into."""
 
+PRECISION = CONFIG.engine.supplychain.precision.str()
+"""Default floating point precision of the impact calculations, 'float32' or 'float64'."""
+
+BLAS_THREADS = CONFIG.engine.supplychain.blas_threads.int()
+"""Default maximal number of BLAS threads of the matrix operations, 0 for no limit."""
+
+INCREMENTAL_MAX_UPDATES = 20
+"""Maximal number of successive incremental updates of the indirect impacts before
+they are recomputed for all sectors, to bound the accumulated rounding errors."""
+
+def _blas_limited(method):
+    """Run a SupplyChain method with at most blas_threads BLAS threads."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.blas_threads:
+            return method(self, *args, **kwargs)
+        with threadpool_limits(limits=self.blas_threads, user_api='blas'):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class SupplyChain():
     """SupplyChain class.
 
@@ -48,8 +74,10 @@ class SupplyChain():
 
     Attributes
     ----------
-    mriot_data : np.array
-        The input-output table data.
+    mriot_data : np.array or scipy.sparse matrix
+        The input-output table data. The matrices derived from it and from total_prod
+        are cached until they are replaced; call reset_io_cache after modifying them
+        in place.
     mriot_reg_names : np.array
         Names of regions considered in the input-output table.
     sectors : np.array
@@ -59,7 +87,8 @@ class SupplyChain():
     mriot_type : str
         Type of the adopted input-output table.
     reg_pos : dict
-        Regions' positions within the input-output table and impact arrays.
+        Regions' positions (integer arrays) within the input-output table and impact
+        arrays.
     reg_dir_imp : list
         Regions undergoing direct impacts.
     years : np.array
@@ -78,11 +107,32 @@ class SupplyChain():
         Average annual total impact array.
     io_data : dict
         Dictionary with the coefficients, inverse and risk_structure matrixes and
-        the selected input-output modeling approach.
+        the selected input-output modeling approach. The risk_structure is None if
+        it was not requested.
+    precision : np.dtype
+        Floating point type of the coefficients, inverse and impact arrays, float32
+        or float64 (e.g. for validation). The inverse is always computed in float64.
+    blas_threads : int
+        Maximal number of BLAS threads of the matrix operations, 0 for no limit,
+        e.g. 1 when several calculations run in parallel on one machine.
     """
 
-    def __init__(self):
-        """Initialize SupplyChain."""
+    def __init__(self, precision=None, blas_threads=None):
+        """Initialize SupplyChain.
+
+        Parameters
+        ----------
+        precision : str, optional
+            'float32' or 'float64'. Default: engine.supplychain.precision of CONFIG.
+        blas_threads : int, optional
+            Maximal number of BLAS threads, 0 for no limit.
+            Default: engine.supplychain.blas_threads of CONFIG.
+        """
+        self.precision = np.dtype(PRECISION if precision is None else precision)
+        if self.precision not in (np.float32, np.float64):
+            raise ValueError(f'Unsupported precision {self.precision}. '
+                             'Possible precisions are float32 and float64.')
+        self.blas_threads = BLAS_THREADS if blas_threads is None else blas_threads
         self.mriot_data = np.array([], dtype='f')
         self.mriot_reg_names = np.array([], dtype='str')
         self.sectors = np.array([], dtype='str')
@@ -97,10 +147,14 @@ class SupplyChain():
         self.total_impact = np.array([], dtype='f')
         self.total_aai_agg = np.array([], dtype='f')
         self.io_data = {}
+        self._io_cache = {}
+        self._reg_map = {}
+        self._dir_imp_cache = {}
+        self._indirect_state = None
 
     def read_wiod16(self, year=2014, range_rows=(5,2469),
                     range_cols=(4,2468), col_iso3=2,
-                    col_sectors=1):
+                    col_sectors=1, cache=True):
         """Read multi-regional input-output tables of the 2016 release of the
         WIOD project: http://www.wiod.org/database/wiots16
 
@@ -117,6 +171,12 @@ class SupplyChain():
             column with countries names in ISO3 codes. Default is 2.
         col_sectors : int
             column with sector names. Default is 1.
+        cache : bool
+            If True, the parsed table is stored in binary files next to the
+            workbook on the first read and memory-mapped from there afterwards,
+            as long as the workbook's modification time and size are unchanged.
+            Default is True.
+
         References
         ----------
         [1] Timmer, M. P., Dietzenbacher, E., Los, B., Stehrer, R. and de Vries, G. J.
@@ -127,29 +187,103 @@ class SupplyChain():
 
         file_name = 'WIOT{}_Nov16_ROW.xlsb'.format(year)
         file_loc = WIOD_DIRECTORY / file_name
+        cache_name = '{}_{}-{}_{}-{}_{}_{}'.format(file_loc.stem, *range_rows, *range_cols,
+                                                   col_iso3, col_sectors)
+        cache_data = WIOD_DIRECTORY / (cache_name + '.npy')
+        cache_meta = WIOD_DIRECTORY / (cache_name + '_meta.npz')
+
+        meta = None
+        if cache and cache_data.is_file() and cache_meta.is_file():
+            with np.load(cache_meta) as cache_file:
+                meta = dict(cache_file)
+            # the cache is stale if the workbook was replaced or modified
+            if file_loc.is_file() and not np.array_equal(
+                    meta.get('source_signature'), _source_signature(file_loc)):
+                LOGGER.info('WIOD table %s changed, cache is updated.', file_loc)
+                meta = None
+        if meta is not None:
+            # copy-on-write memory map: the table is read from disk on access only
+            self.mriot_data = np.load(cache_data, mmap_mode='c')
+            self.sectors = meta['sectors']
+            self.mriot_reg_names = meta['mriot_reg_names']
+            self.total_prod = meta['total_prod']
+        else:
+            if not file_loc.is_file():
+                download_link = WIOD_FILE_LINK + file_name
+                u_fh.download_file(download_link, download_dir=WIOD_DIRECTORY)
+                LOGGER.info('Downloading WIOD table for year %s', year)
+            mriot = pd.read_excel(file_loc, engine='pyxlsb')
 
-        if not file_loc in WIOD_DIRECTORY.iterdir():
-            download_link = WIOD_FILE_LINK + file_name
-            u_fh.download_file(download_link, download_dir=WIOD_DIRECTORY)
-            LOGGER.info('Downloading WIOD table for year %s', year)
-        mriot = pd.read_excel(file_loc, engine='pyxlsb')
+            start_row, end_row = range_rows
+            start_col, end_col = range_cols
 
-        start_row, end_row = range_rows
-        start_col, end_col = range_cols
+            self.sectors = mriot.iloc[start_row:end_row, col_sectors].unique()
+            self.mriot_reg_names = mriot.iloc[start_row:end_row, col_iso3].unique()
+            self.mriot_data = mriot.iloc[start_row:end_row,
+                                         start_col:end_col].values
+            self.total_prod = mriot.iloc[start_row:end_row, -1].values
 
-        self.sectors = mriot.iloc[start_row:end_row, col_sectors].unique()
-        self.mriot_reg_names = mriot.iloc[start_row:end_row, col_iso3].unique()
-        self.mriot_data = mriot.iloc[start_row:end_row,
-                                     start_col:end_col].values
-        self.total_prod = mriot.iloc[start_row:end_row, -1].values
+            if cache:
+                self.mriot_data = self.mriot_data.astype(np.float64)
+                self.total_prod = self.total_prod.astype(np.float64)
+                self.sectors = self.sectors.astype(str)
+                self.mriot_reg_names = self.mriot_reg_names.astype(str)
+                _write_mriot_cache(cache_data, cache_meta, self.mriot_data,
+                                   sectors=self.sectors, mriot_reg_names=self.mriot_reg_names,
+                                   total_prod=self.total_prod,
+                                   source_signature=_source_signature(file_loc))
+
+        self._set_mriot(self.mriot_data, self.sectors, self.mriot_reg_names,
+                        self.total_prod, 'WIOD')
+
+    def read_mriot(self, reader, *args, **kwargs):
+        """Read a multi-regional input-output table with a custom reader, e.g. for
+        EXIOBASE or OECD-ICIO tables.
+
+        Parameters
+        ----------
+        reader : callable
+            Function called with args and kwargs, returning a dict with the keys
+            'mriot_data' (np.array or scipy.sparse matrix of shape
+            (n_regions*n_sectors, n_regions*n_sectors), ordered by region and
+            then sector), 'sectors', 'mriot_reg_names', 'total_prod' and optionally
+            'mriot_type'. Large tables should be returned as sparse matrices and
+            used with the sparse solvers of calc_indirect_impact.
+        args, kwargs :
+            Arguments passed to reader.
+        """
+        mriot = reader(*args, **kwargs)
+        self._set_mriot(mriot['mriot_data'], mriot['sectors'], mriot['mriot_reg_names'],
+                        mriot['total_prod'], mriot.get('mriot_type', ''))
+
+    def _set_mriot(self, mriot_data, sectors, mriot_reg_names, total_prod, mriot_type):
+        """Set the input-output table and derived attributes, reset cached matrices."""
+        n_sectors, n_regions = len(sectors), len(mriot_reg_names)
+        if mriot_data.shape != (n_sectors * n_regions,) * 2 or \
+                len(total_prod) != n_sectors * n_regions:
+            raise ValueError('Shape of the input-output table does not match the number '
+                             f'of regions ({n_regions}) and sectors ({n_sectors}).')
+        self.mriot_data = mriot_data
+        self.sectors = np.asarray(sectors)
+        self.mriot_reg_names = np.asarray(mriot_reg_names)
+        self.total_prod = np.asarray(total_prod)
         self.reg_pos = {
-            name: range(len(self.sectors)*i, len(self.sectors)*(i+1))
+            name: np.arange(n_sectors*i, n_sectors*(i+1))
             for i, name in enumerate(self.mriot_reg_names)
             }
-        self.mriot_type = 'WIOD'
+        self.mriot_type = mriot_type
+        self._reg_map = {}
+        self.reset_io_cache()
+
+    def reset_io_cache(self):
+        """Reset the cached coefficients and inverse matrices and the state of the
+        incremental indirect impact calculation. Needed after modifying mriot_data or
+        total_prod in place, which is not detected."""
+        self._io_cache = {}
+        self._indirect_state = None
 
     def calc_sector_direct_impact(self, hazard, exposure, imp_fun_set,
-                                  selected_subsec="service"):
+                                  selected_subsec="service", use_cache=True):
         """Calculate direct impacts.
 
         Parameters
@@ -167,6 +301,10 @@ class SupplyChain():
             sectors' aggregations for the WIOD data passing a string with possible
             values being "service", "manufacturing", "agriculture" or "mining".
             Default is "service".
+        use_cache : bool
+            If True, the impacts per year of regions whose exposure, hazard and
+            impact functions did not change since a previous call are taken from
+            a cache instead of being recalculated. Default is True.
 
         """
 
@@ -183,52 +321,118 @@ class SupplyChain():
             ]
         self.years = np.unique([date.year for date in dates])
 
-        unique_exp_regid = exposure.gdf.region_id.unique()
         self.direct_impact = np.zeros(shape=(len(self.years),
-                                             len(self.mriot_reg_names)*len(self.sectors)))
+                                             len(self.mriot_reg_names)*len(self.sectors)),
+                                      dtype=self.precision)
 
-        self.reg_dir_imp = []
-        for exp_regid in unique_exp_regid:
-            reg_exp = Exposures(exposure.gdf[exposure.gdf.region_id == exp_regid])
-            reg_exp.check()
+        # Exposure values are normalized per region, so that the impact of a region is
+        # its fraction of affected value
+        reg_codes, unique_exp_regid = pd.factorize(exposure.gdf.region_id)
+        exp_norm = exposure.copy()
+        exp_norm.gdf['value'] = (exposure.gdf['value'] /
+                                 exposure.gdf.groupby(reg_codes)['value'].transform('sum'))
+        exp_norm.check()
 
-            # Normalize exposure
-            total_reg_value = reg_exp.gdf['value'].sum()
-            reg_exp.gdf['value'] /= total_reg_value
+        # Impacts per year and region are cached per region, keyed by the fingerprints
+        # of the region's exposure, the hazard and the impact functions, so that only
+        # changed regions are recalculated
+        haz_key = _fingerprint_hazard(hazard, imp_fun_set)
+        reg_keys = _fingerprint_regions(exp_norm.gdf, reg_codes, unique_exp_regid.size)
+        reg_keys = [(haz_key, reg_key) for reg_key in reg_keys]
+        calc_reg = np.array([key not in self._dir_imp_cache for key in reg_keys], dtype=bool)
+        if not use_cache:
+            calc_reg[:] = True
 
-            # Calc impact for country
+        if calc_reg.any():
+            # One impact calculation for all changed regions, aggregated per year and
+            # region with sparse indicator matrices
+            # (years x events) @ (events x points) @ (points x regions)
+            calc_points = calc_reg[reg_codes]
+            if not calc_points.all():
+                exp_norm.gdf = exp_norm.gdf[calc_points]
             imp = Impact()
-            imp.calc(reg_exp, imp_fun_set, hazard)
-            imp_year_set = np.array(list(imp.calc_impact_year_set(imp).values()))
-
-            mriot_reg_name = self._map_exp_to_mriot(exp_regid, self.mriot_type)
-
-            self.reg_dir_imp.append(mriot_reg_name)
+            imp.calc(exp_norm, imp_fun_set, hazard, save_mat=True)
+            event_year_idx = np.searchsorted(self.years, [date.year for date in dates])
+            year_ind = sparse.csr_matrix(
+                (np.ones(event_year_idx.size),
+                 (event_year_idx, np.arange(event_year_idx.size))),
+                shape=(len(self.years), event_year_idx.size))
+            reg_ind = sparse.csr_matrix(
+                (np.ones(calc_points.sum()),
+                 (np.arange(calc_points.sum()), reg_codes[calc_points])),
+                shape=(calc_points.sum(), unique_exp_regid.size))
+            imp_year_calc = np.asarray((year_ind @ imp.imp_mat @ reg_ind).todense())
+            for reg_i in np.flatnonzero(calc_reg):
+                self._dir_imp_cache[reg_keys[reg_i]] = imp_year_calc[:, reg_i]
+        imp_year_reg = np.stack([self._dir_imp_cache[key] for key in reg_keys], axis=1)
 
-            subsec_reg_pos = np.array(selected_subsec) + self.reg_pos[mriot_reg_name][0]
-            subsec_reg_prod = self.mriot_data[subsec_reg_pos].sum(axis=1)
+        # Positions of the selected subsectors of each exposure region in the table
+        # (regions x subsectors) and the production they distribute the impact on
+        mriot_reg_idx = self._mriot_reg_index(unique_exp_regid)
+        self.reg_dir_imp = self.mriot_reg_names[mriot_reg_idx].tolist()
+        subsec_reg_pos = (mriot_reg_idx[:, np.newaxis] * len(self.sectors) +
+                          np.asarray(selected_subsec, dtype=int)[np.newaxis, :])
+        subsec_prod = self._mriot_sum(axis=1)[subsec_reg_pos]
+        direct_impact_reg = (imp_year_reg[:, :, np.newaxis] *
+                             subsec_prod[np.newaxis, :, :]).astype(self.precision)
 
-            imp_year_set = np.repeat(imp_year_set, len(selected_subsec)
-                                     ).reshape(len(self.years),
-                                               len(selected_subsec))
-            direct_impact_reg = np.multiply(imp_year_set, subsec_reg_prod)
-
-            # Sum needed below in case of many ROWs, which are aggregated into
-            # one country as per WIOD table.
-            self.direct_impact[:, subsec_reg_pos] += direct_impact_reg.astype(np.float32)
+        # Index-add needed in case of many ROWs, which are aggregated into
+        # one country as per WIOD table.
+        np.add.at(self.direct_impact, (slice(None), subsec_reg_pos.ravel()),
+                  direct_impact_reg.reshape(len(self.years), -1))
 
         # average impact across years
         self.direct_aai_agg = self.direct_impact.mean(axis=0)
 
-    def calc_indirect_impact(self, io_approach='ghosh'):
+    @_blas_limited
+    def calc_indirect_impact(self, io_approach='ghosh', risk_structure=True,
+                             risk_years=None, risk_file=None, solver='dense',
+                             tol=1e-8, max_iter=1000, incremental=True):
         """Calculate indirect impacts according to the specified input-output
         appraoch. This function needs to be run after calc_sector_direct_impact.
 
+        The indirect impacts are computed directly from the direct impacts with
+        one matrix product. The risk structure (sectors x sectors x years) is only
+        needed for detailed analysis and can be skipped, restricted to some years
+        or written to a memory-mapped file.
+
         Parameters
         ----------
         io_approach : str
             The adopted input-output modeling approach. Possible approaches
             are 'leontief', 'ghosh' and 'eeioa'. Default is 'gosh'.
+        risk_structure : bool
+            Whether to store the risk structure in io_data. If False,
+            io_data['risk_structure'] is None. Default is True.
+        risk_years : array, optional
+            Years for which the risk structure is stored. Default: all years.
+        risk_file : str or Path, optional
+            If given, the risk structure is written year by year to this .npy
+            file, in the layout (years x sectors x sectors) with one contiguous
+            block per year, and stored as a memory-mapped, transposed view
+            (sectors x sectors x years). Default: kept in memory.
+        solver : str
+            How the inverse is applied to the direct impacts. 'dense' inverts the
+            dense coefficient matrix (cached). For large tables, 'spsolve' uses a
+            sparse LU factorization (cached) and 'series' the truncated power
+            series sum_k A^k of the sparse coefficients, both without computing
+            the inverse; the risk structure is not available with these solvers.
+            Default is 'dense'.
+        tol : float
+            Relative tolerance at which the power series is truncated (solver
+            'series'). Default is 1e-8.
+        max_iter : int
+            Maximal number of terms of the power series (solver 'series').
+            Default is 1000.
+        incremental : bool
+            If True and only some sectors' direct impacts changed since the previous
+            call with the same io_approach (solver 'dense'), only the contribution of
+            the changed sectors is recomputed, as the indirect impacts are linear in
+            the weights of the IO approach. Likewise, only the rows of the changed
+            sectors of the risk structure are recomputed if the same risk_years and
+            risk_file are requested. The updates are accumulated in float64 and all
+            sectors are recomputed after INCREMENTAL_MAX_UPDATES successive updates.
+            Default is True.
 
         References
         ----------
@@ -240,58 +444,372 @@ class SupplyChain():
         Analysis, Resources, 2, 489-503; doi:10.3390/resources2040489, 2013.
         """
 
-        io_switch = {'leontief': self._leontief_calc, 'ghosh': self._ghosh_calc,
-                     'eeioa': self._eeioa_calc}
+        self._check_io_args(io_approach, solver)
+        weights = self._weights(self.direct_impact, io_approach)
 
-        # Compute coefficients based on selected IO approach
-        coefficients = np.zeros_like(self.mriot_data, dtype=np.float32)
-        if io_approach in ['leontief', 'eeioa']:
-            for col_i, col in enumerate(self.mriot_data.T):
-                if self.total_prod[col_i] > 0:
-                    coefficients[:, col_i] = np.divide(col, self.total_prod[col_i])
-                else:
-                    coefficients[:, col_i] = 0
+        if solver == 'dense':
+            # Coefficients and inverse based on selected IO approach (cached)
+            coefficients, inverse = self._io_matrices(io_approach)
+            # Calculate risk structure based on selected IO approach: the risk structure
+            # of year y is the outer product weights[y][:, None] * propagation, hence the
+            # total indirect risk per sector/country-combination is weights @ propagation
+            propagation = self._propagation(io_approach, inverse)
+            indirect, changed = self._propagate_dense(weights, io_approach, propagation,
+                                                      incremental)
+            # copy, the kept state must not change with the user's indirect_impact
+            self.indirect_impact = indirect.astype(self.precision)
+            if risk_structure:
+                risk_structure = self._risk_structure(weights, propagation,
+                                                      risk_years, risk_file, changed)
+            else:
+                risk_structure = None
+                self._indirect_state['risk'] = None
         else:
-            for row_i, row in enumerate(self.mriot_data):
-                if self.total_prod[row_i] > 0:
-                    coefficients[row_i, :] = np.divide(row, self.total_prod[row_i])
-                else:
-                    coefficients[row_i, :] = 0
-
-        inverse = np.linalg.inv(np.identity(len(self.mriot_data)) - coefficients)
-        inverse = inverse.astype(np.float32)
-
-        # Calculate indirect impacts
-        self.indirect_impact = np.zeros_like(self.direct_impact, dtype=np.float32)
-        risk_structure = np.zeros(np.shape(self.mriot_data) + (len(self.years),),
-                                  dtype=np.float32)
-
-        # Loop over years indices:
-        for year_i, _ in enumerate(tqdm(self.years)):
-            direct_impact_yearly = self.direct_impact[year_i, :]
-
-            direct_intensity = np.zeros_like(direct_impact_yearly)
-            for idx, (impact, production) in enumerate(zip(direct_impact_yearly,
-                                                           self.total_prod)):
-                if production > 0:
-                    direct_intensity[idx] = impact/production
-                else:
-                    direct_intensity[idx] = 0
-
-            # Calculate risk structure based on selected IO approach
-            risk_structure = io_switch[io_approach](direct_intensity, inverse,
-                                                    risk_structure, year_i)
-            # Total indirect risk per sector/country-combination:
-            self.indirect_impact[year_i, :] = np.nansum(
-                risk_structure[:, :, year_i], axis=0)
+            coefficients, inverse = self._sparse_io_matrices(io_approach, solver), None
+            self.indirect_impact = self._sparse_propagate(
+                weights, io_approach, solver, tol, max_iter).astype(self.precision)
+            if risk_structure:
+                LOGGER.warning('The risk structure is not computed with solver %s.', solver)
+            risk_structure = None
 
         self.indirect_aai_agg = self.indirect_impact.mean(axis=0)
 
         self.io_data = {}
+        if solver != 'dense':
+            coefficients = coefficients['coefficients']
         self.io_data.update({'coefficients': coefficients, 'inverse': inverse,
                              'risk_structure' : risk_structure,
                              'io_approach' : io_approach})
 
+    def calc_dynamic_impact(self, direct_impact=None, n_days=365, recovery_time=365,
+                            inventory_days=90, inventory_time=60, psi=0.8,
+                            overprod_max=1.25, overprod_time=365, batch_size=None,
+                            step_hook=None):
+        """Calculate indirect impacts with a dynamic inventory and recovery model
+        in the spirit of ARIO [1]: each event destroys production capacity in
+        proportion to the direct impact, which recovers exponentially; every day,
+        firms order inputs to restore their inventories and serve demand, and
+        production is constrained by capacity, inputs and demand. The indirect
+        impact of an event is the production lost over n_days.
+
+        The daily steps are compiled with numba and run for a batch of events at
+        once, events in parallel. Inputs of the same sector from different regions
+        are aggregated into one inventory per input sector and buyer, stored only for
+        the pairs of input sector and buyer with a supplier.
+
+        Parameters
+        ----------
+        direct_impact : np.array, optional
+            Direct impacts (events x sectors). Default: self.direct_impact, one event
+            per year.
+        n_days : int
+            Number of simulated days after the events. Default is 365.
+        recovery_time : float
+            Characteristic time of the exponential recovery of production capacity,
+            in days. Default is 365.
+        inventory_days : float
+            Targeted inventories, in days of inputs. Default is 90.
+        inventory_time : float
+            Characteristic time of inventory restoration, in days. Default is 60.
+        psi : float
+            Fraction of the targeted inventory below which production is reduced.
+            Default is 0.8.
+        overprod_max : float
+            Maximal overproduction capacity relative to the production before the
+            events. Default is 1.25.
+        overprod_time : float
+            Characteristic time of overproduction adaptation, in days.
+            Default is 365.
+        batch_size : int, optional
+            Number of events simulated at once, to bound memory. Default: all.
+        step_hook : callable, optional
+            Called after each day as step_hook(step, info) with info a dict with the
+            keys 'batch' (index of the first event of the batch), 'time' (seconds of
+            the step) and 'state_nbytes' (bytes of the state arrays of the batch,
+            the same for all steps).
+
+        Returns
+        -------
+        np.array
+            Production losses (events x sectors). If direct_impact is None, they are
+            also stored as indirect_impact and io_data['io_approach'] is 'ario'.
+
+        References
+        ----------
+        [1] Hallegatte, S., An adaptive regional input-output model and its
+        application to the assessment of the economic cost of Katrina, Risk Analysis
+        28, 779-799, doi:10.1111/j.1539-6924.2008.01046.x, 2008.
+        """
+        store = direct_impact is None
+        direct_impact = np.atleast_2d(self.direct_impact if store else direct_impact)
+        n_sectors, n_reg_sec = len(self.sectors), len(self.total_prod)
+        if direct_impact.shape[1] != n_reg_sec:
+            raise ValueError(f'Direct impact has {direct_impact.shape[1]} columns, '
+                             f'the input-output table {n_reg_sec} sectors.')
+
+        # Daily production and final demand before the events, technical coefficients
+        total_prod = np.asarray(self.total_prod, dtype=np.float64)
+        prod_0 = total_prod / 365
+        final_demand_0 = np.maximum(prod_0 - self._mriot_sum(axis=1) / 365, 0)
+        coefficients = self._sparse_io_matrices('leontief', 'series')['coefficients']
+        # Coefficients aggregated per input sector, as CSR matrix of the pairs of buyer
+        # (row) and input sector (column) with a supplier, and the share of each
+        # supplier (CSR entry of the coefficients) in the coefficient of its pair
+        sec_of_row = np.tile(np.arange(n_sectors), len(self.mriot_reg_names))
+        agg = sparse.csr_matrix((np.ones(n_reg_sec), (sec_of_row, np.arange(n_reg_sec))),
+                                shape=(n_sectors, n_reg_sec))
+        pairs = sparse.csr_matrix((agg @ coefficients).T)
+        pairs.eliminate_zeros()
+        pairs.sort_indices()
+        supply = sparse.csr_matrix(coefficients)
+        supply.eliminate_zeros()
+        supply.sort_indices()
+        pair_rows = np.repeat(np.arange(n_reg_sec), np.diff(pairs.indptr))
+        supply_rows = np.repeat(np.arange(n_reg_sec), np.diff(supply.indptr))
+        pair_of_entry = np.searchsorted(
+            pair_rows * n_sectors + pairs.indices,
+            supply.indices * n_sectors + sec_of_row[supply_rows])
+        shares = np.divide(supply.data, pairs.data[pair_of_entry],
+                           out=np.zeros(supply.data.shape),
+                           where=pairs.data[pair_of_entry] > 0)
+        params = np.array([recovery_time, inventory_days, inventory_time, psi,
+                           overprod_max, overprod_time], dtype=np.float64)
+
+        damage = np.clip(np.divide(direct_impact, total_prod,
+                                   out=np.zeros(direct_impact.shape),
+                                   where=total_prod > 0), 0, 1)
+        n_events = damage.shape[0]
+        batch_size = n_events if not batch_size else batch_size
+        prod_loss = np.zeros(damage.shape, dtype=self.precision)
+        for start in range(0, n_events, batch_size):
+            state = _ario_init(damage[start:start + batch_size], prod_0, pairs,
+                               inventory_days)
+            state_nbytes = sum(arr.nbytes for arr in state)
+            for step in range(n_days):
+                time_start = time.perf_counter()
+                _ario_step(*state, prod_0, final_demand_0, pairs.indptr, pairs.data,
+                           supply.indptr, pair_of_entry, shares, params)
+                if step_hook is not None:
+                    step_hook(step, {'batch': start,
+                                     'time': time.perf_counter() - time_start,
+                                     'state_nbytes': state_nbytes})
+            prod_loss[start:start + batch_size] = state[-1]
+
+        if store:
+            self.indirect_impact = prod_loss
+            self.indirect_aai_agg = self.indirect_impact.mean(axis=0)
+            self.io_data = {'coefficients': coefficients, 'inverse': None,
+                            'risk_structure': None, 'io_approach': 'ario'}
+        return prod_loss
+
+    @_blas_limited
+    def calc_impact_batch(self, direct_impacts, io_approach='ghosh', solver='dense',
+                          chunk_size=None, tol=1e-8, max_iter=1000):
+        """Calculate indirect and total impacts of several direct impact matrices,
+        e.g. of different hazards or stochastic year sets, with the same input-output
+        table. The coefficients and the inverse (or its factorization) are computed
+        once and kept for further calls until a new table is read; all matrices of a
+        batch are propagated together with one matrix product per chunk of rows.
+
+        The attributes of the SupplyChain (direct_impact, indirect_impact, ...) are
+        not modified.
+
+        Parameters
+        ----------
+        direct_impacts : dict or list
+            Direct impact arrays (years x sectors), e.g. copies of direct_impact after
+            calc_sector_direct_impact with different hazards. The number of years may
+            differ between the arrays.
+        io_approach : str
+            The adopted input-output modeling approach. Possible approaches
+            are 'leontief', 'ghosh' and 'eeioa'. Default is 'ghosh'.
+        solver : str
+            'dense', 'spsolve' or 'series', see calc_indirect_impact. Default is 'dense'.
+        chunk_size : int, optional
+            Maximal number of rows (years) propagated at once, to bound memory.
+            Default: all rows of the batch at once.
+        tol : float
+            Relative tolerance of the power series (solver 'series'). Default is 1e-8.
+        max_iter : int
+            Maximal number of terms of the power series (solver 'series').
+            Default is 1000.
+
+        Returns
+        -------
+        dict or list
+            Same keys or order as direct_impacts, each element a dict with the
+            arrays 'indirect_impact' and 'total_impact' (years x sectors) of type
+            precision.
+        """
+        self._check_io_args(io_approach, solver)
+        keys = list(direct_impacts) if isinstance(direct_impacts, dict) \
+            else list(range(len(direct_impacts)))
+        n_sectors = len(self.total_prod)
+        direct_list = [np.atleast_2d(direct_impacts[key]) for key in keys]
+        for key, direct in zip(keys, direct_list):
+            if direct.shape[1] != n_sectors:
+                raise ValueError(f'Direct impact {key} has {direct.shape[1]} columns, '
+                                 f'the input-output table {n_sectors} sectors.')
+        direct_all = np.concatenate(direct_list, axis=0)
+        indirect_all = np.empty(direct_all.shape, dtype=self.precision)
+
+        if solver == 'dense':
+            propagation = self._propagation(io_approach, self._io_matrices(io_approach)[1])
+        n_rows = direct_all.shape[0]
+        chunk_size = n_rows if not chunk_size else chunk_size
+        for start in range(0, n_rows, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            weights = self._weights(direct_all[chunk], io_approach)
+            if solver == 'dense':
+                indirect_all[chunk] = weights @ propagation
+            else:
+                indirect_all[chunk] = self._sparse_propagate(weights, io_approach, solver,
+                                                             tol, max_iter)
+
+        result = []
+        offsets = np.cumsum([0] + [direct.shape[0] for direct in direct_list])
+        for direct, start, end in zip(direct_list, offsets[:-1], offsets[1:]):
+            indirect = indirect_all[start:end]
+            result.append({'indirect_impact': indirect,
+                           'total_impact': (indirect + direct).astype(self.precision)})
+        if isinstance(direct_impacts, dict):
+            return dict(zip(keys, result))
+        return result
+
+    @staticmethod
+    def _check_io_args(io_approach, solver):
+        """Raise ValueError for unknown input-output approaches and solvers."""
+        if io_approach not in ('leontief', 'ghosh', 'eeioa'):
+            raise ValueError(f'Unknown io_approach {io_approach}. '
+                             'Possible approaches are leontief, ghosh and eeioa.')
+        if solver not in ('dense', 'spsolve', 'series'):
+            raise ValueError(f'Unknown solver {solver}. '
+                             'Possible solvers are dense, spsolve and series.')
+
+    def _weights(self, direct_impact, io_approach):
+        """Weights of the risk structure of the IO approach for direct impacts
+        (years x sectors)."""
+        io_switch = {'leontief': self._leontief_calc, 'ghosh': self._ghosh_calc,
+                     'eeioa': self._eeioa_calc}
+        total_prod = np.asarray(self.total_prod, dtype=self.precision)
+        direct_intensity = np.divide(np.asarray(direct_impact, dtype=self.precision),
+                                     total_prod,
+                                     out=np.zeros(np.shape(direct_impact), self.precision),
+                                     where=total_prod > 0)
+        return io_switch[io_approach](direct_intensity)
+
+    def _propagate_dense(self, weights, io_approach, propagation, incremental=True):
+        """Indirect impacts weights @ propagation. If incremental, the products of the
+        previous call are updated with the changed columns of the weights only. The
+        products are kept in float64 and recomputed after INCREMENTAL_MAX_UPDATES
+        successive updates.
+
+        Returns
+        -------
+        indirect : np.array
+            indirect impacts (years x sectors)
+        changed : np.array or None
+            indices of the changed columns, None if all were recomputed
+        """
+        state = self._indirect_state
+        if incremental and state is not None and state['io_approach'] == io_approach \
+                and state['weights'].shape == weights.shape \
+                and state['updates'] < INCREMENTAL_MAX_UPDATES:
+            changed = np.flatnonzero((weights != state['weights']).any(axis=0))
+            LOGGER.debug('%s of %s sectors changed.', changed.size, weights.shape[1])
+        else:
+            changed = None
+        if changed is None or 2 * changed.size > weights.shape[1]:
+            indirect = (weights @ propagation).astype(np.float64)
+            changed, updates = None, 0
+        else:
+            indirect = state['indirect'].copy()
+            updates = state['updates'] + 1
+            if changed.size:
+                indirect += ((weights[:, changed].astype(np.float64) -
+                              state['weights'][:, changed]) @
+                             propagation[changed].astype(np.float64))
+        # the risk structure of the previous call can only be updated if it exists
+        risk = state['risk'] if changed is not None else None
+        self._indirect_state = {'io_approach': io_approach, 'weights': weights,
+                                'indirect': indirect, 'changed': changed, 'risk': risk,
+                                'updates': updates}
+        return indirect, changed
+
+    def _risk_structure(self, weights, propagation, risk_years=None, risk_file=None,
+                        changed=None):
+        """Risk structure (sectors x sectors x years) of the selected years, in memory
+        or as transposed view of a memory-mapped array (years x sectors x sectors)
+        written year by year to risk_file. Read-only view.
+
+        If changed is given and the risk structure of the previous call covers the
+        same years and file, it is copied and only the rows of the changed sectors are
+        recomputed. Earlier results are left unchanged, risk_file is replaced by a new
+        file."""
+        if risk_years is None:
+            year_idx = np.arange(len(self.years))
+        else:
+            year_idx = np.flatnonzero(np.isin(self.years, risk_years))
+        risk_key = (tuple(year_idx), None if risk_file is None else str(risk_file),
+                    np.dtype(self.precision).str)
+        prev = self._indirect_state['risk'] if self._indirect_state else None
+        # the risk structure is stored year-major (years x sectors x sectors)
+        shape = (year_idx.size,) + propagation.shape
+        if risk_file is None:
+            risk_structure = np.empty(shape, dtype=self.precision)
+        else:
+            tmp_file = f'{risk_file}.{os.getpid()}.tmp.npy'
+            risk_structure = np.lib.format.open_memmap(tmp_file, mode='w+',
+                                                       dtype=self.precision, shape=shape)
+        if changed is not None and prev is not None and prev[0] == risk_key:
+            risk_structure[:] = prev[1]
+            rows = changed
+        else:
+            rows = slice(None)
+        for pos, year_i in enumerate(year_idx):
+            risk_structure[pos, rows] = (propagation[rows] *
+                                         weights[year_i, rows][:, np.newaxis])
+        if risk_file is not None:
+            risk_structure.flush()
+            del risk_structure
+            os.replace(tmp_file, risk_file)
+            risk_structure = np.load(str(risk_file), mmap_mode='r')
+        if self._indirect_state is not None:
+            self._indirect_state['risk'] = (risk_key, risk_structure)
+        risk_view = risk_structure.transpose(1, 2, 0)
+        risk_view.flags.writeable = False
+        return risk_view
+
+    def _check_io_cache(self):
+        """Reset the cached matrices and the state of the incremental calculation if
+        mriot_data or total_prod were replaced since they were cached. The objects are
+        compared by identity only, in-place modifications need reset_io_cache."""
+        table = self._io_cache.get('table', ())
+        if len(table) != 2 or table[0] is not self.mriot_data \
+                or table[1] is not self.total_prod:
+            self.reset_io_cache()
+            self._io_cache['table'] = (self.mriot_data, self.total_prod)
+
+    def _io_matrices(self, io_approach):
+        """Technical (Leontief, EEIOA) or allocation (Ghosh) coefficients and the
+        corresponding inverse. Both are cached per kind of coefficients until the
+        input-output table or the precision changes."""
+        kind = ('allocation' if io_approach == 'ghosh' else 'technical', self.precision.str)
+        self._check_io_cache()
+        if kind not in self._io_cache:
+            mriot_data = (self.mriot_data.toarray() if sparse.issparse(self.mriot_data)
+                          else np.asarray(self.mriot_data, dtype=np.float64))
+            total_prod = np.asarray(self.total_prod, dtype=np.float64)
+            # technical coefficients divide the columns, allocation coefficients the rows
+            # by the total production; sectors without production have coefficients 0
+            prod = (total_prod[np.newaxis, :] if kind[0] == 'technical'
+                    else total_prod[:, np.newaxis])
+            coefficients = np.divide(mriot_data, prod, out=np.zeros_like(mriot_data),
+                                     where=prod > 0).astype(self.precision)
+            inverse = np.linalg.inv(np.identity(mriot_data.shape[0]) - coefficients)
+            self._io_cache[kind] = (coefficients, inverse.astype(self.precision))
+        return self._io_cache[kind]
+
     def calc_total_impact(self):
         """Calculate total impacts summing direct and indirect impacts."""
         self.total_impact = self.indirect_impact + self.direct_impact
@@ -302,39 +820,263 @@ class SupplyChain():
         Map regions names in exposure into Input-output regions names.
         exp_regid must be according to ISO 3166 numeric country codes.
         """
+        return self.mriot_reg_names[self._mriot_reg_index([exp_regid], mriot_type)[0]]
+
+    def _mriot_reg_index(self, exp_regids, mriot_type=None):
+        """Indices of the exposure regions in mriot_reg_names (integer array).
 
+        For WIOD tables, exp_regids are ISO 3166 numeric country codes and countries
+        not in the table are mapped to 'ROW'; otherwise they are region names of the
+        table. The mapping from codes to indices is built once per table and type
+        (default: mriot_type).
+        """
+        if mriot_type is None:
+            mriot_type = self.mriot_type
+        key = (mriot_type, tuple(self.mriot_reg_names))
+        if key not in self._reg_map:
+            self._reg_map[key] = self._build_reg_map(mriot_type)
+        reg_map, default = self._reg_map[key]
         if mriot_type == 'WIOD':
-            mriot_reg_name = u_coord.country_to_iso(exp_regid, "alpha3")
-            idx_country = np.where(self.mriot_reg_names == mriot_reg_name)[0]
+            exp_regids = [int(regid) for regid in exp_regids]
+        idx = np.array([reg_map.get(regid, default) for regid in exp_regids], dtype=int)
+        if np.any(idx < 0):
+            missing = [regid for regid, i in zip(exp_regids, idx) if i < 0]
+            raise ValueError(f'Regions {missing} not found in the input-output table.')
+        return idx
 
-            if not idx_country.size > 0.:
-                mriot_reg_name = 'ROW'
+    def _build_reg_map(self, mriot_type):
+        """Mapping from exposure region ids to indices of mriot_reg_names for a type of
+        input-output table, and the index of regions not in the mapping (ROW for WIOD,
+        -1 otherwise)."""
+        reg_names = list(self.mriot_reg_names)
+        if mriot_type != 'WIOD':
+            return {name: i for i, name in enumerate(reg_names)}, -1
+        reg_map = {}
+        for i, name in enumerate(reg_names):
+            if name == 'ROW':
+                continue
+            try:
+                reg_map[int(u_coord.country_to_iso(name, "numeric"))] = i
+            except LookupError:
+                LOGGER.warning('Region %s of the input-output table is no ISO 3166 country.',
+                               name)
+        return reg_map, reg_names.index('ROW') if 'ROW' in reg_names else -1
 
-        elif mriot_type == '':
-            mriot_reg_name = exp_regid
+    def _leontief_calc(self, direct_intensity):
+        """Weights of the risk structure based on the Leontief approach."""
+        demand = (np.asarray(self.total_prod, dtype=np.float64) -
+                  self._mriot_sum(axis=1)).astype(self.precision)
+        degr_demand = direct_intensity*demand
+        return degr_demand
 
-        return mriot_reg_name
+    def _ghosh_calc(self, direct_intensity):
+        """Weights of the risk structure based on the Ghosh approach."""
+        value_added = (np.asarray(self.total_prod, dtype=np.float64) -
+                       self._mriot_sum(axis=0)).astype(self.precision)
+        degr_value_added = np.maximum(direct_intensity*value_added, 0)
+        return degr_value_added
 
-    def _leontief_calc(self, direct_intensity, inverse, risk_structure, year_i):
-        """Calculate the risk_structure based on the Leontief approach."""
-        demand = self.total_prod - np.nansum(self.mriot_data, axis=1)
-        degr_demand = direct_intensity*demand
-        for idx, row in enumerate(inverse):
-            risk_structure[:, idx, year_i] = row * degr_demand
-        return risk_structure
-
-    def _ghosh_calc(self, direct_intensity, inverse, risk_structure, year_i):
-        """Calculate the risk_structure based on the Ghosh approach."""
-        value_added = self.total_prod - np.nansum(self.mriot_data, axis=0)
-        degr_value_added = np.maximum(direct_intensity*value_added,\
-                                      np.zeros_like(value_added))
-        for idx, col in enumerate(inverse.T):
-           # Here, we iterate across columns of inverse (hence transpose used).
-            risk_structure[:, idx, year_i] = degr_value_added * col
-        return risk_structure
-
-    def _eeioa_calc(self, direct_intensity, inverse, risk_structure, year_i):
-        """Calculate the risk_structure based on the EEIOA approach."""
-        for idx, col in enumerate(inverse.T):
-            risk_structure[:, idx, year_i] = (direct_intensity * col) * self.total_prod[idx]
-        return risk_structure
+    def _eeioa_calc(self, direct_intensity):
+        """Weights of the risk structure based on the EEIOA approach."""
+        return direct_intensity
+
+    def _propagation(self, io_approach, inverse):
+        """Matrix propagating the weights of the IO approach to the indirect impacts:
+        transposed Leontief inverse (Leontief), Ghosh inverse (Ghosh) or Leontief
+        inverse scaled by total production (EEIOA)."""
+        if io_approach == 'leontief':
+            return inverse.T
+        if io_approach == 'eeioa':
+            total_prod = np.asarray(self.total_prod, dtype=self.precision)
+            return inverse * total_prod[np.newaxis, :]
+        return inverse
+
+    def _mriot_sum(self, axis):
+        """Sum of the input-output table along an axis, ignoring NaN."""
+        if sparse.issparse(self.mriot_data):
+            return np.asarray(self.mriot_data.sum(axis=axis), dtype=np.float64).ravel()
+        return np.asarray(np.nansum(self.mriot_data, axis=axis), dtype=np.float64)
+
+    def _sparse_io_matrices(self, io_approach, solver):
+        """Sparse coefficients (CSR), the matrix K of which the indirect impacts are
+        the power series sum_k K^k applied to the weights, and for solver 'spsolve' the
+        LU factorization of I - K. Cached per IO approach and solver until the
+        input-output table changes."""
+        key = ('sparse', io_approach, solver)
+        self._check_io_cache()
+        if key not in self._io_cache:
+            if sparse.issparse(self.mriot_data):
+                mriot_data = sparse.csr_matrix(self.mriot_data, dtype=np.float64)
+            else:
+                mriot_data = sparse.csr_matrix(np.asarray(self.mriot_data, dtype=np.float64))
+            mriot_data.data = np.nan_to_num(mriot_data.data)
+            total_prod = np.asarray(self.total_prod, dtype=np.float64)
+            inv_prod = sparse.diags(np.divide(1, total_prod, out=np.zeros_like(total_prod),
+                                              where=total_prod > 0))
+            if io_approach != 'ghosh':
+                coefficients = (mriot_data @ inv_prod).tocsr()
+            else:
+                coefficients = (inv_prod @ mriot_data).tocsr()
+            coefficients.eliminate_zeros()
+            # Leontief: x = (I - A)^-1 w, Ghosh and EEIOA: x = (I - B)^-T w
+            kernel = coefficients if io_approach == 'leontief' else coefficients.T.tocsr()
+            io_sparse = {'coefficients': coefficients, 'kernel': kernel}
+            if solver == 'spsolve':
+                io_sparse['lu'] = splu(
+                    (sparse.identity(kernel.shape[0], format='csc') - kernel).tocsc())
+            self._io_cache[key] = io_sparse
+        return self._io_cache[key]
+
+    def _sparse_propagate(self, weights, io_approach, solver, tol=1e-8, max_iter=1000):
+        """Propagate the weights (years x sectors) of the IO approach to the indirect
+        impacts with a sparse LU solve or a truncated power series."""
+        io_sparse = self._sparse_io_matrices(io_approach, solver)
+        rhs = np.asarray(weights, dtype=np.float64).T
+        if solver == 'spsolve':
+            result = io_sparse['lu'].solve(rhs)
+        else:
+            kernel = io_sparse['kernel']
+            result = rhs.copy()
+            term = rhs
+            for _ in range(max_iter):
+                term = kernel @ term
+                result += term
+                if np.abs(term).max(initial=0) <= tol * np.abs(result).max(initial=0):
+                    break
+            else:
+                LOGGER.warning('Power series did not converge to tolerance %s in %s terms.',
+                               tol, max_iter)
+        result = result.T
+        if io_approach == 'eeioa':
+            result = result * np.asarray(self.total_prod, dtype=np.float64)
+        return result
+
+def _ario_init(damage, prod_0, pairs, inventory_days):
+    """Initial state of the dynamic model for a batch of events: damage fractions,
+    overproduction, inventories at their target, demand and production losses."""
+    n_events = damage.shape[0]
+    target = inventory_days * pairs.data * np.repeat(prod_0, np.diff(pairs.indptr))
+    return (damage.copy(), np.ones(damage.shape),
+            np.repeat(target[np.newaxis], n_events, axis=0),
+            np.repeat(prod_0[np.newaxis], n_events, axis=0), np.zeros(damage.shape))
+
+@numba.njit(parallel=True)
+def _ario_step(damage, overprod, inventory, demand, prod_loss, prod_0, final_demand_0,
+               pair_ptr, pair_coef, supply_ptr, pair_of_entry, shares, params):
+    """One day of the dynamic model for all events of a batch, updating the state
+    (damage, overprod, inventory, demand, prod_loss) in place.
+
+    Parameters
+    ----------
+    damage, overprod, demand, prod_loss : np.array
+        Damage fraction of production capacity, overproduction factor, demand of
+        the previous day and cumulated production losses (events x sectors).
+    inventory : np.array
+        Inventories per pair of buyer and input sector (events x pairs).
+    prod_0, final_demand_0 : np.array
+        Daily production and final demand before the events.
+    pair_ptr, pair_coef : np.array
+        CSR row pointers (per buyer) and technical coefficients aggregated per input
+        sector of the pairs.
+    supply_ptr, pair_of_entry, shares : np.array
+        CSR row pointers (per supplier) of the coefficients, pair of each entry and
+        share of the supplier in the coefficient of the pair.
+    params : np.array
+        recovery_time, inventory_days, inventory_time, psi, overprod_max and
+        overprod_time.
+    """
+    recovery_time, inventory_days, inventory_time, psi, overprod_max, overprod_time = \
+        params[0], params[1], params[2], params[3], params[4], params[5]
+    n_reg_sec = prod_0.shape[0]
+    for i_ev in numba.prange(damage.shape[0]):
+        # production limited by capacity and by inputs in stock
+        capacity = prod_0 * (1 - damage[i_ev]) * overprod[i_ev]
+        input_limit = capacity.copy()
+        orders = np.zeros(pair_coef.shape[0])
+        for j in range(n_reg_sec):
+            for pair in range(pair_ptr[j], pair_ptr[j + 1]):
+                target = inventory_days * pair_coef[pair] * prod_0[j]
+                stock = inventory[i_ev, pair]
+                if stock < psi * target:
+                    input_limit[j] = min(input_limit[j],
+                                         prod_0[j] * max(stock, 0.) / (psi * target))
+                orders[pair] = max(pair_coef[pair] * demand[i_ev, j] +
+                                   (target - stock) / inventory_time, 0.)
+        # demand per supplier: final demand and orders of all buyers
+        total_demand = final_demand_0.copy()
+        for i in range(n_reg_sec):
+            for k in range(supply_ptr[i], supply_ptr[i + 1]):
+                total_demand[i] += shares[k] * orders[pair_of_entry[k]]
+        production = np.minimum(np.minimum(total_demand, capacity), input_limit)
+        # rationing of all clients in proportion to their orders
+        delivered = np.ones(n_reg_sec)
+        for i in range(n_reg_sec):
+            if total_demand[i] > 0:
+                delivered[i] = production[i] / total_demand[i]
+        for j in range(n_reg_sec):
+            for pair in range(pair_ptr[j], pair_ptr[j + 1]):
+                inventory[i_ev, pair] -= pair_coef[pair] * production[j]
+        for i in range(n_reg_sec):
+            for k in range(supply_ptr[i], supply_ptr[i + 1]):
+                inventory[i_ev, pair_of_entry[k]] += \
+                    shares[k] * orders[pair_of_entry[k]] * delivered[i]
+        # overproduction adapts to unmet demand, capacity recovers exponentially
+        for i in range(n_reg_sec):
+            if total_demand[i] > capacity[i]:
+                overprod[i_ev, i] += (overprod_max - overprod[i_ev, i]) / overprod_time
+            else:
+                overprod[i_ev, i] += (1 - overprod[i_ev, i]) / overprod_time
+            prod_loss[i_ev, i] += max(prod_0[i] - production[i], 0.)
+            demand[i_ev, i] = total_demand[i]
+            damage[i_ev, i] *= 1 - 1 / recovery_time
+
+def _update_hash(sha, *arrays):
+    """Update a hash object with the shape, type and data of arrays."""
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        sha.update(str((arr.shape, arr.dtype.str)).encode())
+        sha.update(arr.tobytes())
+
+def _fingerprint_hazard(hazard, imp_fun_set):
+    """Fingerprint of the hazard data and the impact functions."""
+    sha = hashlib.sha1()
+    for mat in (hazard.intensity, hazard.fraction):
+        mat = sparse.csr_matrix(mat)
+        _update_hash(sha, mat.data, mat.indices, mat.indptr)
+    _update_hash(sha, hazard.frequency, hazard.date,
+                 hazard.centroids.lat, hazard.centroids.lon)
+    for haz_type, funcs in sorted(imp_fun_set.get_func().items()):
+        for fun_id, fun in sorted(funcs.items()):
+            sha.update(f'{haz_type}_{fun_id}'.encode())
+            _update_hash(sha, fun.intensity, fun.mdd, fun.paa)
+    return sha.hexdigest()
+
+def _fingerprint_regions(gdf, reg_codes, n_regions):
+    """Fingerprints of the exposure data (all columns but the geometry) of each
+    region, from the hashes of its rows."""
+    cols = [col for col in gdf.columns if col != 'geometry']
+    row_hash = pd.util.hash_pandas_object(gdf[cols], index=False).values
+    order = np.argsort(reg_codes, kind='stable')
+    splits = np.cumsum(np.bincount(reg_codes, minlength=n_regions))[:-1]
+    fingerprints = []
+    for reg_hash in np.split(row_hash[order], splits):
+        sha = hashlib.sha1(str(cols).encode())
+        _update_hash(sha, reg_hash)
+        fingerprints.append(sha.hexdigest())
+    return fingerprints
+
+def _source_signature(file_path):
+    """Modification time and size of a file, used to detect outdated caches."""
+    stat = os.stat(file_path)
+    return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+def _write_mriot_cache(data_file, meta_file, mriot_data, **meta):
+    """Write a parsed input-output table to binary files: the data matrix as .npy
+    (to be memory-mapped) and the remaining arrays as .npz. Temporary files are unique
+    per process, parallel processes may write the same cache."""
+    tmp_data = data_file.with_name(f'{data_file.stem}.{os.getpid()}.tmp.npy')
+    tmp_meta = meta_file.with_name(f'{meta_file.stem}.{os.getpid()}.tmp.npz')
+    np.save(tmp_data, mriot_data)
+    np.savez(tmp_meta, **meta)
+    os.replace(tmp_data, data_file)
+    os.replace(tmp_meta, meta_file)
@@ -19,15 +19,20 @@ with CLIMADA. If not, see <https://www.gnu.org/licenses/>.
 Test Supplychain class.
 """
 
+import os
 from pathlib import Path
+import tempfile
 import unittest
 import numpy as np
+from scipy import sparse
 
 from climada import CONFIG
+from climada.engine import Impact
 from climada.entity.exposures.base import Exposures
 from climada.entity import ImpactFuncSet, ImpfTropCyclone
 from climada.hazard.base import Hazard
-from climada_petals.engine.supplychain import SupplyChain, WIOD_DIRECTORY
+from climada_petals.engine.supplychain import (SupplyChain, WIOD_DIRECTORY,
+                                              INCREMENTAL_MAX_UPDATES)
 from climada.util.constants import EXP_DEMO_H5
 from climada.util.api_client import Client
 from climada.util.files_handler import download_file
@@ -70,6 +75,39 @@ class TestSupplyChain(unittest.TestCase):
         self.assertEqual(np.shape(sup.mriot_data), (112, 112))
         self.assertAlmostEqual(sup.total_prod.sum(), 3533367.89439, places=3)
 
+    def test_read_wiot_cache(self):
+        """Test reading of wiod table from the binary cache."""
+        def remove_cache():
+            for cache_file in WIOD_DIRECTORY.glob('WIOTtest_Nov16_ROW_*.np[yz]'):
+                cache_file.unlink()
+        remove_cache()
+        self.addCleanup(remove_cache)
+        sup = SupplyChain()
+        sup.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                        col_iso3=2, col_sectors=1, cache=False)
+        sup_cache = SupplyChain()
+        for _ in range(2):
+            # first read writes the cache, second read memory-maps it
+            sup_cache.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                                  col_iso3=2, col_sectors=1)
+            np.testing.assert_allclose(sup_cache.mriot_data, sup.mriot_data.astype(float))
+            np.testing.assert_allclose(sup_cache.total_prod, sup.total_prod.astype(float))
+            self.assertListEqual(list(sup_cache.sectors), list(sup.sectors))
+            self.assertListEqual(list(sup_cache.reg_pos), list(sup.reg_pos))
+        self.assertIsInstance(sup_cache.mriot_data, np.memmap)
+
+        # a modified workbook invalidates the cache
+        workbook = WIOD_DIRECTORY / 'WIOTtest_Nov16_ROW.xlsb'
+        stat = workbook.stat()
+        self.addCleanup(os.utime, workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.utime(workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        sup_cache.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                              col_iso3=2, col_sectors=1)
+        self.assertNotIsInstance(sup_cache.mriot_data, np.memmap)
+        sup_cache.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                              col_iso3=2, col_sectors=1)
+        self.assertIsInstance(sup_cache.mriot_data, np.memmap)
+
     def calc_sector_direct_impact(self):
         """Test running direct impact calculations."""
 
@@ -102,87 +140,166 @@ class TestSupplyChain(unittest.TestCase):
                                       selected_subsec=subsecs)
         self.assertAlmostEqual((sup.years.shape[0], sup.mriot_data.shape[0]),
                                 sup.direct_impact.shape)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
                                 sup.direct_impact[:, sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual((sup.mriot_data.shape[0],),
                                 sup.direct_aai_agg.shape)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
                                 sup.direct_aai_agg[sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual(sup.reg_dir_imp[0], 'USA')
-        self.assertAlmostEqual(sup.direct_impact.sum(),
-                               sup.direct_impact[:, subsecs].sum(), places=3)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
-                               sup.direct_aai_agg[subsecs].sum(), places=3)
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
+                               sup.direct_impact[:, subsecs].sum(dtype=np.float64), places=3)
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
+                               sup.direct_aai_agg[subsecs].sum(dtype=np.float64), places=3)
 
         sup.calc_sector_direct_impact(hazard, exp, impf_set,
                                       selected_subsec='manufacturing')
         self.assertAlmostEqual((sup.years.shape[0], sup.mriot_data.shape[0]),
                                 sup.direct_impact.shape)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
                                 sup.direct_impact[:, sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual((sup.mriot_data.shape[0],),
                                 sup.direct_aai_agg.shape)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
                                 sup.direct_aai_agg[sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual(sup.reg_dir_imp[0], 'USA')
-        self.assertAlmostEqual(sup.direct_impact.sum(),
-                               sup.direct_impact[:, range(4,23)].sum(), places=3)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
-                               sup.direct_aai_agg[range(4,23)].sum(), places=3)
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
+                               sup.direct_impact[:, range(4,23)].sum(dtype=np.float64), places=3)
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
+                               sup.direct_aai_agg[range(4,23)].sum(dtype=np.float64), places=3)
 
         sup.calc_sector_direct_impact(hazard, exp, impf_set,
                                       selected_subsec='agriculture')
         self.assertAlmostEqual((sup.years.shape[0], sup.mriot_data.shape[0]),
                                 sup.direct_impact.shape)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
                                 sup.direct_impact[:, sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual((sup.mriot_data.shape[0],),
                                 sup.direct_aai_agg.shape)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
                                 sup.direct_aai_agg[sup.reg_pos['USA']].sum(),
                                 places = 3)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
-                               sup.direct_impact[:,  range(0,1)].sum(), places=3)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
-                               sup.direct_aai_agg[ range(0,1)].sum(), places=3)
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
+                               sup.direct_impact[:,  range(0,1)].sum(dtype=np.float64), places=3)
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
+                               sup.direct_aai_agg[ range(0,1)].sum(dtype=np.float64), places=3)
 
         sup.calc_sector_direct_impact(hazard, exp, impf_set,
                                       selected_subsec='mining')
         self.assertAlmostEqual((sup.years.shape[0], sup.mriot_data.shape[0]),
                                 sup.direct_impact.shape)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
                                 sup.direct_impact[:, sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual((sup.mriot_data.shape[0],),
                                 sup.direct_aai_agg.shape)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
                                 sup.direct_aai_agg[sup.reg_pos['USA']].sum(),
                                 places = 3)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
-                               sup.direct_impact[:, range(3,4)].sum(), places=3)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
-                               sup.direct_aai_agg[range(3,4)].sum(), places=3)
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
+                               sup.direct_impact[:, range(3,4)].sum(dtype=np.float64), places=3)
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
+                               sup.direct_aai_agg[range(3,4)].sum(dtype=np.float64), places=3)
 
         sup.calc_sector_direct_impact(hazard, exp, impf_set,
                                       selected_subsec='service')
         self.assertAlmostEqual((sup.years.shape[0], sup.mriot_data.shape[0]),
                                 sup.direct_impact.shape)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
                                 sup.direct_impact[:, sup.reg_pos['USA']].sum(),
                                 places = 3)
         self.assertAlmostEqual((sup.mriot_data.shape[0],), sup.direct_aai_agg.shape)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
                                 sup.direct_aai_agg[sup.reg_pos['USA']].sum(),
                                 places = 3)
-        self.assertAlmostEqual(sup.direct_impact.sum(),
-                               sup.direct_impact[:, range(26,56)].sum(), places=3)
-        self.assertAlmostEqual(sup.direct_aai_agg.sum(),
-                               sup.direct_aai_agg[range(26,56)].sum(), places=3)
+        self.assertAlmostEqual(sup.direct_impact.sum(dtype=np.float64),
+                               sup.direct_impact[:, range(26,56)].sum(dtype=np.float64), places=3)
+        self.assertAlmostEqual(sup.direct_aai_agg.sum(dtype=np.float64),
+                               sup.direct_aai_agg[range(26,56)].sum(dtype=np.float64), places=3)
+
+    def test_calc_sector_direct_impact_cache(self):
+        """Test that only regions with changed exposure are recalculated."""
+        sup = SupplyChain()
+        sup.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                        col_iso3=2, col_sectors=1)
+
+        hazard = Hazard('TC')
+        hazard.read_mat(HAZ_TEST_MAT)
+        exp = Exposures()
+        exp.read_hdf5(EXP_DEMO_H5)
+        exp.check()
+        exp.gdf.region_id = 840
+        exp.gdf.loc[exp.gdf.index[::2], 'region_id'] = 124
+        exp.assign_centroids(hazard)
+        impf_tc= ImpfTropCyclone()
+        impf_tc.set_emanuel_usa()
+        impf_set = ImpactFuncSet()
+        impf_set.append(impf_tc)
+        impf_set.check()
+
+        sup.calc_sector_direct_impact(hazard, exp, impf_set)
+        self.assertEqual(len(sup._dir_imp_cache), 2)
+        exp.gdf.loc[exp.gdf.index[0], 'value'] *= 3
+        sup.calc_sector_direct_impact(hazard, exp, impf_set)
+        self.assertEqual(len(sup._dir_imp_cache), 3)
+
+        sup_nocache = SupplyChain()
+        sup_nocache.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                                col_iso3=2, col_sectors=1)
+        sup_nocache.calc_sector_direct_impact(hazard, exp, impf_set, use_cache=False)
+        np.testing.assert_allclose(sup.direct_impact, sup_nocache.direct_impact, rtol=1e-5)
+
+    def test_calc_sector_direct_impact_regions(self):
+        """Test direct impacts of several unsorted regions against a calculation per
+        region."""
+        sup = SupplyChain()
+        sup.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                        col_iso3=2, col_sectors=1)
+
+        hazard = Hazard('TC')
+        hazard.read_mat(HAZ_TEST_MAT)
+        exp = Exposures()
+        exp.read_hdf5(EXP_DEMO_H5)
+        exp.check()
+        exp.gdf.region_id = 840
+        exp.gdf.loc[exp.gdf.index[::3], 'region_id'] = 484
+        exp.gdf.loc[exp.gdf.index[1::3], 'region_id'] = 124
+        exp.assign_centroids(hazard)
+        impf_tc= ImpfTropCyclone()
+        impf_tc.set_emanuel_usa()
+        impf_set = ImpactFuncSet()
+        impf_set.append(impf_tc)
+        impf_set.check()
+
+        subsecs = list(range(10))+list(range(15,25))
+        sup.calc_sector_direct_impact(hazard, exp, impf_set, selected_subsec=subsecs)
+
+        # one normalized impact calculation per region, in order of appearance
+        event_years = np.array([int(date[:4]) for date in hazard.get_event_date()])
+        expected = np.zeros(sup.direct_impact.shape)
+        reg_dir_imp = []
+        for exp_regid in exp.gdf.region_id.unique():
+            reg_exp = Exposures(exp.gdf[exp.gdf.region_id == exp_regid])
+            reg_exp.check()
+            reg_exp.gdf['value'] /= reg_exp.gdf['value'].sum()
+            imp = Impact()
+            imp.calc(reg_exp, impf_set, hazard)
+            imp_year = np.array([imp.at_event[event_years == year].sum()
+                                 for year in sup.years])
+            mriot_reg_name = sup._map_exp_to_mriot(exp_regid, sup.mriot_type)
+            reg_dir_imp.append(mriot_reg_name)
+            subsec_reg_pos = np.array(subsecs) + sup.reg_pos[mriot_reg_name][0]
+            expected[:, subsec_reg_pos] += np.outer(
+                imp_year, sup.mriot_data[subsec_reg_pos].sum(axis=1))
+
+        self.assertEqual(sup.reg_dir_imp, reg_dir_imp)
+        np.testing.assert_allclose(sup.direct_impact, expected, rtol=1e-5,
+                                   atol=1e-6 * expected.max())
 
     def test_calc_sector_indirect_impact(self):
         """Test running indirect impact calculations."""
@@ -242,6 +359,16 @@ class TestSupplyChain(unittest.TestCase):
                                 sup.years.shape[0]))
         self.assertAlmostEqual('eeioa', sup.io_data['io_approach'])
 
+        # float32 (default) against float64
+        sup_64 = SupplyChain(precision='float64')
+        sup_64.read_wiod16(year='test', range_rows=(5,117), range_cols=(4,116),
+                           col_iso3=2, col_sectors=1)
+        sup_64.calc_sector_direct_impact(hazard, exp, impf_set)
+        sup_64.calc_indirect_impact(io_approach='eeioa')
+        self.assertEqual(sup_64.indirect_impact.dtype, np.float64)
+        np.testing.assert_allclose(sup.indirect_impact, sup_64.indirect_impact,
+                                   rtol=1e-4, atol=1e-5 * sup_64.indirect_impact.max())
+
     def test_calc_sector_total_impact(self):
         """Test running total impact calculations."""
         sup = SupplyChain()
@@ -276,7 +403,307 @@ class TestSupplyChain(unittest.TestCase):
                                 sup.total_impact.shape)
         self.assertAlmostEqual((sup.mriot_data.shape[0],), sup.total_aai_agg.shape)
 
+class TestSupplyChainIO(unittest.TestCase):
+    """Testing the input-output calculations on a small table."""
+
+    @staticmethod
+    def _small_supplychain(**kwargs):
+        sup = SupplyChain(**kwargs)
+        sup.read_mriot(lambda: {'mriot_data': np.array([[10., 5., 0.], [2., 20., 4.],
+                                                        [1., 3., 0.]]),
+                                'total_prod': np.array([50., 60., 0.]),
+                                'mriot_reg_names': ['AAA'],
+                                'sectors': ['s1', 's2', 's3']})
+        sup.years = np.array([2000, 2001])
+        sup.direct_impact = np.array([[5., 0., 0.], [1., 6., 0.]])
+        return sup
+
+    def test_calc_indirect_impact_small(self):
+        """Test indirect impacts against the explicit formulas"""
+        sup = self._small_supplychain()
+        z_mat, prod = sup.mriot_data, sup.total_prod
+        safe_prod = np.where(prod > 0, prod, 1)
+        intensity = np.where(prod > 0, sup.direct_impact / safe_prod, 0)
+
+        tech = np.where(prod[np.newaxis, :] > 0, z_mat / safe_prod[np.newaxis, :], 0)
+        alloc = np.where(prod[:, np.newaxis] > 0, z_mat / safe_prod[:, np.newaxis], 0)
+        inv_tech = np.linalg.inv(np.identity(3) - tech)
+        inv_alloc = np.linalg.inv(np.identity(3) - alloc)
+        expected = {
+            'leontief': (intensity * (prod - z_mat.sum(axis=1))) @ inv_tech.T,
+            'ghosh': np.maximum(intensity * (prod - z_mat.sum(axis=0)), 0) @ inv_alloc,
+            'eeioa': (intensity @ inv_tech) * prod,
+        }
+        for io_approach, indirect in expected.items():
+            sup.calc_indirect_impact(io_approach=io_approach)
+            np.testing.assert_allclose(sup.indirect_impact, indirect, rtol=1e-5)
+            np.testing.assert_allclose(sup.io_data['risk_structure'].sum(axis=0),
+                                       indirect.T, rtol=1e-5)
+            self.assertEqual(sup.io_data['io_approach'], io_approach)
+
+        with self.assertRaises(ValueError):
+            sup.calc_indirect_impact(io_approach='unknown')
+
+    def test_io_cache_table_changed(self):
+        """Test that cached matrices are recomputed when the table is replaced or reset"""
+        sup = self._small_supplychain()
+        sup.calc_indirect_impact(io_approach='leontief')
+        sup.total_prod = sup.total_prod * 2
+        sup.calc_indirect_impact(io_approach='leontief')
+        indirect = sup.indirect_impact.copy()
+        sup_new = self._small_supplychain()
+        sup_new.total_prod = sup_new.total_prod * 2
+        sup_new.calc_indirect_impact(io_approach='leontief')
+        np.testing.assert_allclose(indirect, sup_new.indirect_impact)
+
+        # in-place modifications need a reset
+        sup.mriot_data[0, 1] = 8.
+        sup.reset_io_cache()
+        sup.calc_indirect_impact(io_approach='leontief')
+        sup_new.mriot_data[0, 1] = 8.
+        sup_new.reset_io_cache()
+        sup_new.calc_indirect_impact(io_approach='leontief', incremental=False)
+        np.testing.assert_allclose(sup.indirect_impact, sup_new.indirect_impact)
+        self.assertFalse(np.allclose(sup.indirect_impact, indirect))
+
+    def test_calc_indirect_impact_risk_structure(self):
+        """Test the optional, partial and memory-mapped risk structure"""
+        sup = self._small_supplychain()
+        sup.calc_indirect_impact(io_approach='leontief')
+        indirect = sup.indirect_impact.copy()
+        full_risk = sup.io_data['risk_structure'].copy()
+
+        sup.calc_indirect_impact(io_approach='leontief', risk_structure=False)
+        self.assertIsNone(sup.io_data['risk_structure'])
+        np.testing.assert_array_equal(sup.indirect_impact, indirect)
+
+        sup.calc_indirect_impact(io_approach='leontief', risk_years=[2001])
+        np.testing.assert_array_equal(sup.io_data['risk_structure'], full_risk[:, :, [1]])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sup.calc_indirect_impact(io_approach='leontief',
+                                     risk_file=Path(tmp_dir, 'risk.npy'))
+            self.assertIsInstance(sup.io_data['risk_structure'], np.memmap)
+            np.testing.assert_allclose(sup.io_data['risk_structure'], full_risk)
+            # one contiguous block per year on disk
+            np.testing.assert_allclose(np.load(Path(tmp_dir, 'risk.npy'), mmap_mode='r')[1],
+                                       full_risk[:, :, 1])
+            del sup.io_data['risk_structure']
+            sup._indirect_state = None
+
+    def test_calc_indirect_impact_incremental(self):
+        """Test that updating changed sectors only gives the full results"""
+        sup = self._small_supplychain()
+        for io_approach in ['leontief', 'ghosh', 'eeioa']:
+            sup.direct_impact = np.array([[5., 0., 0.], [1., 6., 0.]])
+            sup.calc_indirect_impact(io_approach=io_approach)
+            risk = sup.io_data['risk_structure']
+            risk_copy = risk.copy()
+            sup.direct_impact = np.array([[5., 2., 0.], [1., 3., 0.]])
+            sup.calc_indirect_impact(io_approach=io_approach)
+            incremental = sup.indirect_impact.copy()
+            incremental_risk = sup.io_data['risk_structure'].copy()
+            # only the changed sector is recomputed, the previous result is unchanged
+            np.testing.assert_array_equal(sup._indirect_state['changed'], [1])
+            np.testing.assert_array_equal(risk, risk_copy)
+            self.assertFalse(sup.io_data['risk_structure'].flags.writeable)
+            sup.calc_indirect_impact(io_approach=io_approach, incremental=False)
+            self.assertIsNone(sup._indirect_state['changed'])
+            np.testing.assert_allclose(incremental, sup.indirect_impact, rtol=1e-6)
+            np.testing.assert_allclose(incremental_risk, sup.io_data['risk_structure'],
+                                       rtol=1e-6)
+
+    def test_calc_indirect_impact_incremental_many(self):
+        """Test many successive updates in float32 against the full calculation"""
+        sup = self._small_supplychain(precision='float32')
+        rng = np.random.default_rng(0)
+        sup.calc_indirect_impact(io_approach='leontief', risk_structure=False)
+        for _ in range(100):
+            direct_impact = sup.direct_impact.copy()
+            direct_impact[:, rng.integers(2)] = rng.uniform(0., 1e4, 2)
+            sup.direct_impact = direct_impact
+            sup.calc_indirect_impact(io_approach='leontief', risk_structure=False)
+            self.assertLessEqual(sup._indirect_state['updates'],
+                                 INCREMENTAL_MAX_UPDATES)
+        incremental = sup.indirect_impact.copy()
+        sup.calc_indirect_impact(io_approach='leontief', risk_structure=False,
+                                 incremental=False)
+        np.testing.assert_allclose(incremental, sup.indirect_impact, rtol=1e-6)
+
+    def test_calc_indirect_impact_incremental_modified(self):
+        """Test that modifying the indirect impacts does not change the next results"""
+        sup = self._small_supplychain()
+        sup.calc_indirect_impact(io_approach='leontief')
+        sup.indirect_impact *= 2
+        sup.direct_impact = np.array([[5., 2., 0.], [1., 3., 0.]])
+        sup.calc_indirect_impact(io_approach='leontief')
+        incremental = sup.indirect_impact.copy()
+        sup.calc_indirect_impact(io_approach='leontief', incremental=False)
+        np.testing.assert_allclose(incremental, sup.indirect_impact, rtol=1e-6)
+
+    def test_calc_indirect_impact_incremental_risk_file(self):
+        """Test that the memory-mapped risk structure is updated for changed sectors"""
+        sup = self._small_supplychain()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            risk_file = Path(tmp_dir, 'risk.npy')
+            sup.calc_indirect_impact(io_approach='leontief', risk_file=risk_file)
+            risk = sup.io_data['risk_structure']
+            risk_copy = risk.copy()
+            sup.direct_impact = np.array([[5., 2., 0.], [1., 3., 0.]])
+            sup.calc_indirect_impact(io_approach='leontief', risk_file=risk_file)
+            np.testing.assert_array_equal(sup._indirect_state['changed'], [1])
+            np.testing.assert_array_equal(risk, risk_copy)
+            incremental_risk = np.load(risk_file)
+            del risk
+            sup.calc_indirect_impact(io_approach='leontief', incremental=False)
+            np.testing.assert_allclose(incremental_risk.transpose(1, 2, 0),
+                                       sup.io_data['risk_structure'], rtol=1e-6)
+            del sup.io_data['risk_structure']
+            sup._indirect_state = None
+
+    def test_calc_impact_batch(self):
+        """Test batched indirect and total impacts of several direct impacts"""
+        sup = self._small_supplychain()
+        direct_impacts = {'tc': sup.direct_impact.copy(),
+                          'flood': np.array([[0., 2., 0.], [3., 3., 0.], [0., 0., 0.]])}
+        expected = {}
+        for name, direct in direct_impacts.items():
+            sup.direct_impact = direct
+            sup.calc_indirect_impact(io_approach='leontief', risk_structure=False)
+            expected[name] = sup.indirect_impact.copy()
+
+        for chunk_size in [None, 2]:
+            result = sup.calc_impact_batch(direct_impacts, io_approach='leontief',
+                                           chunk_size=chunk_size)
+            self.assertEqual(list(result), ['tc', 'flood'])
+            for name, direct in direct_impacts.items():
+                np.testing.assert_allclose(result[name]['indirect_impact'], expected[name],
+                                           rtol=1e-6)
+                np.testing.assert_allclose(result[name]['total_impact'],
+                                           expected[name] + direct, rtol=1e-6)
+
+        result = sup.calc_impact_batch(list(direct_impacts.values()), io_approach='leontief',
+                                       solver='spsolve')
+        np.testing.assert_allclose(result[1]['indirect_impact'], expected['flood'], rtol=1e-5)
+
+        with self.assertRaises(ValueError):
+            sup.calc_impact_batch([np.ones((2, 4))])
+
+    def test_mriot_reg_index(self):
+        """Test mapping of exposure regions to input-output table regions"""
+        sup = SupplyChain()
+        sup.read_mriot(lambda: {'mriot_data': np.ones((6, 6)), 'total_prod': np.ones(6) * 10,
+                                'mriot_reg_names': ['CHE', 'ROW', 'USA'],
+                                'sectors': ['s1', 's2'], 'mriot_type': 'WIOD'})
+        np.testing.assert_array_equal(sup._mriot_reg_index([840, 756, 276, 250.0]),
+                                      [2, 0, 1, 1])
+        self.assertEqual(sup._map_exp_to_mriot(840, 'WIOD'), 'USA')
+        np.testing.assert_array_equal(sup.reg_pos['USA'], [4, 5])
+        # a lookup with another type does not change the instance
+        self.assertEqual(sup._map_exp_to_mriot('ROW', ''), 'ROW')
+        self.assertEqual(sup.mriot_type, 'WIOD')
+        np.testing.assert_array_equal(sup._mriot_reg_index([840]), [2])
+
+        sup.mriot_type = ''
+        np.testing.assert_array_equal(sup._mriot_reg_index(['USA', 'ROW']), [2, 1])
+        with self.assertRaises(ValueError):
+            sup._mriot_reg_index(['DEU'])
+
+    def test_calc_dynamic_impact(self):
+        """Test the dynamic model: steady state, propagation and recovery"""
+        sup = self._small_supplychain()
+        sup.read_mriot(lambda: {'mriot_data': np.array([[10., 5., 0., 2.], [2., 20., 4., 1.],
+                                                        [1., 3., 0., 0.], [0., 6., 1., 3.]]),
+                                'total_prod': np.array([50., 60., 20., 30.]),
+                                'mriot_reg_names': ['AAA', 'BBB'],
+                                'sectors': ['s1', 's2']})
+        direct_impact = np.array([[0., 0., 0., 0.], [5., 0., 0., 0.], [0., 0., 0., 15.]])
+
+        steps = []
+        prod_loss = sup.calc_dynamic_impact(direct_impact, n_days=100, batch_size=2,
+                                            step_hook=lambda step, info: steps.append(info))
+        self.assertEqual(prod_loss.shape, (3, 4))
+        np.testing.assert_allclose(prod_loss[0], 0, atol=1e-6)
+        # the damaged sector loses production, its suppliers through reduced orders
+        self.assertTrue(prod_loss[1, 0] > 0)
+        self.assertTrue(prod_loss[2, 3] > 0)
+        self.assertTrue(prod_loss[2, 0] > 0)
+        # inventories of AAA-s2 never fall below psi times their target
+        self.assertEqual(prod_loss[2, 1], 0)
+        self.assertEqual(len(steps), 200)
+        self.assertEqual(steps[-1]['batch'], 2)
+        # inventories are only stored for the 7 pairs of buyer and input sector
+        self.assertEqual(steps[0]['state_nbytes'], 2 * 8 * (4 * 4 + 7))
+
+        # faster recovery, smaller losses; batches do not change the results
+        fast_loss = sup.calc_dynamic_impact(direct_impact, n_days=100, recovery_time=20)
+        self.assertTrue(np.all(fast_loss[1:].sum(axis=1) < prod_loss[1:].sum(axis=1)))
+        np.testing.assert_allclose(sup.calc_dynamic_impact(direct_impact, n_days=100),
+                                   prod_loss, rtol=1e-6)
+
+        sup.years = np.array([2000, 2001, 2002])
+        sup.direct_impact = direct_impact
+        sup.calc_dynamic_impact(n_days=100)
+        np.testing.assert_allclose(sup.indirect_impact, prod_loss, rtol=1e-6)
+        self.assertEqual(sup.io_data['io_approach'], 'ario')
+
+    def test_precision(self):
+        """Test the precision policy and the BLAS thread limit"""
+        sup_64 = self._small_supplychain(precision='float64')
+        sup_64.calc_indirect_impact(io_approach='leontief')
+        self.assertEqual(sup_64.indirect_impact.dtype, np.float64)
+        self.assertEqual(sup_64.io_data['inverse'].dtype, np.float64)
+        self.assertEqual(sup_64.io_data['risk_structure'].dtype, np.float64)
+
+        sup_32 = self._small_supplychain(precision='float32', blas_threads=1)
+        sup_32.calc_indirect_impact(io_approach='leontief')
+        self.assertEqual(sup_32.blas_threads, 1)
+        self.assertEqual(sup_32.indirect_impact.dtype, np.float32)
+        self.assertEqual(sup_32.io_data['coefficients'].dtype, np.float32)
+        np.testing.assert_allclose(sup_32.indirect_impact, sup_64.indirect_impact, rtol=1e-5)
+        result = sup_32.calc_impact_batch([sup_32.direct_impact], io_approach='leontief')
+        self.assertEqual(result[0]['total_impact'].dtype, np.float32)
+
+        self.assertEqual(SupplyChain().precision,
+                         np.dtype(CONFIG.engine.supplychain.precision.str()))
+        with self.assertRaises(ValueError):
+            SupplyChain(precision='int32')
+
+    def test_calc_indirect_impact_sparse(self):
+        """Test sparse solvers against the dense inverse on a random sparse table"""
+        rng = np.random.default_rng(1)
+        n_sectors, n_regions = 50, 6
+        size = n_sectors * n_regions
+        mriot_data = sparse.random(size, size, density=0.05, random_state=rng,
+                                   format='csr') * 10
+        total_prod = np.asarray(mriot_data.sum(axis=0)).ravel() + \
+            np.asarray(mriot_data.sum(axis=1)).ravel() + 1
+        sup = SupplyChain()
+        sup.read_mriot(lambda: {'mriot_data': mriot_data, 'total_prod': total_prod,
+                                'mriot_reg_names': [f'R{i}' for i in range(n_regions)],
+                                'sectors': [f's{i}' for i in range(n_sectors)],
+                                'mriot_type': 'test'})
+        sup.years = np.array([2000, 2001, 2002])
+        sup.direct_impact = rng.random((3, size)) * total_prod * 0.1
+
+        for io_approach in ['leontief', 'ghosh', 'eeioa']:
+            sup.calc_indirect_impact(io_approach=io_approach, risk_structure=False)
+            indirect = sup.indirect_impact.copy()
+            for solver in ['spsolve', 'series']:
+                sup.calc_indirect_impact(io_approach=io_approach, solver=solver, tol=1e-10)
+                np.testing.assert_allclose(sup.indirect_impact, indirect, rtol=1e-4)
+                self.assertIsNone(sup.io_data['risk_structure'])
+                self.assertTrue(sparse.issparse(sup.io_data['coefficients']))
+
+    def test_read_mriot_shape(self):
+        """Test that a table not matching regions and sectors is rejected"""
+        sup = SupplyChain()
+        with self.assertRaises(ValueError):
+            sup.read_mriot(lambda: {'mriot_data': np.ones((3, 3)), 'total_prod': np.ones(3),
+                                    'mriot_reg_names': ['AAA', 'BBB'], 'sectors': ['s1']})
+
 ## Execute Tests
 if __name__ == "__main__":
     TESTS = unittest.TestLoader().loadTestsFromTestCase(TestSupplyChain)
+    TESTS.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSupplyChainIO))
     unittest.TextTestRunner(verbosity=2).run(TESTS)
@@ -20,6 +20,9 @@ Agriculture exposures from ISIMIP and FAO.
 """
 
 
+import functools
+import itertools
+import json
 import logging
 import math
 from pathlib import Path
@@ -33,6 +36,7 @@ from matplotlib import pyplot as plt
 from climada.entity.tag import Tag
 import climada.util.coordinates as u_coord
 from climada import CONFIG
+import climada_petals.util.coordinates as u_coord_petals
 from climada.entity import Exposures, INDICATOR_IMPF
 
 logging.root.setLevel(logging.DEBUG)
@@ -135,6 +139,8 @@ YEARS_FAO = (2008, 2018)
 # climada_python/data/ISIMIP_crop/Output/hist_mean/
 HIST_MEAN_PATH = DATA_DIR.joinpath('Output', 'Hist_mean')
 OUTPUT_DIR = DATA_DIR.joinpath('Output')
+EXP_MANIFEST = 'manifest.json'
+"""file recording the inputs of the exposures written by init_full_exp_set_isimip"""
 
 
 class CropProduction(Exposures):
@@ -225,168 +231,43 @@ class CropProduction(Exposures):
         if not unit:
             unit = 't/y'
 
-        if isinstance(filename, Path): # if Path, extract pure filename as string
-            if  filename.is_file() and filename.parent.is_dir():
-                LOGGER.info('input_dir is reset from %s to %s', input_dir, filename.parent)
-                input_dir = filename.parent
-            filename = filename.parts[-1]
-
-        # The filename is set or other variables (cl_model, scenario) are extracted of the
-        # specified filename
-        if filename is None:
-            yearchunk = YEARCHUNKS[isimip_version][scenario]
-            # if scenario == 'histsoc' or scenario == '1860soc':
-            if scenario in ('histsoc', '1860soc'):
-                string = '{}_{}_{}_{}.nc'
-                filepath = Path(input_dir, string.format(scenario, fn_str_var,
-                                                         yearchunk['startyear'],
-                                                         yearchunk['endyear']))
-            else:
-                string = '{}_{}_{}_{}_{}.nc'
-                filepath = Path(input_dir, string.format(scenario, cl_model, fn_str_var,
-                                                         yearchunk['startyear'],
-                                                         yearchunk['endyear']))
-        elif scenario == 'flexible':
-            _, _, _, _, _, _, startyear, endyearnc = filename.split('_')
-            endyear = endyearnc.split('.')[0]
-            yearchunk = dict()
-            yearchunk = {'yearrange': (int(startyear), int(endyear)),
-                         'startyear': int(startyear), 'endyear': int(endyear)}
-            filepath = Path(input_dir, filename)
-        else:
-            scenario, *_ = filename.split('_')
-            yearchunk = YEARCHUNKS[isimip_version][scenario]
-            filepath = Path(input_dir, filename)
+        input_dir, filepath, yearchunk = _landuse_file_isimip(
+            input_dir, filename, scenario, cl_model, isimip_version, fn_str_var)
 
         # Dataset is opened and data within the bbox extends is extracted
-        data_set = xr.open_dataset(filepath, decode_times=False)
-        [lonmin, latmin, lonmax, latmax] = bbox
-        data = data_set.sel(lon=slice(lonmin, lonmax), lat=slice(latmax, latmin))
+        with xr.open_dataset(filepath, decode_times=False) as data_set:
+            data = _select_landuse_isimip(data_set, bbox)
 
-        # The latitude and longitude are set; the region_id is determined
-        lon, lat = np.meshgrid(data.lon.values, data.lat.values)
-        self.gdf['latitude'] = lat.flatten()
-        self.gdf['longitude'] = lon.flatten()
-        self.gdf['region_id'] = u_coord.get_country_code(self.gdf.latitude, self.gdf.longitude, gridded=True)
+            # The latitude and longitude are set; the region_id is determined
+            lat = _set_grid_isimip(self, data)
 
-        # The indeces of the yearrange to be extracted are determined
-        time_idx = (int(yearrange[0] - yearchunk['startyear']),
-                    int(yearrange[1] - yearchunk['startyear']))
+            # The indeces of the yearrange to be extracted are determined
+            time_idx = (int(yearrange[0] - yearchunk['startyear']),
+                        int(yearrange[1] - yearchunk['startyear']))
 
-        # The area covered by a grid cell is calculated depending on the latitude
-        area = u_coord.get_gridcellarea(lat, resolution=0.5)
+            # The area covered by a grid cell is calculated depending on the latitude
+            area = u_coord.get_gridcellarea(lat, resolution=0.5)
 
-        # The area covered by a crop is calculated as the product of the fraction and
-        # the grid cell size
-        if irr == 'combined':
-            irr_types = ['firr', 'noirr']
-        else:
-            irr_types = [irr]
-        area_crop = dict()
-        for irr_var in irr_types:
-            area_crop[irr_var] = (
-                getattr(
-                    data, (CROP_NAME[crop])['input']+'_'+ (IRR_NAME[irr_var])['name']
-                )[time_idx[0]:time_idx[1], :, :].mean(dim='time')*area
-            ).values
-            area_crop[irr_var] = np.nan_to_num(area_crop[irr_var]).flatten()
-
-        # set historic mean, its latitude, and longitude:
-        hist_mean_dict = dict()
-        # if hist_mean is given as np.ndarray or dict,
-        # code assumes it contains hist_mean as returned by relative_cropyield
-        # however structured in dictionary as hist_mean_dict, with same
-        # bbox extensions as the exposure:
-        if isinstance(hist_mean, dict):
-            if not ('firr' in hist_mean.keys() or 'noirr' in hist_mean.keys()):
-                # as a dict hist_mean, needs to contain key 'firr' or 'noirr';
-                # if irr=='combined', both 'firr' and 'noirr' are required.
-                raise ValueError(f'Invalid hist_mean provided: {hist_mean}')
-            hist_mean_dict = hist_mean
-            lat_mean = self.gdf.latitude.values
-        elif isinstance(hist_mean, np.ndarray) or isinstance(hist_mean, list):
-            hist_mean_dict[irr_types[0]] = np.array(hist_mean)
-            lat_mean = self.gdf.latitude.values
-        elif Path(hist_mean).is_dir(): # else if hist_mean is given as path to directory
-        # The adequate file from the directory (depending on crop and irrigation) is extracted
-        # and the variables hist_mean, lat_mean and lon_mean are set accordingly
-            for irr_var in irr_types:
-                filename = str(Path(hist_mean, 'hist_mean_%s-%s_%i-%i.hdf5' %(
-                    crop, irr_var, yearrange[0], yearrange[1])))
-                hist_mean_dict[irr_var] = (h5py.File(filename, 'r'))['mean'][()]
-            lat_mean = (h5py.File(filename, 'r'))['lat'][()]
-            lon_mean = (h5py.File(filename, 'r'))['lon'][()]
-        elif Path(input_dir, hist_mean).is_file(): # file in input_dir
-        # Hist_mean, lat_mean and lon_mean are extracted from the given file
-            if len(irr_types) > 1:
-                raise ValueError("For irr=='combined', hist_mean cannot be a single file.")
-            hist_mean = h5py.File(str(Path(input_dir, hist_mean)), 'r')
-            hist_mean_dict[irr_types[0]] = hist_mean['mean'][()]
-            lat_mean = hist_mean['lat'][()]
-            lon_mean = hist_mean['lon'][()]
-        elif hist_mean.is_file(): # fall back: complete file path
-        # Hist_mean, lat_mean and lon_mean are extracted from the given file
-            if len(irr_types) > 1:
-                raise ValueError("For irr=='combined', hist_mean can not be single file.")
-            hist_mean = h5py.File(str(Path(input_dir, hist_mean)), 'r')
-            hist_mean_dict[irr_types[0]] = hist_mean['mean'][()]
-            lat_mean = hist_mean['lat'][()]
-            lon_mean = hist_mean['lon'][()]
-        else:
-            raise ValueError(f"Invalid hist_mean provided: {hist_mean}")
-
-        # The bbox is cut out of the hist_mean data file if needed
-        if len(lat_mean) != len(self.gdf.latitude.values):
-            idx_mean = np.zeros(len(self.gdf.latitude.values), dtype=int)
-            for i in range(len(self.gdf.latitude.values)):
-                idx_mean[i] = np.where(
-                    (lat_mean == self.gdf.latitude.values[i])
-                    & (lon_mean == self.gdf.longitude.values[i])
-                )[0][0]
-        else:
-            idx_mean = np.arange(0, len(lat_mean))
+            # The area covered by a crop is calculated as the product of the fraction and
+            # the grid cell size
+            if irr == 'combined':
+                irr_types = ['firr', 'noirr']
+            else:
+                irr_types = [irr]
+            area_crop = _crop_area_isimip(data, crop, irr_types, time_idx, area)
+
+        # set historic mean and the index of each exposure point in it
+        hist_mean_dict, idx_mean = _read_hist_mean_isimip(
+            hist_mean, input_dir, crop, irr_types, yearrange,
+            self.gdf.latitude.values, self.gdf.longitude.values)
 
         # The exposure [t/y] is computed per grid cell as the product of the area covered
         # by a crop [ha] and its yield [t/ha/y]
-        self.gdf['value'] = np.squeeze(area_crop[irr_types[0]] * \
-                                   hist_mean_dict[irr_types[0]][idx_mean])
-        self.gdf['value'] = np.nan_to_num(self.gdf.value) # replace NaN by 0.0
-        for irr_val in irr_types[1:]: # add other irrigation types if irr=='combined'
-            value_tmp = np.squeeze(area_crop[irr_val]*hist_mean_dict[irr_val][idx_mean])
-            value_tmp = np.nan_to_num(value_tmp) # replace NaN by 0.0
-            self.gdf['value'] += value_tmp
-        self.tag = Tag()
+        self.gdf['value'] = _crop_production_isimip(area_crop, hist_mean_dict, idx_mean,
+                                                    irr_types)
+        _set_attributes_isimip(self, crop, irr, yearrange)
 
-        self.tag.description = ("Crop production exposure from ISIMIP " +
-                                (CROP_NAME[crop])['print'] + ' ' +
-                                irr + ' ' + str(yearrange[0]) + '-' + str(yearrange[-1]))
-        self.value_unit = 't/y' # input unit, will be reset below if required by user
-        self.crop = crop
-        self.ref_year = yearrange
-        try:
-            rows, cols, ras_trans = u_coord.pts_to_raster_meta(
-                (self.gdf.longitude.min(), self.gdf.latitude.min(),
-                 self.gdf.longitude.max(), self.gdf.latitude.max()),
-                u_coord.get_resolution(self.gdf.longitude, self.gdf.latitude))
-            self.meta = {
-                'width': cols,
-                'height': rows,
-                'crs': self.crs,
-                'transform': ras_trans,
-            }
-        except ValueError:
-            LOGGER.warning('Could not write attribute meta, because exposure'
-                           ' has only 1 data point')
-            self.meta = {}
-
-        if 'USD' in unit:
-            # set_value_to_usd() is called to compute the exposure in USD/y (country specific)
-            self.set_value_to_usd(input_dir=input_dir)
-        elif 'kcal' in unit:
-            # set_value_to_kcal() is called to compute the exposure in kcal/y
-            # here, biomass=False because most crop models provide yield weight
-            # for dry matter, not biomass:
-            self.set_value_to_kcal(biomass=False)
+        _set_unit_isimip(self, unit, input_dir)
         self.check()
         return self
 
@@ -458,8 +339,8 @@ class CropProduction(Exposures):
         # initiate coordinates and values in GeoDatFrame:
         self.gdf['latitude'] = lat.flatten()
         self.gdf['longitude'] = lon.flatten()
-        self.gdf['region_id'] = u_coord.get_country_code(self.gdf.latitude,
-                                                         self.gdf.longitude, gridded=True)
+        self.gdf['region_id'] = u_coord_petals.grid_country_code(
+            self.gdf.latitude.values, self.gdf.longitude.values)
         self.gdf[INDICATOR_IMPF + DEF_HAZ_TYPE] = 1
         self.gdf[INDICATOR_IMPF] = 1
         # calc annual crop production, [t/y] = [ha] * [t/ha/y]:
@@ -593,8 +474,12 @@ class CropProduction(Exposures):
         if not input_dir:
             input_dir = INPUT_DIR
         input_dir = Path(input_dir)
-        if not hist_mean:
+        if irr is None:
+            irr = 'combined'
+        if hist_mean is None:
             hist_mean = HIST_MEAN_PATH
+        if isinstance(hist_mean, str):
+            hist_mean = Path(hist_mean)
         if yearrange is None:
             yearrange = YEARCHUNKS[isimip_version]['histsoc']['yearrange']
         if not unit:
@@ -610,37 +495,50 @@ class CropProduction(Exposures):
         filenames['subset'] = list()
         for name in filenames['all']:
             if cl_model is not None and scenario is not None:
-                if cl_model in name or scenario in name:
+                if cl_model in name.name or scenario in name.name:
                     filenames['subset'].append(name)
             elif cl_model is not None and scenario is None:
-                if cl_model in name:
+                if cl_model in name.name:
                     filenames['subset'].append(name)
             elif cl_model is None and scenario is not None:
-                if scenario in name:
+                if scenario in name.name:
                     filenames['subset'].append(name)
             else:
                 filenames['subset'] = filenames['all']
-
-        # The first exposure is calculate to determine its size
-        # and initialize the combined exposure
-        self.set_from_isimip_netcdf(input_dir, filename=filenames['subset'][0],
-                                    hist_mean=hist_mean, bbox=bbox, yearrange=yearrange,
-                                    crop=crop, irr=irr, isimip_version=isimip_version,
-                                    unit=unit, fn_str_var=fn_str_var)
-
-        combined_exp = np.zeros([self.gdf.value.size, len(filenames['subset'])])
-        combined_exp[:, 0] = self.gdf.value
-
-        # The calculations are repeated for all remaining exposures (starting from index 1 as
-        # the first exposure has been saved in combined_exp[:, 0])
-        for j, fn in enumerate(filenames['subset'][1:]):
-            self.set_from_isimip_netcdf(input_dir, filename=fn, hist_mean=hist_mean,
-                                        bbox=bbox, yearrange=yearrange,
-                                        crop=crop, irr=irr, unit=unit,
-                                        isimip_version=isimip_version)
-            combined_exp[:, j+1] = self.gdf.value
-
-        self.gdf.value = np.mean(combined_exp, 1)
+        if not filenames['subset']:
+            raise ValueError(f'No landuse files found in {input_dir}.')
+
+        # Grid, region_id, grid cell area and the historic mean are identical for all
+        # landuse files: they are set up from the first file only. Then, only a running
+        # sum of the crop production is kept in memory while streaming over the files.
+        irr_types = ['firr', 'noirr'] if irr == 'combined' else [irr]
+        value_sum = None
+        for filename in filenames['subset']:
+            _, filepath, yearchunk = _landuse_file_isimip(
+                input_dir, filename, scenario, cl_model, isimip_version, fn_str_var)
+            with xr.open_dataset(filepath, decode_times=False) as data_set:
+                data = _select_landuse_isimip(data_set, bbox)
+                if value_sum is None:
+                    lat = _set_grid_isimip(self, data)
+                    area = u_coord.get_gridcellarea(lat, resolution=0.5)
+                    hist_mean_dict, idx_mean = _read_hist_mean_isimip(
+                        hist_mean, input_dir, crop, irr_types, yearrange,
+                        self.gdf.latitude.values, self.gdf.longitude.values)
+                    value_sum = np.zeros(self.gdf.shape[0])
+                elif data.lat.size * data.lon.size != value_sum.size:
+                    raise ValueError(f'Grid of {filepath} differs from the grid of the '
+                                     'first landuse file.')
+                time_idx = (int(yearrange[0] - yearchunk['startyear']),
+                            int(yearrange[1] - yearchunk['startyear']))
+                area_crop = _crop_area_isimip(data, crop, irr_types, time_idx, area)
+            value_sum += _crop_production_isimip(area_crop, hist_mean_dict, idx_mean,
+                                                 irr_types)
+
+        self.gdf['value'] = value_sum / len(filenames['subset'])
+        _set_attributes_isimip(self, crop, irr, yearrange)
+
+        # the unit conversion is linear per grid cell and hence applied to the mean only
+        _set_unit_isimip(self, unit, input_dir)
         self.gdf['crop'] = crop
 
         self.check()
@@ -706,52 +604,26 @@ class CropProduction(Exposures):
         if len(yearrange) == 1:
             yearrange = (yearrange[0], yearrange[0])
 
-        # open both FAO files and extract needed variables
         # FAO_FILE: contains producer prices per crop, country and year
-        fao = dict()
-        fao['file'] = pd.read_csv(input_dir / FAO_FILE)
-        fao['crops'] = fao['file'].Item.values
-        fao['year'] = fao['file'].Year.values
-        fao['price'] = fao['file'].Value.values
+        price_country, price_world = _fao_prices(input_dir / FAO_FILE,
+                                                 (CROP_NAME[self.crop])['fao'], yearrange)
+
+        # the countries contained in the exposure are determined once per region_id
+        region_id = self.gdf.region_id.values.copy()
+        region_id[region_id == -99] = 0
+        self.gdf['region_id'] = region_id
+        regions, idx_region = np.unique(region_id, return_inverse=True)
+        iso3num = np.asarray(u_coord.country_to_iso(
+            regions, representation="numeric", fillvalue=999))
 
-        fao_country = u_coord.country_faocode2iso(getattr(fao['file'], 'Area Code').values)
+        # the price of each country is looked up in the price table; if no price can be
+        # determined for a specific yearrange and country, the world average for that crop
+        # (in the specified yearrange) is used.
+        # zero means no country, 999 other country: no price
+        price = price_country.reindex(iso3num).fillna(price_world).values
+        price[(iso3num == 0) | (iso3num == 999)] = 0
 
-        # create a list of the countries contained in the exposure
-        iso3num = list()
-        self.gdf.region_id[self.gdf.region_id == -99] = 0
-        iso3num = np.asarray(u_coord.country_to_iso(
-            self.gdf.region_id, representation="numeric", fillvalue=999), dtype=object)
-        list_countries = np.unique(iso3num)
-
-        # iterate over all countries that are covered in the exposure, extract the according price
-        # and calculate the crop production in USD/y
-        area_price = np.zeros(self.gdf.value.size)
-        for country in list_countries:
-            [idx_country] = (iso3num == country).nonzero()
-            if country == 999:
-                price = 0
-                area_price[idx_country] = self.gdf.value[idx_country] * price
-            # zero means no country, 999 other country
-            elif country != 0 and country != 999:
-                idx_price = np.where((np.asarray(fao_country) == country) &
-                                     (np.asarray(fao['crops']) == \
-                                     (CROP_NAME[self.crop])['fao']) &
-                                     (fao['year'] >= yearrange[0]) &
-                                     (fao['year'] <= yearrange[1]))
-                # if no price can be determined for a specific yearrange and country, the world
-                # average for that crop (in the specified yearrange) is used
-                if idx_price[0].size != 0:
-                    price = np.mean(fao['price'][idx_price])
-
-                else:
-                    idx_price = np.where((np.asarray(fao['crops']) == \
-                                          (CROP_NAME[self.crop])['fao']) &
-                                         (fao['year'] >= yearrange[0]) &
-                                         (fao['year'] <= yearrange[1]))
-                    price = np.mean(fao['price'][idx_price])
-                area_price[idx_country] = self.gdf.value[idx_country] * price
-
-        self.gdf['value'] = area_price
+        self.gdf['value'] = self.gdf.value.values * price[idx_region]
         self.value_unit = 'USD/y'
         self.check()
         return self
@@ -766,21 +638,23 @@ class CropProduction(Exposures):
         country_values : array
             aggregated exposure value
         """
-
-        list_countries = np.unique(self.gdf.region_id)
-        country_values = np.zeros(len(list_countries))
-        for i, iso_nr in enumerate(list_countries):
-            country_values[i] = self.gdf.loc[self.gdf.region_id == iso_nr].value.sum()
+        list_countries, idx_country = np.unique(self.gdf.region_id.values, return_inverse=True)
+        country_values = np.bincount(idx_country, weights=np.nan_to_num(self.gdf.value.values),
+                                     minlength=list_countries.size)
 
         return list_countries, country_values
 
 def init_full_exp_set_isimip(input_dir=None, filename=None, hist_mean_dir=None,
                              output_dir=None, bbox=None, yearrange=None, unit=None,
-                             isimip_version=None, return_data=False):
+                             isimip_version=None, return_data=False, pool=None):
     """Generates CropProduction instances (exposure sets) for all files found in the
         input directory and saves them as hdf5 files in the output directory.
         Exposures are aggregated per crop and irrigation type.
 
+        The landuse file is read once for all crop-irrigation combinations. A manifest
+        in the output directory records the inputs of every exposure file written, so
+        that exposures whose inputs did not change are not computed again.
+
     Parameters
     ----------
     input_dir : str or Path
@@ -803,6 +677,9 @@ def init_full_exp_set_isimip(input_dir=None, filename=None, hist_mean_dir=None,
     return_data : boolean
         returned output
         False: returns list of filenames only, True: returns also list of data
+    pool : pathos.pools.ProcessPool, optional
+        pool used to compute and write the exposures of the crop-irrigation
+        combinations in parallel. Default: None
 
     Returns
     -------
@@ -832,28 +709,69 @@ def init_full_exp_set_isimip(input_dir=None, filename=None, hist_mean_dir=None,
         unit = 't/y'
 
     filenames = [f.name for f in hist_mean_dir.iterdir()
-                 if f.is_file() and not f.name.startswith('.')]
+                 if f.is_file() and f.name.startswith('hist_mean_')]
 
     # generate output directory if it does not exist yet
     target_dir = output_dir / 'Exposure'
     target_dir.mkdir(exist_ok=True)
 
-    # create exposures for all crop-irrigation combinations and save them
+    input_dir, filepath, yearchunk = _landuse_file_isimip(
+        input_dir, filename, 'histsoc', None, isimip_version, FN_STR_VAR)
+
+    # exposures whose inputs are unchanged since they were written are skipped
+    manifest_path = target_dir / EXP_MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.is_file() else dict()
+    landuse_signature = _file_signature(filepath)
     filename_list = list()
-    output_list = list()
+    combis = list()
     for file in filenames:
         _, _, crop_irr, *_ = file.split('_')
         crop, irr = crop_irr.split('-')
-        crop_production = CropProduction()
-        crop_production.set_from_isimip_netcdf(input_dir=input_dir, filename=filename,
-                                               hist_mean=hist_mean_dir, bbox=bbox,
-                                               isimip_version=isimip_version,
-                                               yearrange=yearrange, crop=crop, irr=irr, unit=unit)
         filename_expo = ('crop_production_' + crop + '-'+ irr + '_'
                          + str(yearrange[0]) + '-' + str(yearrange[1]) + '.hdf5')
         filename_list.append(filename_expo)
-        crop_production.write_hdf5(str(Path(target_dir, filename_expo)))
-        if return_data:
+        inputs = {'landuse': landuse_signature,
+                  'hist_mean': _file_signature(hist_mean_dir / file),
+                  'bbox': [float(coord) for coord in bbox],
+                  'yearrange': [int(year) for year in yearrange], 'unit': unit}
+        if manifest.get(filename_expo) == inputs and (target_dir / filename_expo).is_file():
+            LOGGER.info('Exposure %s is up to date.', filename_expo)
+        else:
+            combis.append((crop, irr, filename_expo, inputs))
+
+    if combis:
+        # the landuse file is opened and the grid is set up once for all combinations
+        with xr.open_dataset(filepath, decode_times=False) as data_set:
+            data = _select_landuse_isimip(data_set, bbox)
+            grid = CropProduction()
+            lat = _set_grid_isimip(grid, data)
+            area = u_coord.get_gridcellarea(lat, resolution=0.5)
+            time_idx = (int(yearrange[0] - yearchunk['startyear']),
+                        int(yearrange[1] - yearchunk['startyear']))
+            area_crops = [_crop_area_isimip(data, crop, ['firr', 'noirr']
+                                            if irr == 'combined' else [irr], time_idx, area)
+                          for crop, irr, *_ in combis]
+
+        args = (grid.gdf.latitude.values, grid.gdf.longitude.values,
+                grid.gdf.region_id.values, hist_mean_dir, input_dir, yearrange, unit)
+        crops, irrs, filenames_expo, _ = zip(*combis)
+        paths_expo = [target_dir / filename_expo for filename_expo in filenames_expo]
+        if pool:
+            pool.map(_init_exp_isimip, crops, irrs, area_crops, paths_expo,
+                     *[itertools.repeat(arg, len(combis)) for arg in args])
+        else:
+            for crop, irr, area_crop, path_expo in zip(crops, irrs, area_crops, paths_expo):
+                _init_exp_isimip(crop, irr, area_crop, path_expo, *args)
+
+        for _, _, filename_expo, inputs in combis:
+            manifest[filename_expo] = inputs
+        manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+
+    output_list = list()
+    if return_data:
+        for filename_expo in filename_list:
+            crop_production = CropProduction()
+            crop_production.read_hdf5(str(Path(target_dir, filename_expo)))
             output_list.append(crop_production)
 
     return filename_list, output_list
@@ -912,63 +830,57 @@ def normalize_with_fao_cp(exp_firr, exp_noirr, input_dir=None,
         yearrange = YEARS_FAO
     if not unit:
         unit = 't/y'
+    exp_firr_norm = exp_firr.copy(deep=True)
+    exp_noirr_norm = exp_noirr.copy(deep=True)
     # if the exposure unit is USD/y or kcal/y, temporarily reset the exposure to t/y
     # (stored in tonnes_per_year) in order to normalize with FAO crop production
     # values and then apply set_to_XXX() for the normalized exposure to restore the
     # initial exposure unit
-    if exp_firr.value_unit == 'USD/y' or 'kcal' in exp_firr.value_unit:
-        exp_firr.gdf.value = exp_firr.tonnes_per_year
-    if exp_noirr.value_unit == 'USD/y' or 'kcal' in exp_noirr.value_unit:
-        exp_noirr.gdf.value = exp_noirr.tonnes_per_year
-
-    country_list, countries_firr = exp_firr.aggregate_countries()
-    country_list, countries_noirr = exp_noirr.aggregate_countries()
-
-    exp_tot_production = countries_firr + countries_noirr
-
-    fao = pd.read_csv(input_dir / FAO_FILE2)
-    fao_crops = fao.Item.values
-    fao_year = fao.Year.values
-    fao_values = fao.Value.values
-    fao_code = getattr(fao, 'Area Code').values
-
+    for exp in (exp_firr_norm, exp_noirr_norm):
+        if exp.value_unit == 'USD/y' or 'kcal' in exp.value_unit:
+            exp.gdf['value'] = exp.gdf.tonnes_per_year.values
+            exp.value_unit = 't/y'
+
+    # countries of both exposures, which may differ
+    countries_firr, values_firr = exp_firr_norm.aggregate_countries()
+    countries_noirr, values_noirr = exp_noirr_norm.aggregate_countries()
+    country_list = np.union1d(countries_firr, countries_noirr)
+    exp_tot_production = np.zeros(country_list.size)
+    exp_tot_production[np.searchsorted(country_list, countries_firr)] += values_firr
+    exp_tot_production[np.searchsorted(country_list, countries_noirr)] += values_noirr
+
+    # mean FAO crop production per country (NaN if not documented)
+    fao = _read_fao_csv(input_dir / FAO_FILE2)
+    fao = fao[(fao.Item.values == (CROP_NAME[exp_firr.crop])['fao'])
+              & (fao.Year.values >= yearrange[0]) & (fao.Year.values <= yearrange[1])]
     fao_country = u_coord.country_iso2faocode(country_list)
+    fao_crop_production = fao.Value.groupby(fao['Area Code']).mean().reindex(
+        fao_country).values.astype(float)
 
-    fao_crop_production = np.zeros(len(country_list))
+    # if a country has no values in the exposure (e.g. Cyprus) the exposure value
+    # is set to the FAO average value
+    # in this case the ratio is left being 1 (as initiated)
     ratio = np.ones(len(country_list))
-    exp_firr_norm = exp_firr.copy(deep=True)
-    exp_noirr_norm = exp_noirr.copy(deep=True)
-
-    # loop over countries: compute ratio & apply normalization:
-    for country, iso_nr in enumerate(country_list):
-        idx = np.where((np.asarray(fao_code) == fao_country[country])
-                       & (np.asarray(fao_crops) == (CROP_NAME[exp_firr.crop])['fao'])
-                       & (fao_year >= yearrange[0]) & (fao_year <= yearrange[1]))
-        if len(idx) >= 1:
-            fao_crop_production[country] = np.mean(fao_values[idx])
-
-        # if a country has no values in the exposure (e.g. Cyprus) the exposure value
-        # is set to the FAO average value
-        # in this case the ratio is left being 1 (as initiated)
-        if exp_tot_production[country] == 0:
-            exp_tot_production[country] = fao_crop_production[country]
-        elif fao_crop_production[country] != np.nan and fao_crop_production[country] != 0:
-            ratio[country] = fao_crop_production[country] / exp_tot_production[country]
-
-        exp_firr_norm.gdf.value[exp_firr.gdf.region_id == iso_nr] = ratio[country] * \
-        exp_firr.gdf.value[exp_firr.gdf.region_id == iso_nr]
-        exp_noirr_norm.gdf.value[exp_firr.gdf.region_id == iso_nr] = ratio[country] * \
-        exp_noirr.gdf.value[exp_noirr.gdf.region_id == iso_nr]
-
-        if unit == 'USD/y' or exp_noirr.value_unit == 'USD/y':
-            exp_noirr.set_value_to_usd(input_dir=input_dir)
-        elif 'kcal' in unit or 'kcal' in exp_noirr.value_unit:
-            exp_noirr.set_value_to_kcal(biomass=True)
+    no_exp = exp_tot_production == 0
+    exp_tot_production[no_exp] = fao_crop_production[no_exp]
+    has_fao = ~no_exp & (fao_crop_production != 0)
+    ratio[has_fao] = fao_crop_production[has_fao] / exp_tot_production[has_fao]
+
+    # apply normalization per grid cell with the ratio of its country and restore
+    # the initial (or requested) exposure unit
+    for exp, exp_in in ((exp_firr_norm, exp_firr), (exp_noirr_norm, exp_noirr)):
+        region_id = exp.gdf.region_id.values
+        idx_country = np.minimum(np.searchsorted(country_list, region_id),
+                                 country_list.size - 1)
+        if np.any(country_list[idx_country] != region_id):
+            raise ValueError('Region ids of the exposure not found in the country list.')
+        exp.gdf['value'] = ratio[idx_country] * exp.gdf.value.values
+
+        if unit == 'USD/y' or exp_in.value_unit == 'USD/y':
+            exp.set_value_to_usd(input_dir=input_dir)
+        elif 'kcal' in unit or 'kcal' in exp_in.value_unit:
             # FAO production is provided in biomass, not dry matter
-        if unit == 'USD/y' or exp_firr.value_unit == 'USD/y':
-            exp_firr.set_value_to_usd(input_dir=input_dir)
-        elif 'kcal' in unit or 'kcal' in exp_firr.value_unit:
-            exp_firr.set_value_to_kcal(biomass=True)
+            exp.set_value_to_kcal(biomass=True)
 
     exp_firr_norm.tag.description = exp_firr_norm.tag.description+' normalized'
     exp_noirr_norm.tag.description = exp_noirr_norm.tag.description+' normalized'
@@ -979,7 +891,7 @@ def normalize_with_fao_cp(exp_firr, exp_noirr, input_dir=None,
     return country_list, ratio, exp_firr_norm, exp_noirr_norm
 
 def normalize_several_exp(input_dir=None, output_dir=None,
-                          yearrange=None, unit=None, return_data=True):
+                          yearrange=None, unit=None, return_data=True, pool=None):
     """
     Multiple exposure sets saved as HDF5 files in input directory are normalized
     (i.e. bias corrected) against FAO statistics of crop production.
@@ -1003,6 +915,9 @@ def normalize_several_exp(input_dir=None, output_dir=None,
         per country as documented by the FAO and calculated by the ISIMIP dataset
         False: lists containing data for each exposure file. Lists: crops, country list,
         ratio = FAO/ISIMIP, normalized exposures
+    pool : pathos.pools.ProcessPool, optional
+        pool used to normalize the exposures of the different crops in parallel.
+        Default: None
 
     Returns
     -------
@@ -1037,45 +952,21 @@ def normalize_several_exp(input_dir=None, output_dir=None,
                       f.is_file() if not f.parts[-1].startswith('.') if
                       'firr' in f.parts[-1]]
 
-    crop_list = list()
-    countries_list = list()
-    ratio_list = list()
-    exp_firr_norm = list()
-    exp_noirr_norm = list()
-    fao_cp_list = list()
-    exp_tot_cp_list = list()
-
-    for file_firr in filenames_firr:
-        _, _, crop_irr, years = file_firr.split('_')
-        crop, _ = crop_irr.split('-')
-        exp_firr = CropProduction()
-        exp_firr.read_hdf5(str(Path(output_dir, 'Exposure', file_firr)))
-
-        filename_noirr = 'crop_production_' + crop + '-' + 'noirr' + '_' + years
-        exp_noirr = CropProduction()
-        exp_noirr.read_hdf5(str(Path(output_dir, 'Exposure', filename_noirr)))
-
-        if return_data:
-            countries, ratio, exp_firr2, exp_noirr2, fao_cp, \
-            exp_tot_cp = normalize_with_fao_cp(exp_firr, exp_noirr, input_dir=input_dir,
-                                               yearrange=yearrange, unit=unit)
-            fao_cp_list.append(fao_cp)
-            exp_tot_cp_list.append(exp_tot_cp)
-        else:
-            countries, ratio, exp_firr2, exp_noirr2 = normalize_with_fao_cp(
-                exp_firr, exp_noirr, input_dir=input_dir,
-                yearrange=yearrange, unit=unit, return_data=False)
+    # the exposure pairs are normalized per crop (in parallel if a pool is given)
+    args = (output_dir / 'Exposure', input_dir, yearrange, unit, return_data)
+    if pool:
+        results = pool.map(_normalize_exp_files, filenames_firr,
+                           *[itertools.repeat(arg, len(filenames_firr)) for arg in args])
+    else:
+        results = [_normalize_exp_files(file_firr, *args) for file_firr in filenames_firr]
 
-        crop_list.append(crop)
-        countries_list.append(countries)
-        ratio_list.append(ratio)
-        exp_firr_norm.append(exp_firr2)
-        exp_noirr_norm.append(exp_noirr2)
+    crop_list = [crop for crop, _ in results]
+    # transpose the per crop results to lists per returned variable
+    output_lists = [list(output) for output in zip(*[result for _, result in results])]
+    if not output_lists:
+        output_lists = [list() for _ in range(6 if return_data else 4)]
 
-    if return_data:
-        return crop_list, countries_list, ratio_list, exp_firr_norm, exp_noirr_norm, \
-                fao_cp_list, exp_tot_cp_list
-    return crop_list, countries_list, ratio_list, exp_firr_norm, exp_noirr_norm
+    return (crop_list, *output_lists)
 
 def semilogplot_ratio(crop, countries, ratio, output_dir=None, save=True):
     """Plot ratio = FAO/ISIMIP against country codes.
@@ -1115,3 +1006,347 @@ def semilogplot_ratio(crop, countries, ratio, output_dir=None, save=True):
         target_dir.mkdir(exist_ok=True)
         plt.savefig(target_dir / 'fig_ratio_norm_' + crop)
     return fig, axes
+
+def _landuse_file_isimip(input_dir, filename, scenario, cl_model, isimip_version,
+                         fn_str_var):
+    """Determine the path and year chunk of an ISIMIP landuse file.
+
+    Parameters
+    ----------
+    input_dir : Path
+        path to input data directory
+    filename : str or Path or None
+        name (or path) of the landuse data file, if None it is constructed
+        from scenario, cl_model and fn_str_var
+    scenario : str
+        socio economic scenario, or 'flexible' to read the year range from filename
+    cl_model : str
+        abbrev. climate model (only for future projections of lu data)
+    isimip_version : str
+        'ISIMIP2' or 'ISIMIP3'
+    fn_str_var : str
+        FileName STRing depending on VARiable and ISIMIP simuation round
+
+    Returns
+    -------
+    input_dir : Path
+        input directory, reset to the parent of filename if it is a file path
+    filepath : Path
+        path to the landuse data file
+    yearchunk : dict
+        year range, start and end year of the landuse data file
+    """
+    if isinstance(filename, Path): # if Path, extract pure filename as string
+        if  filename.is_file() and filename.parent.is_dir():
+            LOGGER.info('input_dir is reset from %s to %s', input_dir, filename.parent)
+            input_dir = filename.parent
+        filename = filename.parts[-1]
+
+    # The filename is set or other variables (cl_model, scenario) are extracted of the
+    # specified filename
+    if filename is None:
+        yearchunk = YEARCHUNKS[isimip_version][scenario]
+        # if scenario == 'histsoc' or scenario == '1860soc':
+        if scenario in ('histsoc', '1860soc'):
+            string = '{}_{}_{}_{}.nc'
+            filepath = Path(input_dir, string.format(scenario, fn_str_var,
+                                                     yearchunk['startyear'],
+                                                     yearchunk['endyear']))
+        else:
+            string = '{}_{}_{}_{}_{}.nc'
+            filepath = Path(input_dir, string.format(scenario, cl_model, fn_str_var,
+                                                     yearchunk['startyear'],
+                                                     yearchunk['endyear']))
+    elif scenario == 'flexible':
+        _, _, _, _, _, _, startyear, endyearnc = filename.split('_')
+        endyear = endyearnc.split('.')[0]
+        yearchunk = {'yearrange': (int(startyear), int(endyear)),
+                     'startyear': int(startyear), 'endyear': int(endyear)}
+        filepath = Path(input_dir, filename)
+    else:
+        scenario, *_ = filename.split('_')
+        yearchunk = YEARCHUNKS[isimip_version][scenario]
+        filepath = Path(input_dir, filename)
+    return input_dir, filepath, yearchunk
+
+def _select_landuse_isimip(data_set, bbox):
+    """Lazily cut an opened ISIMIP landuse data set to the bounding box."""
+    [lonmin, latmin, lonmax, latmax] = bbox
+    return data_set.sel(lon=slice(lonmin, lonmax), lat=slice(latmax, latmin))
+
+def _set_unit_isimip(exposure, unit, input_dir):
+    """Convert the value of an exposure from t/y to the requested unit."""
+    if 'USD' in unit:
+        # set_value_to_usd() is called to compute the exposure in USD/y (country specific)
+        exposure.set_value_to_usd(input_dir=input_dir)
+    elif 'kcal' in unit:
+        # set_value_to_kcal() is called to compute the exposure in kcal/y
+        # here, biomass=False because most crop models provide yield weight
+        # for dry matter, not biomass:
+        exposure.set_value_to_kcal(biomass=False)
+
+def _set_grid_isimip(exposure, data):
+    """Set latitude, longitude and region_id from the grid of an ISIMIP landuse
+    data set.
+
+    Parameters
+    ----------
+    exposure : CropProduction
+        exposure to set the grid of
+    data : xarray.Dataset
+        landuse data set cut to the bounding box
+
+    Returns
+    -------
+    lat : np.array
+        2d latitude grid
+    """
+    lon, lat = np.meshgrid(data.lon.values, data.lat.values)
+    exposure.gdf['latitude'] = lat.flatten()
+    exposure.gdf['longitude'] = lon.flatten()
+    exposure.gdf['region_id'] = u_coord_petals.grid_country_code(
+        exposure.gdf.latitude.values, exposure.gdf.longitude.values)
+    return lat
+
+def _set_attributes_isimip(exposure, crop, irr, yearrange):
+    """Set tag, unit, crop, reference year and meta of an exposure read from
+    ISIMIP landuse data (value in t/y)."""
+    exposure.tag = Tag()
+
+    exposure.tag.description = ("Crop production exposure from ISIMIP " +
+                                (CROP_NAME[crop])['print'] + ' ' +
+                                irr + ' ' + str(yearrange[0]) + '-' + str(yearrange[-1]))
+    exposure.value_unit = 't/y' # input unit, will be reset below if required by user
+    exposure.crop = crop
+    exposure.ref_year = yearrange
+    try:
+        rows, cols, ras_trans = u_coord.pts_to_raster_meta(
+            (exposure.gdf.longitude.min(), exposure.gdf.latitude.min(),
+             exposure.gdf.longitude.max(), exposure.gdf.latitude.max()),
+            u_coord.get_resolution(exposure.gdf.longitude, exposure.gdf.latitude))
+        exposure.meta = {
+            'width': cols,
+            'height': rows,
+            'crs': exposure.crs,
+            'transform': ras_trans,
+        }
+    except ValueError:
+        LOGGER.warning('Could not write attribute meta, because exposure'
+                       ' has only 1 data point')
+        exposure.meta = {}
+
+def _crop_area_isimip(data, crop, irr_types, time_idx, area):
+    """Area covered by a crop [ha] per grid cell and irrigation type, computed as the
+    product of the mean crop fraction over the years in time_idx and the grid cell area.
+
+    Returns
+    -------
+    area_crop : dict
+        flattened crop area per irrigation type
+    """
+    area_crop = dict()
+    for irr_var in irr_types:
+        area_crop[irr_var] = (
+            getattr(
+                data, (CROP_NAME[crop])['input']+'_'+ (IRR_NAME[irr_var])['name']
+            )[time_idx[0]:time_idx[1], :, :].mean(dim='time')*area
+        ).values
+        area_crop[irr_var] = np.nan_to_num(area_crop[irr_var]).flatten()
+    return area_crop
+
+def _read_hist_mean_isimip(hist_mean, input_dir, crop, irr_types, yearrange, lat, lon):
+    """Read the historic mean crop yield per irrigation type and locate the exposure
+    points in it.
+
+    Parameters
+    ----------
+    hist_mean : dict or array or Path
+        historic mean crop yield per centroid as dict (per irrigation type) or array,
+        or path to a directory or file containing it
+    input_dir : Path
+        input directory, used to resolve a hist_mean filename
+    crop : str
+        crop type
+    irr_types : list(str)
+        irrigation types
+    yearrange : tuple
+        year range of the historic mean
+    lat, lon : np.array
+        coordinates of the exposure points
+
+    Returns
+    -------
+    hist_mean_dict : dict
+        historic mean crop yield per irrigation type
+    idx_mean : np.array
+        index of each exposure point in the historic mean
+    """
+    hist_mean_dict = dict()
+    # if hist_mean is given as np.ndarray or dict,
+    # code assumes it contains hist_mean as returned by relative_cropyield
+    # however structured in dictionary as hist_mean_dict, with same
+    # bbox extensions as the exposure:
+    if isinstance(hist_mean, dict):
+        if not ('firr' in hist_mean.keys() or 'noirr' in hist_mean.keys()):
+            # as a dict hist_mean, needs to contain key 'firr' or 'noirr';
+            # if irr=='combined', both 'firr' and 'noirr' are required.
+            raise ValueError(f'Invalid hist_mean provided: {hist_mean}')
+        hist_mean_dict = hist_mean
+        lat_mean = lat
+    elif isinstance(hist_mean, np.ndarray) or isinstance(hist_mean, list):
+        hist_mean_dict[irr_types[0]] = np.array(hist_mean)
+        lat_mean = lat
+    elif Path(hist_mean).is_dir(): # else if hist_mean is given as path to directory
+    # The adequate file from the directory (depending on crop and irrigation) is extracted
+    # and the variables hist_mean, lat_mean and lon_mean are set accordingly
+        for irr_var in irr_types:
+            filename = Path(hist_mean, 'hist_mean_%s-%s_%i-%i.hdf5' %(
+                crop, irr_var, yearrange[0], yearrange[1]))
+            hist_mean_dict[irr_var], lat_mean, lon_mean = _read_hist_mean_file(filename)
+    elif Path(input_dir, hist_mean).is_file(): # file in input_dir
+    # Hist_mean, lat_mean and lon_mean are extracted from the given file
+        if len(irr_types) > 1:
+            raise ValueError("For irr=='combined', hist_mean cannot be a single file.")
+        hist_mean_dict[irr_types[0]], lat_mean, lon_mean = _read_hist_mean_file(
+            Path(input_dir, hist_mean))
+    elif hist_mean.is_file(): # fall back: complete file path
+    # Hist_mean, lat_mean and lon_mean are extracted from the given file
+        if len(irr_types) > 1:
+            raise ValueError("For irr=='combined', hist_mean can not be single file.")
+        hist_mean_dict[irr_types[0]], lat_mean, lon_mean = _read_hist_mean_file(hist_mean)
+    else:
+        raise ValueError(f"Invalid hist_mean provided: {hist_mean}")
+
+    # The bbox is cut out of the hist_mean data file if needed
+    if len(lat_mean) != len(lat):
+        idx_mean = u_coord_petals.match_grid_points(lat, lon, lat_mean, lon_mean)
+    else:
+        idx_mean = np.arange(0, len(lat_mean))
+    return hist_mean_dict, idx_mean
+
+def _read_hist_mean_file(file_path):
+    """Read historic mean crop yield and its coordinates from a hdf5 file as
+    written by relative_cropyield (also in compact mode).
+
+    Returns
+    -------
+    mean, lat, lon : np.array
+    """
+    with h5py.File(str(file_path), 'r') as hist_file:
+        mean = hist_file['mean'][()]
+        if 'lat' in hist_file:
+            return mean, hist_file['lat'][()], hist_file['lon'][()]
+        # compact files reference the coordinates shared within their directory
+        centroids_file = Path(file_path).parent / hist_file.attrs['centroids']
+    with h5py.File(str(centroids_file), 'r') as coord_file:
+        return mean, coord_file['lat'][()], coord_file['lon'][()]
+
+def _crop_production_isimip(area_crop, hist_mean_dict, idx_mean, irr_types):
+    """Crop production [t/y] per grid cell as the product of the area covered by a crop
+    [ha] and its yield [t/ha/y], summed over the irrigation types (NaN replaced by 0)."""
+    value = np.nan_to_num(np.squeeze(area_crop[irr_types[0]] *
+                                     hist_mean_dict[irr_types[0]][idx_mean]))
+    for irr_val in irr_types[1:]: # add other irrigation types if irr=='combined'
+        value = value + np.nan_to_num(np.squeeze(area_crop[irr_val] *
+                                                 hist_mean_dict[irr_val][idx_mean]))
+    return value
+
+@functools.lru_cache(maxsize=4)
+def _read_fao_csv(file_path):
+    """Read a FAOSTAT csv file (cached, the returned DataFrame must not be modified)."""
+    return pd.read_csv(file_path)
+
+def _fao_prices(file_path, crop_fao, yearrange):
+    """Mean FAO producer price of a crop per country within a year range.
+
+    Parameters
+    ----------
+    file_path : Path
+        FAOSTAT producer prices csv file
+    crop_fao : str
+        FAO name of the crop
+    yearrange : tuple
+        first and last year of the prices to average
+
+    Returns
+    -------
+    price_country : pd.Series
+        mean price indexed by numerical ISO3 country code
+    price_world : float
+        mean price over all countries
+    """
+    fao = _read_fao_csv(file_path)
+    fao = fao[(fao.Item.values == crop_fao)
+              & (fao.Year.values >= yearrange[0]) & (fao.Year.values <= yearrange[1])]
+    area_codes, idx_code = np.unique(fao['Area Code'].values, return_inverse=True)
+    fao_iso = np.asarray(u_coord.country_faocode2iso(area_codes))[idx_code]
+    return fao.Value.groupby(fao_iso).mean(), fao.Value.mean()
+
+def _file_signature(file_path):
+    """Path, modification time and size of a file, used to detect changed inputs."""
+    stat = Path(file_path).stat()
+    return [str(file_path), stat.st_mtime_ns, stat.st_size]
+
+def _init_exp_isimip(crop, irr, area_crop, file_path, lat, lon, region_id, hist_mean_dir,
+                     input_dir, yearrange, unit):
+    """Compute the exposure of a crop-irrigation combination from its crop area on a
+    landuse grid and write it to an hdf5 file.
+
+    Parameters
+    ----------
+    crop : str
+        crop type
+    irr : str
+        irrigation type
+    area_crop : dict
+        flattened crop area per irrigation type, as returned by _crop_area_isimip
+    file_path : Path
+        hdf5 file to write the exposure to
+    lat, lon, region_id : np.array
+        coordinates and region ids of the landuse grid
+    hist_mean_dir : Path
+        directory containing the historic mean crop yield files
+    input_dir : Path
+        directory containing the input data
+    yearrange : tuple
+        year range of the exposure
+    unit : str
+        unit of the exposure
+    """
+    irr_types = list(area_crop.keys())
+    crop_production = CropProduction()
+    crop_production.gdf['latitude'] = lat
+    crop_production.gdf['longitude'] = lon
+    crop_production.gdf['region_id'] = region_id
+    hist_mean_dict, idx_mean = _read_hist_mean_isimip(hist_mean_dir, input_dir, crop,
+                                                      irr_types, yearrange, lat, lon)
+    crop_production.gdf['value'] = _crop_production_isimip(area_crop, hist_mean_dict,
+                                                           idx_mean, irr_types)
+    _set_attributes_isimip(crop_production, crop, irr, yearrange)
+    _set_unit_isimip(crop_production, unit, input_dir)
+    crop_production.check()
+    crop_production.write_hdf5(str(file_path))
+
+def _normalize_exp_files(file_firr, exposure_dir, input_dir, yearrange, unit, return_data):
+    """Read the exposures of a crop under full and no irrigation and normalize them
+    with normalize_with_fao_cp.
+
+    Returns
+    -------
+    crop : str
+        crop type
+    result : tuple
+        output of normalize_with_fao_cp
+    """
+    _, _, crop_irr, years = file_firr.split('_')
+    crop, _ = crop_irr.split('-')
+    exp_firr = CropProduction()
+    exp_firr.read_hdf5(str(Path(exposure_dir, file_firr)))
+
+    filename_noirr = 'crop_production_' + crop + '-' + 'noirr' + '_' + years
+    exp_noirr = CropProduction()
+    exp_noirr.read_hdf5(str(Path(exposure_dir, filename_noirr)))
+
+    return crop, normalize_with_fao_cp(exp_firr, exp_noirr, input_dir=input_dir,
+                                       yearrange=yearrange, unit=unit,
+                                       return_data=return_data)
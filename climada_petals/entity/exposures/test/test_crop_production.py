@@ -18,8 +18,15 @@ with CLIMADA. If not, see <https://www.gnu.org/licenses/>.
 
 Unit Tests on LitPop exposures.
 """
+import os
+from pathlib import Path
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 import numpy as np
+import xarray as xr
+from climada_petals.entity.exposures import crop_production
 from climada_petals.entity.exposures.crop_production import CropProduction, normalize_with_fao_cp
 from climada.util.constants import DEMO_DIR
 
@@ -64,6 +71,33 @@ class TestCropProduction(unittest.TestCase):
         self.assertEqual(exp.crop, 'mai')
         self.assertAlmostEqual(exp.gdf.value.max(), 284244.81023404596, places=5)
 
+    def test_set_mean_of_several_isimip_models(self):
+        """Test that the mean streamed over several landuse files equals the mean of
+        the exposures of the single files"""
+        exp = CropProduction()
+        exp.set_from_isimip_netcdf(input_dir=INPUT_DIR, filename=FILENAME, hist_mean=FILENAME_MEAN,
+                                   bbox=[-5, 42, 16, 55], yearrange=np.array([2001, 2005]),
+                                   scenario='flexible', unit='t/y', crop='mai', irr='firr')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with xr.open_dataset(Path(INPUT_DIR, FILENAME), decode_times=False) as data:
+                data.to_netcdf(Path(tmp_dir, 'flexible_landuse-15crops_annual_FR_DE_A_2001_2005.nc'))
+                data_double = data.copy()
+                for var in data_double.data_vars:
+                    data_double[var] = data[var] * 2
+                data_double.to_netcdf(
+                    Path(tmp_dir, 'flexible_landuse-15crops_annual_FR_DE_B_2001_2005.nc'))
+            exp_mean = CropProduction()
+            exp_mean.set_mean_of_several_isimip_models(
+                input_dir=tmp_dir, hist_mean=Path(INPUT_DIR, FILENAME_MEAN),
+                bbox=[-5, 42, 16, 55], yearrange=np.array([2001, 2005]), scenario='flexible',
+                unit='t/y', crop='mai', irr='firr')
+
+        np.testing.assert_array_equal(exp_mean.gdf.latitude.values, exp.gdf.latitude.values)
+        np.testing.assert_array_equal(exp_mean.gdf.region_id.values, exp.gdf.region_id.values)
+        np.testing.assert_allclose(exp_mean.gdf.value.values, 1.5 * exp.gdf.value.values,
+                                   rtol=1e-6)
+        self.assertEqual(exp_mean.value_unit, 't/y')
+
     def test_set_value_to_usd(self):
         """Test calculating crop_production Exposure in [USD/y]"""
         exp = CropProduction()
@@ -131,6 +165,37 @@ class TestCropProduction(unittest.TestCase):
         self.assertEqual(exp.crop, 'mai')
         self.assertAlmostEqual(exp.gdf.value.max(), 51603897.28533253, places=6)
 
+    def test_init_full_exp_set_isimip_manifest(self):
+        """Test that unchanged exposures are skipped and changed inputs recomputed"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hist_mean_dir = Path(tmp_dir, 'hist_mean')
+            hist_mean_dir.mkdir()
+            hist_mean_file = hist_mean_dir / 'hist_mean_mai-firr_1862-1866.hdf5'
+            shutil.copy(Path(INPUT_DIR, FILENAME_MEAN), hist_mean_file)
+            kwargs = dict(input_dir=INPUT_DIR, filename=FILENAME, hist_mean_dir=hist_mean_dir,
+                          output_dir=tmp_dir, bbox=[-5, 42, 16, 55], yearrange=(1862, 1866))
+
+            with patch.object(crop_production, '_init_exp_isimip',
+                              wraps=crop_production._init_exp_isimip) as init_exp:
+                filename_list, _ = crop_production.init_full_exp_set_isimip(**kwargs)
+                self.assertEqual(init_exp.call_count, 1)
+                self.assertEqual(filename_list, ['crop_production_mai-firr_1862-1866.hdf5'])
+                self.assertTrue(Path(tmp_dir, 'Exposure', crop_production.EXP_MANIFEST).is_file())
+
+                # second run with the same inputs is skipped
+                crop_production.init_full_exp_set_isimip(**kwargs)
+                self.assertEqual(init_exp.call_count, 1)
+
+                # touching an input invalidates the manifest entry
+                stat = hist_mean_file.stat()
+                os.utime(hist_mean_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+                crop_production.init_full_exp_set_isimip(**kwargs)
+                self.assertEqual(init_exp.call_count, 2)
+
+                # other inputs (here the unit) invalidate it as well
+                crop_production.init_full_exp_set_isimip(unit='kcal/y', **kwargs)
+                self.assertEqual(init_exp.call_count, 3)
+
     def test_normalize_with_fao_cp(self):
         """ Test normalizing of two given exposures countrywise (usually firr + norr)
         with the mean crop production quantity"""
@@ -153,6 +218,29 @@ class TestCropProduction(unittest.TestCase):
         self.assertListEqual(list(country_list), [0, 40, 56, 70, 191, 203, 208, 250,
                                                   276, 380, 442, 528, 616, 705, 724, 756, 826])
 
+        # the inputs are not modified, every grid cell is scaled with its country's ratio
+        value_in = exp.gdf.value.values.copy()
+        country_list, ratio, exp_firr_norm, exp_noirr_norm = normalize_with_fao_cp(
+            exp, exp, input_dir=INPUT_DIR, yearrange=np.array([2009, 2018]), unit='t/y',
+            return_data=False)
+        np.testing.assert_array_equal(exp.gdf.value.values, value_in)
+        self.assertEqual(exp.value_unit, 't/y')
+        for country, country_ratio in zip(country_list, ratio):
+            in_country = exp.gdf.region_id.values == country
+            np.testing.assert_allclose(exp_firr_norm.gdf.value.values[in_country],
+                                       country_ratio * value_in[in_country])
+
+        # countries only present in one of the exposures
+        exp_noirr = exp.copy(deep=True)
+        exp_noirr.gdf = exp_noirr.gdf[exp_noirr.gdf.region_id != 756]
+        country_list, ratio, exp_firr_norm, exp_noirr_norm = normalize_with_fao_cp(
+            exp, exp_noirr, input_dir=INPUT_DIR, yearrange=np.array([2009, 2018]),
+            unit='t/y', return_data=False)
+        self.assertIn(756, country_list)
+        in_che = exp.gdf.region_id.values == 756
+        np.testing.assert_allclose(exp_firr_norm.gdf.value.values[in_che],
+                                   ratio[list(country_list).index(756)] * value_in[in_che])
+
 # Execute Tests
 if __name__ == "__main__":
     TESTS = unittest.TestLoader().loadTestsFromTestCase(TestCropProduction)
@@ -24,6 +24,7 @@ __all__ = ['Drought']
 
 
 import logging
+import itertools
 from pathlib import Path
 import numpy as np
 import xarray as xr
@@ -78,9 +79,21 @@ class Drought(Hazard):
     vars_opt = Hazard.vars_opt.union({'spei'})
     """Name of the variables that aren't need to compute the impact."""
 
-    def __init__(self):
-        """Empty constructor."""
+    def __init__(self, pool=None):
+        """Empty constructor.
+
+        Parameters
+        ----------
+        pool : pathos.pools.ProcessPool, optional
+            Pool used to process the area in latitude blocks in parallel.
+            Default: None
+        """
         Hazard.__init__(self, HAZ_TYPE)
+        if pool:
+            self.pool = pool
+            LOGGER.info('Using %s CPUs.', self.pool.ncpus)
+        else:
+            self.pool = None
 #        Hazard.__init__(self)
 #        self.file_url = SPEI_FILE_URL
 #        self.file_dir = SPEI_FILE_DIR
@@ -129,29 +142,57 @@ class Drought(Hazard):
 
 
 
-    def __read_indices_spei(self, dataset):
-        """Read the NETCDF file containing SPEI"""
+    def __get_slices_spei(self, dataset):
+        """Get the latitude and longitude index slices of the area"""
 
         lat_total = dataset.lat.data
         lon_total = dataset.lon.data
         index_lon = np.where((lon_total >= self.lonmin) & (lon_total <= self.lonmax))[0]
         index_lat = np.where((lat_total >= self.latmin) & (lat_total <= self.latmax))[0]
 
-        lat_vector = dataset.lat[index_lat[0]:index_lat[len(index_lat) - 1]].data
-        lon_vector = dataset.lon[index_lon[0]:index_lon[len(index_lon) - 1]].data
+        return slice(index_lat[0], index_lat[len(index_lat) - 1]), \
+            slice(index_lon[0], index_lon[len(index_lon) - 1])
+
+
+    def __read_indices_spei(self, dataset, slices=None):
+        """Read the NETCDF file containing SPEI
+
+        Parameters
+        ----------
+        dataset : xr.Dataset
+            opened SPEI file
+        slices : tuple(slice, slice), optional
+            latitude and longitude index slices to read. Default: the area
+            set with set_area
+        """
+
+        if slices is None:
+            slices = self.__get_slices_spei(dataset)
+        lat_slice, lon_slice = slices
+
         self.time_vector = dataset.time.data
-        self.lat_vector = lat_vector
-        self.lon_vector = lon_vector
+        self.lat_vector = dataset.lat[lat_slice].data
+        self.lon_vector = dataset.lon[lon_slice].data
         self.timeforname = self.time_vector
 
-        spei_matrix = dataset.spei[:, index_lat[0]:index_lat[len(index_lat) - 1],
-                                   index_lon[0]:index_lon[len(index_lon) - 1]].data
+        spei_matrix = dataset.spei[:, lat_slice, lon_slice].data
 
         return spei_matrix
 
 
-    def setup(self):
-        """Set up the hazard drought"""
+    def setup(self, n_blocks=None):
+        """Set up the hazard drought
+
+        Parameters
+        ----------
+        n_blocks : int, optional
+            number of latitude blocks in which the area is processed. Every
+            block only reads its slab of the SPEI file; blocks are processed
+            with self.pool if provided. Default: number of CPUs of self.pool,
+            1 otherwise.
+        """
+        if n_blocks is None:
+            n_blocks = self.pool.ncpus if self.pool else 1
         try:
 
             if not self.file_path.is_file():
@@ -182,6 +223,10 @@ class Drought(Hazard):
         except Exception as err:
             raise type(err)('Importing the SPEI data file failed: ' + str(err)) from err
 
+        if n_blocks > 1:
+            self.__setup_blocks(dataset, n_blocks)
+            return self
+
         spei_3d = self.__read_indices_spei(dataset)
         spei_2d = self.__traslate_matrix(spei_3d)
 
@@ -191,6 +236,88 @@ class Drought(Hazard):
         return self
 
 
+    def __setup_blocks(self, dataset, n_blocks):
+        """Compute the intensity of the area in latitude blocks and merge them
+
+        Parameters
+        ----------
+        dataset : xr.Dataset
+            opened SPEI file
+        n_blocks : int
+            number of latitude blocks
+        """
+
+        lat_slice, lon_slice = self.__get_slices_spei(dataset)
+        self.time_vector = dataset.time.data
+        self.lat_vector = dataset.lat[lat_slice].data
+        self.lon_vector = dataset.lon[lon_slice].data
+        self.timeforname = self.time_vector
+
+        # blocks of complete latitude rows keep the row-major order of the
+        # centroids, so that the blocks can be merged column-wise
+        lat_index = np.arange(lat_slice.start, lat_slice.stop)
+        lat_blocks = [slice(block[0], block[-1] + 1) for block in
+                      np.array_split(lat_index, min(n_blocks, lat_index.size))]
+        num_blocks = len(lat_blocks)
+
+        LOGGER.info('Processing %s latitude blocks.', num_blocks)
+        if self.pool:
+            blocks = self.pool.map(self._setup_block, lat_blocks,
+                                   itertools.repeat(lon_slice, num_blocks),
+                                   itertools.repeat(self.file_path, num_blocks),
+                                   itertools.repeat(self.threshold, num_blocks),
+                                   itertools.repeat(self.intensity_definition, num_blocks),
+                                   chunksize=1)
+        else:
+            blocks = [self._setup_block(lat_block, lon_slice, self.file_path,
+                                        self.threshold, self.intensity_definition)
+                      for lat_block in lat_blocks]
+
+        self.n_years = blocks[0].n_years
+        self.time_vector = blocks[0].time_vector
+        self.date_start = sparse.hstack([block.date_start for block in blocks], format='csr')
+        self.date_end = np.hstack([block.date_end for block in blocks])
+        self.hazard_def(sparse.hstack([block.intensity for block in blocks], format='csr'))
+
+
+    @staticmethod
+    def _setup_block(lat_slice, lon_slice, file_path, threshold, intensity_definition):
+        """Compute the intensity of one latitude block, reading only its slab
+        of the SPEI file.
+
+        Parameters
+        ----------
+        lat_slice : slice
+            latitude index slice of the block
+        lon_slice : slice
+            longitude index slice of the block
+        file_path : Path
+            path of the SPEI file
+        threshold : float
+            SPEI threshold
+        intensity_definition : int
+            intensity definition
+
+        Returns
+        -------
+        Drought
+            block with intensity, date_start, date_end, n_years and
+            time_vector set; centroids and event attributes are not set
+        """
+        block = Drought()
+        block.set_file_path(file_path)
+        block.set_threshold(threshold)
+        block.set_intensity_def(intensity_definition)
+
+        with xr.open_dataset(file_path) as dataset:
+            spei_3d = block.__read_indices_spei(dataset, (lat_slice, lon_slice))
+        spei_2d = block.__traslate_matrix(spei_3d)
+
+        block.intensity = sparse.csr_matrix(
+            block.__get_intensity_from_2d(spei_2d, intensity_definition))
+        return block
+
+
     def __traslate_matrix(self, spei_3d):
         """return hazard intensity as a simple threshold on the SPEI values
 
@@ -255,14 +382,8 @@ class Drought(Hazard):
 
         self.units = 'SPEI'
 
-        # fill centroids th bad way (there must be a code like grid...)
-        lat_2d = np.zeros([self.lat_vector.shape[0], self.lon_vector.shape[0]])
-        lon_2d = np.zeros([self.lat_vector.shape[0], self.lon_vector.shape[0]])
+        lon_2d, lat_2d = np.meshgrid(self.lon_vector, self.lat_vector)
         n_centroids = self.lat_vector.shape[0] * self.lon_vector.shape[0]
-        for lat_i in range(0, self.lat_vector.shape[0]):
-            for lon_i in range(0, self.lon_vector.shape[0]):
-                lat_2d[lat_i, lon_i] = self.lat_vector[lat_i]
-                lon_2d[lat_i, lon_i] = self.lon_vector[lon_i]
 
         lon_1d = lon_2d.reshape(n_centroids,)
         lat_1d = lat_2d.reshape(n_centroids,)
@@ -357,9 +478,8 @@ class Drought(Hazard):
             date_start_matrix[:, pixel] = start
             date_end_matrix[:, pixel] = end
 
-            #self.date_start = date_start_matrix
-            self.date_end = date_end_matrix
-            self.date_start = sparse.csr_matrix(date_start_matrix)
+        self.date_end = date_end_matrix
+        self.date_start = sparse.csr_matrix(date_start_matrix)
 
 
         if intensity_definition == 1:
@@ -23,22 +23,26 @@ WORK IN PROGRESS
 __all__ = ['RelativeCropyield']
 
 import logging
+import itertools
+import functools
 from pathlib import Path
 import copy
 
 import numpy as np
 from matplotlib import pyplot as plt
 import cartopy
-import shapely.geometry
+from rasterio import Affine
 from scipy import sparse
 import scipy.stats
 import h5py
 import xarray as xr
 
 from climada.hazard.base import Hazard
+from climada.hazard.centroids import Centroids
 from climada.util import dates_times as dt
-from climada.util import coordinates as coord
+from climada.util.constants import DEF_CRS
 from climada import CONFIG
+import climada_petals.util.coordinates as u_coord_petals
 
 
 LOGGER = logging.getLogger(__name__)
@@ -51,12 +55,18 @@ INT_DEF = 'Yearly Yield'
 BBOX = (-180, -85, 180, 85)  # [Lon min, lat min, lon max, lat max]
 """"Default geographical bounding box of the total global agricultural land extent"""
 
+RESOLUTION = 0.5
+"""Default resolution of the ISIMIP grid in degrees, used for grids with a single cell"""
+
 # ! deposit the input files in: climada_python/data/ISIMIP_crop/Input/Hazard
 DATA_DIR = CONFIG.hazard.relative_cropyield.local_data.dir()
 INPUT_DIR = DATA_DIR.joinpath('Input', 'Hazard')
 """default paths for input and output data:"""
 OUTPUT_DIR = DATA_DIR.joinpath('Output')
 
+CENTROIDS_FILE = 'centroids.hdf5'
+"""name of the file with the centroids shared by the compact hdf5 files of a directory"""
+
 
 #ISIMIP input data specific global variables
 """start and end years per senario as in ISIMIP-filenames"""
@@ -214,12 +224,11 @@ class RelativeCropyield(Hazard):
                              yearrange[1] - yearchunk['startyear'] + 2).tolist()
 
         # hazard setup: set attributes
-        [lonmin, latmin, lonmax, latmax] = bbox
-        self.set_raster([str(Path(input_dir, filename))], band=id_bands,
-                        geometry=list([shapely.geometry.box(lonmin, latmin, lonmax, latmax)]))
-
-        self.intensity.data[np.isnan(self.intensity.data)] = 0.0
-        self.intensity.todense()
+        self.intensity, self.centroids = _read_isimip_yield(Path(input_dir, filename),
+                                                            bbox, id_bands)
+        self.tag.file_name = str(Path(input_dir, filename))
+        self.event_id = np.arange(1, len(id_bands) + 1)
+        self.orig = np.ones(len(id_bands), bool)
         self.crop = crop
         self.event_name = [str(n) for n in range(int(yearrange[0]), int(yearrange[-1] + 1))]
         self.frequency = np.ones(len(self.event_name)) * (1 / len(self.event_name))
@@ -229,8 +238,10 @@ class RelativeCropyield(Hazard):
         self.date = np.array(dt.str_to_date(
             [event_ + '-01-01' for event_ in self.event_name]))
         self.centroids.set_meta_to_lat_lon()
-        self.centroids.region_id = (
-            coord.coord_on_land(self.centroids.lat, self.centroids.lon)).astype(dtype=int)
+        transform = self.centroids.meta['transform']
+        self.centroids.region_id = u_coord_petals.grid_on_land(
+            self.centroids.lat, self.centroids.lon,
+            res=(abs(transform[4]), abs(transform[0]))).astype(dtype=int)
         self.check()
         return self
 
@@ -297,12 +308,15 @@ class RelativeCropyield(Hazard):
         # determine idx of the centroids with a mean yield !=0
         [idx] = np.where(hist_mean != 0)
 
-        # initialize new hazard_matrix
-        hazard_matrix = np.zeros(self.intensity.shape, dtype=np.float32)
+        # scale the stored yields of each centroid with its inverse mean yield
+        col_scale = np.zeros(self.intensity.shape[1])
+        col_scale[idx] = 1 / hist_mean[idx]
+        rel_yield = (sparse.csr_matrix(self.intensity) @ sparse.diags(col_scale)).tocoo()
 
-        # compute relative yield for each event:
-        for event in range(len(self.event_id)):
-            hazard_matrix[event, idx] = (self.intensity[event, idx] / hist_mean[idx])-1
+        # centroids with a mean yield !=0 have a relative yield of -1 where the yield is 0
+        hazard_matrix = np.zeros(self.intensity.shape, dtype=np.float32)
+        hazard_matrix[:, idx] = -1
+        hazard_matrix[rel_yield.row, rel_yield.col] += rel_yield.data
 
         self.intensity = sparse.csr_matrix(hazard_matrix)
         self.intensity_def = 'Relative Yield'
@@ -310,35 +324,136 @@ class RelativeCropyield(Hazard):
 
         return self
 
-    def set_percentile_to_int(self, reference_intensity=None):
+    def set_percentile_to_int(self, reference_intensity=None, chunk_size=1000):
         """Sets percentile to intensity
 
         Parameters
         ----------
-        reference_intensity : AD
+        reference_intensity : sparse.csr_matrix
             intensity to be used as reference
             (e.g. the historic intensity can be used in order to be able
             to directly compare historic and future projection data)
+        chunk_size : int
+            number of centroids processed at once, default: 1000
 
         Returns
         -------
         hazard with modified intensity
         """
-        hazard_matrix = np.zeros(self.intensity.shape)
-        if reference_intensity is None:
+        self_reference = reference_intensity is None
+        if self_reference:
             reference_intensity = self.intensity
 
-        for centroid in range(self.intensity.shape[1]):
-            nevents = reference_intensity.shape[0]
-            array = reference_intensity[:, centroid].toarray().reshape(nevents)
-            hazard_matrix[:, centroid] = np.array([scipy.stats.percentileofscore(array, event)
-                                                   for event in array])/100
+        intensity = sparse.csc_matrix(self.intensity)
+        reference = sparse.csc_matrix(reference_intensity)
+        nevents = reference.shape[0]
+
+        # percentile of score as in scipy.stats.percentileofscore(kind='rank')
+        hazard_matrix = np.zeros(self.intensity.shape)
+        for start in range(0, self.intensity.shape[1], chunk_size):
+            cols = slice(start, start + chunk_size)
+            ref_chunk = reference[:, cols].toarray()
+            if self_reference:
+                # the percentile of a value within its own sample is its mean rank
+                hazard_matrix[:, cols] = scipy.stats.rankdata(ref_chunk, axis=0) / nevents
+            else:
+                int_chunk = intensity[:, cols].toarray()[np.newaxis, :, :]
+                left = (ref_chunk[:, np.newaxis, :] < int_chunk).sum(axis=0)
+                right = (ref_chunk[:, np.newaxis, :] <= int_chunk).sum(axis=0)
+                hazard_matrix[:, cols] = (left + right + (right > left)) / (2 * nevents)
+
         self.intensity = sparse.csr_matrix(hazard_matrix)
         self.intensity_def = 'Percentile'
         self.units = ''
 
         return self
 
+    def write_compact_hdf5(self, file_name, centroids_file=None):
+        """Write the hazard in a compact hdf5 format: the intensity is stored as float32
+        matrix (events x centroids), chunked per event and gzip compressed, so that
+        single events can be read without reading the whole file
+        (see read_compact_hdf5). The fraction is not stored.
+
+        Parameters
+        ----------
+        file_name : str or Path
+            file to write
+        centroids_file : str, optional
+            name of a centroids file in the same directory (see
+            write_centroids_hdf5) which is referenced instead of storing the
+            coordinates of the centroids in the file. Default: None
+        """
+        n_events, n_centroids = self.intensity.shape
+        with h5py.File(str(file_name), 'w') as file:
+            intensity = file.create_dataset(
+                'intensity', shape=(n_events, n_centroids), dtype='f4',
+                chunks=(1, max(n_centroids, 1)), compression='gzip', shuffle=True)
+            for event in range(n_events):
+                intensity[event, :] = self.intensity[event].toarray().ravel()
+            file.create_dataset('event_id', data=self.event_id)
+            file.create_dataset('event_name', data=np.array(self.event_name, dtype='S'))
+            file.create_dataset('date', data=self.date)
+            file.create_dataset('frequency', data=self.frequency)
+            file.create_dataset('orig', data=self.orig)
+            file.attrs['units'] = self.units
+            file.attrs['crop'] = self.crop
+            file.attrs['intensity_def'] = self.intensity_def
+            file.attrs['file_name'] = str(self.tag.file_name)
+            file.attrs['description'] = str(self.tag.description)
+            if centroids_file is None:
+                file.attrs['centroids'] = ''
+                file.create_dataset('lat', data=self.centroids.lat)
+                file.create_dataset('lon', data=self.centroids.lon)
+            else:
+                file.attrs['centroids'] = str(centroids_file)
+
+    def read_compact_hdf5(self, file_name, years=None):
+        """Read a hazard written by write_compact_hdf5. Only the intensity of the
+        selected years is read from the file. The fraction is set to 1 where the
+        intensity is not 0.
+
+        Parameters
+        ----------
+        file_name : str or Path
+            file to read
+        years : list(int), optional
+            years (events) to read. Default: all years in the file
+
+        Returns
+        -------
+        RelativeCropyield
+        """
+        with h5py.File(str(file_name), 'r') as file:
+            event_name = [name.decode() for name in file['event_name'][()]]
+            if years is None:
+                idx = np.arange(len(event_name))
+            else:
+                idx = np.flatnonzero(np.isin(np.array(event_name, dtype=int), years))
+            n_centroids = file['intensity'].shape[1]
+            intensity = (file['intensity'][idx, :] if idx.size
+                         else np.zeros((0, n_centroids), dtype='f4'))
+            self.intensity = sparse.csr_matrix(intensity, dtype=float)
+            self.event_id = file['event_id'][()][idx]
+            self.event_name = [event_name[i] for i in idx]
+            self.date = file['date'][()][idx]
+            self.frequency = file['frequency'][()][idx]
+            self.orig = file['orig'][()][idx].astype(bool)
+            self.units = file.attrs['units']
+            self.crop = file.attrs['crop']
+            self.intensity_def = file.attrs['intensity_def']
+            self.tag.file_name = file.attrs['file_name']
+            self.tag.description = file.attrs['description']
+            if file.attrs['centroids']:
+                lat, lon = read_centroids_hdf5(Path(file_name).parent / file.attrs['centroids'])
+            else:
+                lat, lon = file['lat'][()], file['lon'][()]
+        self.fraction = self.intensity.copy()
+        self.fraction.data.fill(1.0)
+        self.centroids = Centroids()
+        self.centroids.set_lat_lon(lat, lon)
+        self.check()
+        return self
+
     def plot_intensity_cp(self, event=None, dif=False, axis=None, **kwargs):
         """Plots intensity with predefined settings depending on the intensity definition
 
@@ -440,7 +555,8 @@ class RelativeCropyield(Hazard):
 
 def set_multiple_rc_from_isimip(input_dir=None, output_dir=None, bbox=None,
                                 isimip_run=None, yearrange_his=None, yearrange_mean=None,
-                                return_data=False, save=True, combine_subcrops=True):
+                                return_data=False, save=True, combine_subcrops=True,
+                                pool=None, compact=False):
 
     """Wrapper to generate full hazard set from all ISIMIP-NetCDF files with
     crop yield in a given input directory and save it to output directory.
@@ -470,6 +586,14 @@ def set_multiple_rc_from_isimip(input_dir=None, output_dir=None, bbox=None,
         save output data to output_dir
     combine_subcrops : boolean
         combine crops: ric=ri1+ri2, whe=swh+wwh
+    pool : pathos.pools.ProcessPool, optional
+        pool used to compute the hazard sets of the historical files in parallel.
+        The hazards are written to file by the calling process only.
+        Default: None
+    compact : boolean
+        save the hazards with write_compact_hdf5 and the historical means as
+        compressed float32. The centroids are stored once per output directory
+        in CENTROIDS_FILE. Default: False
 
     Returns
     -------
@@ -521,10 +645,17 @@ def set_multiple_rc_from_isimip(input_dir=None, output_dir=None, bbox=None,
         yearrange_mean = YEARCHUNKS['ISIMIP2a']['yearrange_mean']
         # (1980, 1999)
 
-    for his_file in his_file_list:
-        haz_his, filename, hist_mean = calc_his_haz_isimip(his_file, file_props,
-                                                           input_dir=input_dir, bbox=bbox,
-                                                           yearrange_mean=yearrange_mean)
+    # the hazard sets of all historical files are computed independently (in parallel if a
+    # pool is given), the hazards are written and the hist_mean values are collected here
+    args = (file_props, scenario_list, input_dir, bbox, yearrange_mean, isimip_run)
+    if pool:
+        haz_sets = pool.imap(_calc_haz_sets_isimip, his_file_list,
+                             *[itertools.repeat(arg, len(his_file_list)) for arg in args])
+    else:
+        haz_sets = (_calc_haz_sets_isimip(his_file, *args) for his_file in his_file_list)
+
+    haz_centroids = None
+    for his_file, (hist_mean, haz_list) in zip(his_file_list, haz_sets):
         # save the historical mean depending on the crop-irrigation combination
         # the idx keeps track of the row in which the hist_mean values are written per crop-irr to
         # ensure that all files are assigned to the corresponding crop-irr combination
@@ -532,20 +663,129 @@ def set_multiple_rc_from_isimip(input_dir=None, output_dir=None, bbox=None,
             hist_mean_per_crop[file_props[his_file]['combi_crop_irr']]['idx'], :] = hist_mean
         hist_mean_per_crop[file_props[his_file]['combi_crop_irr']]['idx'] += 1
 
-        filename_list.append(filename)
-        if return_data:
-            output_list.append(haz_his)
-        else: output_list.append(None)
-        if save:
-            haz_his.select(reg_id=1).write_hdf5(str(Path(output_dir, 'Hazard', filename)))
+        haz_his = haz_list[0][1]
+        for filename, haz in haz_list:
+            filename_list.append(filename)
+            if return_data:
+                output_list.append(haz)
+            else: output_list.append(None)
+            if save and compact:
+                haz = haz.select(reg_id=1)
+                if haz_centroids is None:
+                    haz_centroids = haz.centroids
+                    write_centroids_hdf5(haz_centroids.lat, haz_centroids.lon,
+                                         Path(output_dir, 'Hazard', CENTROIDS_FILE))
+                # all hazards are expected on the same centroids, else they are self-contained
+                shared = (haz.centroids.size == haz_centroids.size and
+                          np.array_equal(haz.centroids.lat, haz_centroids.lat) and
+                          np.array_equal(haz.centroids.lon, haz_centroids.lon))
+                haz.write_compact_hdf5(Path(output_dir, 'Hazard', filename),
+                                       centroids_file=CENTROIDS_FILE if shared else None)
+            elif save:
+                haz.select(reg_id=1).write_hdf5(str(Path(output_dir, 'Hazard', filename)))
 
-        if isimip_run in ('ISIMIP2b', 'ISIMIP3b'):
-            # compute the relative yield for all future scenarios with the corresponding
-            # historic mean
-            for scenario in scenario_list: # loop over all scenarios except historical
+    # calculate mean hist_mean for each crop-irrigation combination and save as hdf5
+    # in output_dir (required for full exposure set preparation):
+    for combi_crop_irr in combi_crop_list:
+        mean = np.mean((hist_mean_per_crop[combi_crop_irr])['value'], 0)
+        mean_filename = ('hist_mean_' + combi_crop_irr + '_' + str(yearrange_mean[0]) +'-' +
+                         str(yearrange_mean[1]) + '.hdf5')
+        filename_list.append(mean_filename)
+        output_list.append(mean)
+
+    if save: # save hist_mean files to hdf5 file:
+        if compact:
+            write_centroids_hdf5(haz_his.centroids.lat, haz_his.centroids.lon,
+                                 Path(output_dir, 'Hist_mean', CENTROIDS_FILE))
+        for idx, filename in enumerate(filename_list):
+            if 'hist_mean_' in filename:
+                _write_hist_mean(Path(output_dir, 'Hist_mean', filename), output_list[idx],
+                                 haz_his.centroids.lat, haz_his.centroids.lon, compact)
+
+    return filename_list, output_list
+
+def write_centroids_hdf5(lat, lon, file_name):
+    """Write centroid coordinates shared by several compact hdf5 files
+    (hazards or historic means) of a directory.
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the centroids
+    file_name : str or Path
+        file to write
+    """
+    with h5py.File(str(file_name), 'w') as file:
+        file.create_dataset('lat', data=lat, compression='gzip')
+        file.create_dataset('lon', data=lon, compression='gzip')
+
+def read_centroids_hdf5(file_name):
+    """Read centroid coordinates written by write_centroids_hdf5.
+
+    Returns
+    -------
+    lat, lon : np.array
+    """
+    with h5py.File(str(file_name), 'r') as file:
+        return file['lat'][()], file['lon'][()]
+
+def _write_hist_mean(file_name, mean, lat, lon, compact=False):
+    """Write the historic mean of a crop-irrigation combination, in compact mode as
+    compressed float32 referencing the shared CENTROIDS_FILE of the directory."""
+    with h5py.File(str(file_name), 'w') as mean_file:
+        if compact:
+            mean_file.create_dataset('mean', data=mean, dtype='f4', compression='gzip',
+                                     shuffle=True)
+            mean_file.attrs['centroids'] = CENTROIDS_FILE
+        else:
+            mean_file.create_dataset('mean', data=mean)
+            mean_file.create_dataset('lat', data=lat)
+            mean_file.create_dataset('lon', data=lon)
+
+def _calc_haz_sets_isimip(his_file, file_props, scenario_list, input_dir, bbox,
+                          yearrange_mean, isimip_run):
+    """Create the historical hazard of one historical file and the future hazards of all
+    scenarios available for the same model combination, relative to its historical mean.
+
+    Parameters
+    ----------
+    his_file : string
+        file name of historical input hazard file
+    file_props : dict
+        file properties of all historical input hazard files
+    scenario_list : list
+        list of all future scenarios
+    input_dir : Path
+        path to input data directory
+    bbox : list of four floats
+        bounding box:
+        [lon min, lat min, lon max, lat max]
+    yearrange_mean : int tuple
+        year range for the historical mean
+    isimip_run : string
+        name of the ISIMIP run ('ISIMIP2a', 'ISIMIP2b', or 'ISIMIP3b')
+
+    Returns
+    -------
+    hist_mean : array
+        historical mean of the historical hazard
+    haz_list : list of tuples (string, RelativeCropyield)
+        names to save the hazards and hazards, starting with the historical hazard
+    """
+    haz_his, filename, hist_mean = calc_his_haz_isimip(his_file, file_props,
+                                                       input_dir=input_dir, bbox=bbox,
+                                                       yearrange_mean=yearrange_mean)
+    haz_list = [(filename, haz_his)]
+
+    if isimip_run in ('ISIMIP2b', 'ISIMIP3b'):
+        # compute the relative yield for all future scenarios with the corresponding
+        # historic mean
+        for scenario in scenario_list: # loop over all scenarios except historical
+            yearchunks = [YEARCHUNKS[scenario]]
+            if scenario == 'rcp26': # also test for extended
+                yearchunks.append(YEARCHUNKS['rcp26-2'])
+            for yearchunk in yearchunks:
                 # check whether future file exists for given historical file and scenario:
-                haz_fut = None
-                filename = None
                 fut_file = '{}_{}_{}_{}_{}_{}_yield-{}-{}_{}_{}_{}.nc'.format(
                     file_props[his_file]['ag_model'],
                     file_props[his_file]['cl_model'],
@@ -556,74 +796,20 @@ def set_multiple_rc_from_isimip(input_dir=None, output_dir=None, bbox=None,
                     file_props[his_file]['crop'],
                     file_props[his_file]['irr'],
                     FN_STR_VAR,
-                    YEARCHUNKS[scenario]['startyear'],
-                    YEARCHUNKS[scenario]['endyear']
+                    yearchunk['startyear'],
+                    yearchunk['endyear']
                 )
 
                 if Path(input_dir, fut_file).is_file():
-                    # if true, calculate and save future hazard set:
+                    # if true, calculate future hazard set:
                     haz_fut, filename = calc_fut_haz_isimip(his_file, scenario,
                                                             file_props, hist_mean,
                                                             input_dir=input_dir,
                                                             bbox=bbox,
                                                             fut_file=fut_file)
-                    filename_list.append(filename)
-                    if save:
-                        haz_fut.select(reg_id=1)\
-                            .write_hdf5(str(Path(output_dir, 'Hazard', filename)))
-                    if return_data:
-                        output_list.append(haz_fut)
-                    else: output_list.append(None)
-
-                if scenario == 'rcp26': # also test for extended
-                    # check whether future file exists for given historical file and scenario:
-                    fut_file = '{}_{}_{}_{}_{}_{}_yield-{}-{}_{}_{}_{}.nc'.format(
-                        file_props[his_file]['ag_model'],
-                        file_props[his_file]['cl_model'],
-                        file_props[his_file]['bias_corr'],
-                        scenario,
-                        file_props[his_file]['soc'],
-                        file_props[his_file]['co2'],
-                        file_props[his_file]['crop'],
-                        file_props[his_file]['irr'],
-                        FN_STR_VAR,
-                        YEARCHUNKS['rcp26-2']['startyear'],
-                        YEARCHUNKS['rcp26-2']['endyear']
-                    )
-
-                    if Path(input_dir, fut_file).is_file():
-                        # if true, calculate and save future hazard set:
-                        haz_fut, filename = calc_fut_haz_isimip(his_file, scenario,
-                                                                file_props, hist_mean,
-                                                                input_dir=input_dir,
-                                                                bbox=bbox, fut_file=fut_file)
-                        filename_list.append(filename)
-                        if save:
-                            haz_fut.select(reg_id=1)\
-                                .write_hdf5(str(Path(output_dir, 'Hazard', filename)))
-                        if return_data:
-                            output_list.append(haz_fut)
-                        else: output_list.append(None)
+                    haz_list.append((filename, haz_fut))
 
-    # calculate mean hist_mean for each crop-irrigation combination and save as hdf5
-    # in output_dir (required for full exposure set preparation):
-    for combi_crop_irr in combi_crop_list:
-        mean = np.mean((hist_mean_per_crop[combi_crop_irr])['value'], 0)
-        mean_filename = ('hist_mean_' + combi_crop_irr + '_' + str(yearrange_mean[0]) +'-' +
-                         str(yearrange_mean[1]) + '.hdf5')
-        filename_list.append(mean_filename)
-        output_list.append(mean)
-
-    if save: # save hist_mean files to hdf5 file:
-        for idx, filename in enumerate(filename_list):
-            if 'hist_mean_' in filename:
-                mean_file = h5py.File(str(Path(output_dir, 'Hist_mean', filename)), 'w')
-                mean_file.create_dataset('mean', data=output_list[idx])
-                mean_file.create_dataset('lat', data=haz_his.centroids.lat)
-                mean_file.create_dataset('lon', data=haz_his.centroids.lon)
-                mean_file.close()
-
-    return filename_list, output_list
+    return hist_mean, haz_list
 
 def init_hazard_sets_isimip(filenames, input_dir=None, bbox=None, isimip_run=None,
                             yearrange_his=None, combine_subcrops=True):
@@ -740,16 +926,12 @@ def init_hazard_sets_isimip(filenames, input_dir=None, bbox=None, isimip_run=Non
         if f'{combi_crop}-{irr}' not in combi_crop_irr_list:
             combi_crop_irr_list.append(f'{combi_crop}-{irr}')
 
-    # generate hazard using the first file to determine the size of the historic mean
+    # read the grid of the first file to determine the size of the historic mean
     # file structure: ag_model _ cl_model _ scenario _ soc _ co2 _
     #   yield-crop-irr _ fn_str_var _ startyear _ endyear . nc
     #e.g. gepic_gfdl-esm2m_ewembi_historical_2005soc_co2_yield-whe-noirr_
     #   global_annual_1861_2005.nc
-    haz_dummy = RelativeCropyield()
-    haz_dummy.set_from_isimip_netcdf(input_dir=input_dir, filename=his_file_list[0], bbox=bbox,
-                                     scenario=file_props[his_file_list[0]]['scenario'],
-                                     yearrange=(file_props[his_file_list[0]]['startyear'],
-                                                file_props[his_file_list[0]]['endyear']))
+    _, centroids = read_isimip_grid(input_dir=input_dir, filename=his_file_list[0], bbox=bbox)
 
     # initiate the historic mean for each combination of crop and irrigation type
     # the idx keeps track of the row in which the hist_mean values are written per crop-irr to
@@ -760,7 +942,7 @@ def init_hazard_sets_isimip(filenames, input_dir=None, bbox=None, isimip_run=Non
         amount_crop_irr = sum((crop in s) and (irr in s) for s in his_file_list)
         hist_mean_per_crop[combi_crop_irr] = dict()
         hist_mean_per_crop[combi_crop_irr] = {
-            'value': np.zeros([amount_crop_irr, haz_dummy.intensity.shape[1]]),
+            'value': np.zeros([amount_crop_irr, centroids.size]),
             'idx': 0}
 
     return his_file_list, file_props, hist_mean_per_crop, scenario_list, \
@@ -828,14 +1010,9 @@ def calc_his_haz_isimip(his_file, file_props, input_dir=None, bbox=None,
             # into one combined crop wheat (whe):
             if crop == 'swh':
             # mask of winter wheat in spring wheat and vice versa:
-                whe_mask = read_wheat_mask_isimip3(input_dir=input_dir, bbox=bbox)
-                haz_his.intensity = sparse.csr_matrix(np.multiply(haz_his.intensity.todense(),
-                                                                  whe_mask.swh_mask.values.flatten()
-                                                                  )
-                                                      )
-                haz_his2.intensity = sparse.csr_matrix(
-                    np.multiply(haz_his2.intensity.todense(), whe_mask.wwh_mask.values.flatten()
-                                ))
+                swh_mask, wwh_mask = _read_wheat_mask_values(Path(input_dir), tuple(bbox))
+                haz_his.intensity = haz_his.intensity @ sparse.diags(swh_mask, format='csr')
+                haz_his2.intensity = haz_his2.intensity @ sparse.diags(wwh_mask, format='csr')
             # replace NaN by 0.0:
             haz_his.intensity.data[np.isnan(haz_his.intensity.data)] = 0.0
             haz_his2.intensity.data[np.isnan(haz_his2.intensity.data)] = 0.0
@@ -949,14 +1126,9 @@ def calc_fut_haz_isimip(his_file, scenario, file_props, hist_mean, input_dir=Non
                                             irr=file_props[his_file]['irr'])
             if crop == 'swh':
             # mask of winter wheat in spring wheat and vice versa:
-                whe_mask = read_wheat_mask_isimip3(input_dir=input_dir, bbox=bbox)
-                haz_fut.intensity = sparse.csr_matrix(np.multiply(haz_fut.intensity.todense(),
-                                                                  whe_mask.swh_mask.values.flatten()
-                                                                  )
-                                                      )
-                haz_fut2.intensity = sparse.csr_matrix(
-                    np.multiply(haz_fut2.intensity.todense(), whe_mask.wwh_mask.values.flatten()
-                                ))
+                swh_mask, wwh_mask = _read_wheat_mask_values(Path(input_dir), tuple(bbox))
+                haz_fut.intensity = haz_fut.intensity @ sparse.diags(swh_mask, format='csr')
+                haz_fut2.intensity = haz_fut2.intensity @ sparse.diags(wwh_mask, format='csr')
             # replace NaN by 0.0:
             haz_fut.intensity.data[np.isnan(haz_fut.intensity.data)] = 0.0
             haz_fut2.intensity.data[np.isnan(haz_fut2.intensity.data)] = 0.0
@@ -1002,6 +1174,112 @@ def read_wheat_mask_isimip3(input_dir=None, filename=None, bbox=None):
     [lonmin, latmin, lonmax, latmax] = bbox
     return whe_mask.sel(lon=slice(lonmin, lonmax), lat=slice(latmax, latmin))
 
+@functools.lru_cache(maxsize=8)
+def _read_wheat_mask_values(input_dir, bbox):
+    """Flattened ISIMIP3 masks for spring wheat (swh) and winter wheat (wwh)
+    within a bounding box, NaN set to 0. Cached per input_dir and bbox.
+
+    Parameters
+    ----------
+    input_dir : Path
+        path to directory containing the mask file
+    bbox : tuple
+        geogr. bounding box (lon min, lat min, lon max, lat max)
+
+    Returns
+    -------
+    swh_mask : np.array
+    wwh_mask : np.array
+    """
+    whe_mask = read_wheat_mask_isimip3(input_dir=input_dir, bbox=bbox)
+    return (np.nan_to_num(whe_mask.swh_mask.values.flatten()),
+            np.nan_to_num(whe_mask.wwh_mask.values.flatten()))
+
+def read_isimip_grid(input_dir=None, filename=None, bbox=None):
+    """Read the grid of a crop yield NetCDF file within a bounding box,
+    without reading any yield data.
+
+    Parameters
+    ----------
+    input_dir : Path or str
+        path to directory containing input file, default: INPUT_DIR
+    filename : str
+        name of crop yield NetCDF file
+    bbox : list of four floats
+        bounding box:
+        [lon min, lat min, lon max, lat max], default: BBOX
+
+    Returns
+    -------
+    shape : tuple(int, int)
+        number of latitudes and longitudes of the grid
+    centroids : Centroids
+        centroids of the grid, with meta and lat/lon set
+    """
+    if input_dir is None:
+        input_dir = Path(INPUT_DIR)
+    if bbox is None:
+        bbox = BBOX
+
+    with xr.open_dataset(Path(input_dir, filename), decode_times=False) as data_set:
+        data = _select_bbox(data_set, bbox)
+        centroids = _grid_centroids(data.lat.values, data.lon.values)
+    centroids.set_meta_to_lat_lon()
+    return (centroids.meta['height'], centroids.meta['width']), centroids
+
+def _read_isimip_yield(file_path, bbox, id_bands):
+    """Read the yield of selected years within a bounding box from a crop yield
+    NetCDF file. Only the selected slab is read from file, NaN are set to 0.
+
+    Parameters
+    ----------
+    file_path : Path
+        crop yield NetCDF file
+    bbox : list of four floats
+        bounding box:
+        [lon min, lat min, lon max, lat max]
+    id_bands : list(int)
+        years to read as indices of the time dimension, starting at 1
+
+    Returns
+    -------
+    intensity : sparse.csr_matrix
+        yield (years x grid cells)
+    centroids : Centroids
+        centroids of the grid, with meta set
+    """
+    with xr.open_dataset(file_path, decode_times=False) as data_set:
+        data = _select_bbox(data_set, bbox)
+        var_yield = [var for var in data.data_vars if data[var].ndim == 3][0]
+        values = data[var_yield].isel(time=np.array(id_bands) - 1).values
+        centroids = _grid_centroids(data.lat.values, data.lon.values)
+
+    values = np.nan_to_num(values.reshape(len(id_bands), -1).astype(float), nan=0.0)
+    return sparse.csr_matrix(values), centroids
+
+def _select_bbox(data_set, bbox):
+    """Lazily select the grid cells with center within a bounding box,
+    ordered north to south"""
+    [lonmin, latmin, lonmax, latmax] = bbox
+    if data_set.lat.size > 1 and data_set.lat.values[0] < data_set.lat.values[-1]:
+        return data_set.sel(lon=slice(lonmin, lonmax),
+                            lat=slice(latmin, latmax)).isel(lat=slice(None, None, -1))
+    return data_set.sel(lon=slice(lonmin, lonmax), lat=slice(latmax, latmin))
+
+def _grid_centroids(lat, lon):
+    """Raster centroids with meta of a regular grid given by its cell center coordinates"""
+    res_lon = lon[1] - lon[0] if lon.size > 1 else RESOLUTION
+    res_lat = lat[1] - lat[0] if lat.size > 1 else -RESOLUTION
+    centroids = Centroids()
+    centroids.meta = {
+        'width': lon.size,
+        'height': lat.size,
+        'crs': DEF_CRS,
+        'transform': Affine(res_lon, 0, lon[0] - res_lon / 2,
+                            0, res_lat, lat[0] - res_lat / 2),
+    }
+    return centroids
+
 def plot_comparing_maps(haz_his, haz_fut, axes=None, nr_cli_models=1, model=1):
     """Plots comparison maps of historic and future data and their difference fut-his
 
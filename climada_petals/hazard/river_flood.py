@@ -23,14 +23,15 @@ __all__ = ['RiverFlood']
 
 import logging
 import datetime as dt
-import copy
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 import scipy as sp
 import xarray as xr
 import pandas as pd
 import geopandas as gpd
-from rasterio.warp import Resampling
+import rasterio
+from rasterio.windows import Window
 from climada.util.constants import RIVER_FLOOD_REGIONS_CSV
 import climada.util.coordinates as u_coord
 from climada.hazard.base import Hazard
@@ -60,10 +61,10 @@ class RiverFlood(Hazard):
         average flooded area per year
     fla_ev_av : float
         average flooded area per event
-    fla_ann_centr : 2d array(n_years x n_centroids)
+    fla_ann_centr : sparse.csr_matrix(n_years x n_centroids)
         flooded area in
-        every centroid for every event
-    fla_ev_centr : 2d array(n_events x n_centroids)
+        every centroid for every year
+    fla_ev_centr : sparse.csr_matrix(n_events x n_centroids)
         flooded area in
         every centroid for every event
     """
@@ -126,22 +127,12 @@ class RiverFlood(Hazard):
             if ISINatIDGrid:
 
                 dest_centroids = RiverFlood._select_exact_area(countries, reg)[0]
-                meta_centroids = copy.copy(dest_centroids)
-                meta_centroids.set_lat_lon_to_meta()
-
-                self.set_raster(files_intensity=[dph_path],
-                                files_fraction=[frc_path], band=bands.tolist(),
-                                transform=meta_centroids.meta['transform'],
-                                width=meta_centroids.meta['width'],
-                                height=meta_centroids.meta['height'],
-                                resampling=Resampling.nearest)
-                x_i = ((dest_centroids.lon - self.centroids.meta['transform'][2]) /
-                       self.centroids.meta['transform'][0]).astype(int)
-                y_i = ((dest_centroids.lat - self.centroids.meta['transform'][5]) /
-                       self.centroids.meta['transform'][4]).astype(int)
-
-                fraction = self.fraction[:, y_i * self.centroids.meta['width'] + x_i]
-                intensity = self.intensity[:, y_i * self.centroids.meta['width'] + x_i]
+                intensity = self._read_raster_centroids(dph_path, bands.tolist(),
+                                                        dest_centroids.lat,
+                                                        dest_centroids.lon)
+                fraction = self._read_raster_centroids(frc_path, bands.tolist(),
+                                                       dest_centroids.lat,
+                                                       dest_centroids.lon)
 
                 self.centroids = dest_centroids
                 self.intensity = sp.sparse.csr_matrix(intensity)
@@ -193,18 +184,117 @@ class RiverFlood(Hazard):
             # else:
             if centroids.meta:
                 centroids.set_meta_to_lat_lon()
-            metafrc, fraction = u_coord.read_raster(frc_path, band=bands.tolist())
-            metaint, intensity = u_coord.read_raster(dph_path, band=bands.tolist())
-            x_i = ((centroids.lon - metafrc['transform'][2]) /
-                   metafrc['transform'][0]).astype(int)
-            y_i = ((centroids.lat - metafrc['transform'][5]) /
-                   metafrc['transform'][4]).astype(int)
-            fraction = fraction[:, y_i * metafrc['width'] + x_i]
-            intensity = intensity[:, y_i * metaint['width'] + x_i]
+            fraction = self._read_raster_centroids(frc_path, bands.tolist(),
+                                                   centroids.lat, centroids.lon)
+            intensity = self._read_raster_centroids(dph_path, bands.tolist(),
+                                                    centroids.lat, centroids.lon)
             self.centroids = centroids
             self.intensity = sp.sparse.csr_matrix(intensity)
             self.fraction = sp.sparse.csr_matrix(fraction)
 
+        self._set_events(dph_path, frc_path, time[event_index], years, origin)
+
+    @classmethod
+    def from_nc_files(cls, file_pairs, centroids=None, countries=None, reg=None,
+                      origin=False, years=None, concat=True, max_workers=None):
+        """Read several pairs of flood depth and fraction files on the same
+        grid at the same point centroids. The mapping of the centroids to the
+        raster pixels is computed once for all files and only the pixel window
+        covering the centroids is read.
+
+        Parameters
+        ----------
+        file_pairs : list(tuple(str, str))
+            (flood depth file, flood fraction file) for every model run
+        centroids : Centroids, optional
+            centroids to extract
+        countries : list of countries ISO3, optional
+            countries of the ISIMIP NatID grid centroids to extract, if no
+            centroids are given (reg must be None!)
+        reg : list of regions, optional
+            regions of the ISIMIP NatID grid centroids to extract, if no
+            centroids and no countries are given
+        origin : bool, optional
+            Historical or probabilistic event. Default: False
+        years : int list, optional
+            years that are considered. Default: [2000]
+        concat : bool, optional
+            If True, return one hazard with the events of all files.
+            Otherwise, return a generator of one hazard per file pair.
+            Default: True
+        max_workers : int, optional
+            number of threads reading the bands of a file concurrently.
+            Default: None, bands are read sequentially
+
+        Raises
+        ------
+        NameError, ValueError
+
+        Returns
+        -------
+        RiverFlood or generator(RiverFlood)
+        """
+        if years is None:
+            years = [2000]
+        for dph_path, frc_path in file_pairs:
+            for path in (dph_path, frc_path):
+                if not Path(path).exists():
+                    raise NameError('Invalid flood-file path %s' % path)
+        if centroids is None:
+            if not (countries or reg):
+                raise ValueError('Either centroids, countries or reg must be given.')
+            centroids = cls._select_exact_area(countries, reg)[0]
+        elif centroids.meta:
+            centroids.set_meta_to_lat_lon()
+
+        window, idx = cls._raster_window(file_pairs[0][0], centroids.lat, centroids.lon)
+        haz_gen = (cls._from_nc_window(dph_path, frc_path, centroids, window, idx,
+                                       years, origin, max_workers)
+                   for dph_path, frc_path in file_pairs)
+        if concat:
+            return cls.concat(list(haz_gen))
+        return haz_gen
+
+    @classmethod
+    def _from_nc_window(cls, dph_path, frc_path, centroids, window, idx, years,
+                        origin, max_workers):
+        """Read one pair of flood depth and fraction files at precomputed
+        window indices, see from_nc_files.
+
+        Returns
+        -------
+        RiverFlood
+        """
+        haz = cls()
+        with xr.open_dataset(dph_path) as flood_dph:
+            time = flood_dph.time.data
+        event_index = haz._select_event(time, years)
+        bands = (event_index + 1).tolist()
+
+        haz.centroids = centroids
+        haz.intensity = sp.sparse.csr_matrix(
+            cls._read_raster_window(dph_path, bands, window, idx, max_workers))
+        haz.fraction = sp.sparse.csr_matrix(
+            cls._read_raster_window(frc_path, bands, window, idx, max_workers))
+        haz._set_events(dph_path, frc_path, time[event_index], years, origin)
+        return haz
+
+    def _set_events(self, dph_path, frc_path, event_time, years, origin):
+        """Set units, tag and event attributes of the selected events
+
+        Parameters
+        ----------
+        dph_path : string
+            Flood file read (depth)
+        frc_path : string
+            Flood file read (fraction)
+        event_time : np.array(datetime64)
+            time stamps of the selected events
+        years : int list
+            years that are considered
+        origin : bool
+            Historical or probabilistic event
+        """
         self.units = 'm'
         self.tag.file_name = str(dph_path) + ';' + str(frc_path)
         self.event_id = np.arange(self.intensity.shape[0])
@@ -217,11 +307,8 @@ class RiverFlood(Hazard):
 
         self.frequency = np.ones(self.size) / self.size
 
-        with xr.open_dataset(dph_path) as flood_dph:
-            self.date = np.array([dt.datetime(flood_dph.time[i].dt.year,
-                                              flood_dph.time[i].dt.month,
-                                              flood_dph.time[i].dt.day).toordinal()
-                                  for i in event_index])
+        self.date = np.asarray(event_time).astype('datetime64[D]').astype(np.int64) \
+            + dt.date(1970, 1, 1).toordinal()
 
     def _select_event(self, time, years):
         """
@@ -262,27 +349,17 @@ class RiverFlood(Hazard):
         """
         if not Path(fld_trend_path).exists():
             raise NameError('Invalid ReturnLevel-file path %s' % fld_trend_path)
-        else:
-            metafrc, trend_data = u_coord.read_raster(fld_trend_path, band=[1])
-            x_i = ((self.centroids.lon - metafrc['transform'][2]) /
-                   metafrc['transform'][0]).astype(int)
-            y_i = ((self.centroids.lat - metafrc['transform'][5]) /
-                   metafrc['transform'][4]).astype(int)
 
-        trend = trend_data[:, y_i * metafrc['width'] + x_i]
+        trend = self._read_raster_centroids(fld_trend_path, [1], self.centroids.lat,
+                                            self.centroids.lon)[0]
 
         if dis == 'pos':
             dis_map = np.greater(trend, 0)
         else:
             dis_map = np.less(trend, 0)
 
-        new_trends = dis_map.astype(int)
-
-        new_intensity = np.multiply(self.intensity.todense(), new_trends)
-        new_fraction = np.multiply(self.fraction.todense(), new_trends)
-
-        self.intensity = sp.sparse.csr_matrix(new_intensity)
-        self.fraction = sp.sparse.csr_matrix(new_fraction)
+        self.intensity = self._mask_columns(self.intensity, dis_map)
+        self.fraction = self._mask_columns(self.fraction, dis_map)
 
     def exclude_returnlevel(self, frc_path):
         """
@@ -298,17 +375,15 @@ class RiverFlood(Hazard):
 
         if not Path(frc_path).exists():
             raise NameError('Invalid ReturnLevel-file path %s' % frc_path)
-        else:
-            metafrc, fraction = u_coord.read_raster(frc_path, band=[1])
-            x_i = ((self.centroids.lon - metafrc['transform'][2]) /
-                   metafrc['transform'][0]).astype(int)
-            y_i = ((self.centroids.lat - metafrc['transform'][5]) /
-                   metafrc['transform'][4]).astype(int)
-            fraction = fraction[:, y_i * metafrc['width'] + x_i]
-            new_fraction = np.array(np.subtract(self.fraction.todense(),
-                                                fraction))
-            new_fraction = new_fraction.clip(0)
-            self.fraction = sp.sparse.csr_matrix(new_fraction)
+
+        fraction = self._read_raster_centroids(frc_path, [1], self.centroids.lat,
+                                               self.centroids.lon)[0]
+        # only stored entries can remain positive after clipping
+        new_fraction = sp.sparse.csr_matrix(self.fraction, dtype=float, copy=True)
+        new_fraction.data = np.clip(new_fraction.data - fraction[new_fraction.indices],
+                                    0, None)
+        new_fraction.eliminate_zeros()
+        self.fraction = new_fraction
 
     def set_flooded_area(self, save_centr=False):
         """
@@ -326,15 +401,10 @@ class RiverFlood(Hazard):
         years = np.unique(event_years)
         year_ev_mk = self._annual_event_mask(event_years, years)
 
-        fla_ann_centr = np.zeros((len(years), len(self.centroids.lon)))
-        fla_ev_centr = np.array(np.multiply(self.fraction.todense(),
-                                            area_centr))
-        self.fla_event = np.sum(fla_ev_centr, axis=1)
-        for year_ind in range(len(years)):
-            fla_ann_centr[year_ind, :] =\
-                np.sum(fla_ev_centr[year_ev_mk[year_ind, :], :],
-                       axis=0)
-        self.fla_annual = np.sum(fla_ann_centr, axis=1)
+        fla_ev_centr = sp.sparse.csr_matrix(self.fraction) @ sp.sparse.diags(area_centr)
+        fla_ann_centr = year_ev_mk @ fla_ev_centr
+        self.fla_event = np.asarray(fla_ev_centr.sum(axis=1)).ravel()
+        self.fla_annual = np.asarray(fla_ann_centr.sum(axis=1)).ravel()
         self.fla_ann_av = np.mean(self.fla_annual)
         self.fla_ev_av = np.mean(self.fla_event)
         if save_centr:
@@ -344,15 +414,22 @@ class RiverFlood(Hazard):
     def _annual_event_mask(self, event_years, years):
         """Assignes events to each year
 
+        Parameters
+        ----------
+        event_years : int array
+            year of every event
+        years : int array
+            sorted unique years
+
         Returns
         -------
-        bool array (columns contain events, rows contain years)
+        sparse.csr_matrix of bool (columns contain events, rows contain years)
         """
-        event_mask = np.full((len(years), len(event_years)), False, dtype=bool)
-        for year_ind, year in enumerate(years):
-            events = np.where(event_years == year)[0]
-            event_mask[year_ind, events] = True
-        return event_mask
+        n_events = len(event_years)
+        year_ind = np.searchsorted(years, event_years)
+        return sp.sparse.csr_matrix((np.ones(n_events, dtype=bool),
+                                     (year_ind, np.arange(n_events))),
+                                    shape=(len(years), n_events))
 
     def set_flood_volume(self, save_centr=False):
         """Calculates flooded area for hazard. sets yearly flooded area and
@@ -363,11 +440,117 @@ class RiverFlood(Hazard):
         MemoryError
         """
 
-        fv_ann_centr = np.multiply(self.fla_ann_centr.todense(), self.intensity.todense())
+        fv_ann_centr = sp.sparse.csr_matrix(self.fla_ann_centr).multiply(self.intensity)
 
         if save_centr:
-            self.fv_ann_centr = sp.sparse.csr_matrix(self.fla_ann_centr)
-        self.fv_annual = np.sum(fv_ann_centr, axis=1)
+            self.fv_ann_centr = sp.sparse.csr_matrix(fv_ann_centr)
+        self.fv_annual = fv_ann_centr.sum(axis=1)
+
+    @staticmethod
+    def _read_raster_centroids(file_path, bands, lat, lon):
+        """Read the raster values at the pixels containing the given
+        coordinates. Only the minimal pixel window covering all coordinates
+        is read from file.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            raster file to read
+        bands : list(int)
+            bands to read, starting at 1
+        lat : np.array
+            latitudes of the points
+        lon : np.array
+            longitudes of the points
+
+        Returns
+        -------
+        np.array (n_bands x n_points)
+        """
+        window, idx = RiverFlood._raster_window(file_path, lat, lon)
+        return RiverFlood._read_raster_window(file_path, bands, window, idx)
+
+    @staticmethod
+    def _raster_window(file_path, lat, lon):
+        """Compute the minimal pixel window of a raster covering the given
+        coordinates.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            raster file
+        lat : np.array
+            latitudes of the points
+        lon : np.array
+            longitudes of the points
+
+        Returns
+        -------
+        window : rasterio.windows.Window
+            pixel window covering all points
+        idx : np.array
+            index of every point in the flattened window
+        """
+        with rasterio.open(file_path) as src:
+            transform = src.transform
+        x_i = ((lon - transform[2]) / transform[0]).astype(int)
+        y_i = ((lat - transform[5]) / transform[4]).astype(int)
+        col_off, row_off = x_i.min(), y_i.min()
+        width = x_i.max() - col_off + 1
+        window = Window(col_off, row_off, width, y_i.max() - row_off + 1)
+        return window, (y_i - row_off) * width + x_i - col_off
+
+    @staticmethod
+    def _read_raster_window(file_path, bands, window, idx, max_workers=None):
+        """Read bands of a raster window at given indices of the flattened
+        window.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            raster file to read
+        bands : list(int)
+            bands to read, starting at 1
+        window : rasterio.windows.Window
+            pixel window to read
+        idx : np.array
+            indices to extract from the flattened window
+        max_workers : int, optional
+            number of threads reading the bands concurrently.
+            Default: None, bands are read sequentially
+
+        Returns
+        -------
+        np.array (n_bands x n_points)
+        """
+        def read_bands(sel_bands):
+            return u_coord.read_raster(file_path, band=sel_bands, window=window)[1][:, idx]
+
+        if not max_workers or max_workers < 2 or len(bands) < 2:
+            return read_bands(bands)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return np.vstack(list(executor.map(lambda band: read_bands([band]), bands)))
+
+    @staticmethod
+    def _mask_columns(matrix, col_mask):
+        """Set the entries of all columns outside of a mask to zero. Only the
+        stored entries of the sparse matrix are processed.
+
+        Parameters
+        ----------
+        matrix : sparse.csr_matrix
+            matrix to mask (events x centroids)
+        col_mask : bool array
+            True for the columns to keep
+
+        Returns
+        -------
+        sparse.csr_matrix
+        """
+        matrix = sp.sparse.csr_matrix(matrix, copy=True)
+        matrix.data[~col_mask[matrix.indices]] = 0
+        matrix.eliminate_zeros()
+        return matrix
 
     @staticmethod
     def _select_exact_area(countries=None, reg=None):
@@ -20,6 +20,7 @@ Tests on Drought Hazard"""
 
 
 import unittest
+import numpy as np
 
 from climada_petals.hazard.drought import Drought
 
@@ -38,6 +39,25 @@ class TestReader(unittest.TestCase):
         self.assertEqual(hazard_set.centroids.size, 130)
         self.assertEqual(hazard_set.intensity[112, 111], -1.6286273002624512)
 
+    def test_blocks(self):
+        """Test that processing the area in latitude blocks gives the same hazard"""
+        drought = Drought()
+        drought.set_area(44.5, 5, 50, 12)
+        hazard_set = drought.setup()
+
+        drought_blocks = Drought()
+        drought_blocks.set_area(44.5, 5, 50, 12)
+        hazard_blocks = drought_blocks.setup(n_blocks=4)
+
+        self.assertEqual(hazard_blocks.size, hazard_set.size)
+        np.testing.assert_array_equal(hazard_blocks.centroids.lat, hazard_set.centroids.lat)
+        np.testing.assert_array_equal(hazard_blocks.centroids.lon, hazard_set.centroids.lon)
+        np.testing.assert_array_equal(hazard_blocks.intensity.toarray(),
+                                      hazard_set.intensity.toarray())
+        np.testing.assert_array_equal(hazard_blocks.date_start.toarray(),
+                                      hazard_set.date_start.toarray())
+        np.testing.assert_array_equal(hazard_blocks.date_end, hazard_set.date_end)
+
 # Execute Tests
 if __name__ == "__main__":
     TESTS = unittest.TestLoader().loadTestsFromTestCase(TestReader)
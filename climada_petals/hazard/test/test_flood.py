@@ -21,6 +21,8 @@ Test flood module.
 import unittest
 import datetime as dt
 import numpy as np
+from scipy import sparse
+import climada.util.coordinates as u_coord
 from climada.hazard.centroids import Centroids
 from climada_petals.hazard.river_flood import RiverFlood
 from climada_petals.util.constants import HAZ_DEMO_FLDDPH, HAZ_DEMO_FLDFRC
@@ -179,6 +181,34 @@ class TestRiverFlood(unittest.TestCase):
         self.assertEqual(np.argmin(rf.fraction), 0, 4)
         self.assertEqual(np.argmax(rf.fraction), 1438, 4)
 
+    def test_from_nc_files(self):
+        rand_centroids = Centroids()
+        lat = np.arange(47, 56, 0.2)
+        lon = np.arange(5, 15, 0.2)
+        lon, lat = np.meshgrid(lon, lat)
+        rand_centroids.set_lat_lon(lat.flatten(), lon.flatten())
+        rf = RiverFlood()
+        rf.set_from_nc(dph_path=HAZ_DEMO_FLDDPH, frc_path=HAZ_DEMO_FLDFRC,
+                       centroids=rand_centroids)
+
+        file_pairs = [(HAZ_DEMO_FLDDPH, HAZ_DEMO_FLDFRC)] * 2
+        rf_gen = RiverFlood.from_nc_files(file_pairs, centroids=rand_centroids,
+                                          concat=False, max_workers=2)
+        rf_list = list(rf_gen)
+        self.assertEqual(len(rf_list), 2)
+        for rf_batch in rf_list:
+            self.assertEqual(rf_batch.date[0], 730303)
+            self.assertEqual(rf_batch.event_name[0], '2000')
+            np.testing.assert_array_equal(rf_batch.intensity.toarray(),
+                                          rf.intensity.toarray())
+            np.testing.assert_array_equal(rf_batch.fraction.toarray(),
+                                          rf.fraction.toarray())
+
+        rf_concat = RiverFlood.from_nc_files(file_pairs, centroids=rand_centroids)
+        self.assertEqual(rf_concat.intensity.shape, (2, 2250))
+        self.assertEqual(rf_concat.fraction.shape, (2, 2250))
+        np.testing.assert_array_equal(rf_concat.date, [730303, 730303])
+
     def test_meta_centroids_flood(self):
         min_lat, max_lat, min_lon, max_lon = 45.7, 47.8, 7.5, 10.5
         cent = Centroids()
@@ -265,6 +295,33 @@ class TestRiverFlood(unittest.TestCase):
         self.assertAlmostEqual(testRFset.fla_ev_av,
                                2463979258.8144045, 3)
 
+    def test_read_raster_centroids(self):
+        lat = np.array([47.2, 47.8, 52.1, 54.9])
+        lon = np.array([8.3, 13.1, 6.7, 9.9])
+        values = RiverFlood._read_raster_centroids(HAZ_DEMO_FLDFRC, [1], lat, lon)
+
+        meta, full = u_coord.read_raster(HAZ_DEMO_FLDFRC, band=[1])
+        x_i = ((lon - meta['transform'][2]) / meta['transform'][0]).astype(int)
+        y_i = ((lat - meta['transform'][5]) / meta['transform'][4]).astype(int)
+        self.assertEqual(values.shape, (1, 4))
+        np.testing.assert_array_equal(values, full[:, y_i * meta['width'] + x_i])
+
+    def test_annual_event_mask(self):
+        event_years = np.array([2000, 2002, 2000, 2001])
+        mask = RiverFlood()._annual_event_mask(event_years, np.unique(event_years))
+        np.testing.assert_array_equal(mask.toarray(),
+                                      [[True, False, True, False],
+                                       [False, False, False, True],
+                                       [False, True, False, False]])
+
+    def test_mask_columns(self):
+        matrix = sparse.csr_matrix(np.array([[0., 1., 2.], [3., 0., 4.]]))
+        masked = RiverFlood._mask_columns(matrix, np.array([True, False, True]))
+        np.testing.assert_array_equal(masked.toarray(), [[0., 0., 2.], [3., 0., 4.]])
+        self.assertEqual(masked.nnz, 3)
+        # input is not modified
+        self.assertEqual(matrix.nnz, 4)
+
     def test_select_events(self):
         testRFTime = RiverFlood()
         tt1 = dt.datetime.strptime('1988-07-02', '%Y-%m-%d')
@@ -19,8 +19,21 @@ with CLIMADA. If not, see <https://www.gnu.org/licenses/>.
 Test crop potential module.
 """
 import unittest
+import tempfile
+import shutil
+from pathlib import Path
 import numpy as np
-from climada_petals.hazard.relative_cropyield import RelativeCropyield
+from scipy import sparse
+import h5py
+import xarray as xr
+from pathos.pools import ProcessPool as Pool
+from climada_petals.hazard.relative_cropyield import (RelativeCropyield, read_isimip_grid,
+                                                      write_centroids_hdf5, CENTROIDS_FILE,
+                                                      set_multiple_rc_from_isimip,
+                                                      calc_his_haz_isimip,
+                                                      read_wheat_mask_isimip3,
+                                                      _read_wheat_mask_values)
+from climada import CONFIG
 from climada.util.constants import DEMO_DIR as INPUT_DIR
 
 FN_STR_DEMO = 'annual_FR_DE_DEMO'
@@ -52,6 +65,33 @@ class TestRelativeCropyield(unittest.TestCase):
         self.assertEqual(haz.event_id.size, 5)
         self.assertAlmostEqual(haz.intensity.max(), 10.176164, places=5)
 
+    def test_read_isimip_grid(self):
+        """Test reading the grid of a crop yield file without reading the data"""
+        filename = ('lpjml_ipsl-cm5a-lr_ewembi_historical_2005soc_co2_yield-whe-noirr_'
+                    'annual_FR_DE_DEMO_1861_2005.nc')
+        haz = RelativeCropyield()
+        haz.set_from_isimip_netcdf(input_dir=INPUT_DIR, yearrange=(2001, 2005), ag_model='lpjml',
+                                   cl_model='ipsl-cm5a-lr', scenario='historical', soc='2005soc',
+                                   co2='co2', crop='whe', irr='noirr', fn_str_var=FN_STR_DEMO,
+                                   bbox=[0, 42, 10, 52])
+        shape, centroids = read_isimip_grid(input_dir=INPUT_DIR, filename=filename,
+                                            bbox=[0, 42, 10, 52])
+
+        self.assertEqual(shape, (20, 20))
+        self.assertEqual(centroids.size, haz.centroids.size)
+        np.testing.assert_array_equal(centroids.lat, haz.centroids.lat)
+        np.testing.assert_array_equal(centroids.lon, haz.centroids.lon)
+
+        # values of the former set_raster reading with the bbox as geometry
+        self.assertEqual((centroids.lat[0], centroids.lon[0]), (51.75, 0.25))
+        self.assertEqual((centroids.lat[-1], centroids.lon[-1]), (42.25, 9.75))
+        self.assertEqual(haz.intensity.shape, (5, 400))
+        self.assertEqual(haz.intensity[0].nnz, 364)
+        self.assertAlmostEqual(haz.intensity.max(), 9.803154, places=5)
+        self.assertAlmostEqual(haz.intensity[0, 0], 5.834895, places=5)
+        self.assertAlmostEqual(haz.intensity[2, 190], 6.957053, places=5)
+        self.assertAlmostEqual(haz.intensity[4, 399], 0.823847, places=5)
+
     def test_set_rel_yield(self):
         """Test setting intensity to relativ yield"""
         haz = RelativeCropyield()
@@ -85,6 +125,149 @@ class TestRelativeCropyield(unittest.TestCase):
         self.assertAlmostEqual(haz.intensity.min(), 0.2, places=5)
         self.assertAlmostEqual(haz.intensity.data[10], 0.6, places=5)
 
+    def test_set_percentile_to_int_reference(self):
+        """Test setting intensity to percentile of the yield within a reference"""
+        haz = RelativeCropyield()
+        haz.set_from_isimip_netcdf(input_dir=INPUT_DIR, yearrange=(2001, 2005), ag_model='lpjml',
+                                cl_model='ipsl-cm5a-lr', scenario='historical', soc='2005soc',
+                                co2='co2', crop='whe', irr='noirr', fn_str_var=FN_STR_DEMO)
+        haz_ref = haz.select(event_names=['2001', '2002', '2003'])
+        haz_self = haz.select(event_names=['2001', '2002', '2003'])
+
+        haz_self.set_percentile_to_int(chunk_size=100)
+        haz_ref.set_percentile_to_int(reference_intensity=haz_ref.intensity)
+        np.testing.assert_allclose(haz_ref.intensity.toarray(), haz_self.intensity.toarray())
+
+        haz.set_percentile_to_int(reference_intensity=haz.select(event_names=['2001']).intensity)
+        self.assertEqual(haz.intensity.shape, (5, 1092))
+        # every value is above or equal to the single reference value of the first event
+        np.testing.assert_array_equal(haz.intensity[0].toarray(), 1.0)
+        self.assertTrue(np.all(haz.intensity.data == 1.0))
+
+    def test_write_read_compact_hdf5(self):
+        """Test writing a hazard as compact hdf5 and reading selected years"""
+        haz = RelativeCropyield()
+        haz.set_from_isimip_netcdf(input_dir=INPUT_DIR, yearrange=(2001, 2005), ag_model='lpjml',
+                                   cl_model='ipsl-cm5a-lr', scenario='historical', soc='2005soc',
+                                   co2='co2', crop='whe', irr='noirr', fn_str_var=FN_STR_DEMO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_centroids_hdf5(haz.centroids.lat, haz.centroids.lon,
+                                 Path(tmp_dir, CENTROIDS_FILE))
+            haz.write_compact_hdf5(Path(tmp_dir, 'haz.hdf5'), centroids_file=CENTROIDS_FILE)
+            haz_all = RelativeCropyield().read_compact_hdf5(Path(tmp_dir, 'haz.hdf5'))
+            haz_sel = RelativeCropyield().read_compact_hdf5(Path(tmp_dir, 'haz.hdf5'),
+                                                            years=[2002, 2004])
+
+        self.assertEqual(haz_all.crop, 'whe')
+        self.assertEqual(haz_all.intensity.shape, (5, 1092))
+        np.testing.assert_allclose(haz_all.intensity.toarray(), haz.intensity.toarray(),
+                                   rtol=1e-6)
+        np.testing.assert_array_equal(haz_all.centroids.lat, haz.centroids.lat)
+        self.assertListEqual(haz_sel.event_name, ['2002', '2004'])
+        np.testing.assert_allclose(haz_sel.intensity.toarray(),
+                                   haz.intensity[[1, 3]].toarray(), rtol=1e-6)
+        np.testing.assert_array_equal(haz_sel.date, haz.date[[1, 3]])
+
+    def test_wheat_mask(self):
+        """Test combining wheat sub-crops with the sparse masks against the dense
+        multiplication"""
+        bbox = [0, 42, 10, 52]
+        filename = ('lpjml_ipsl-cm5a-lr_ewembi_historical_2005soc_co2_yield-whe-noirr_'
+                    'annual_FR_DE_DEMO_1861_2005.nc')
+        his_file = filename.replace('-whe-', '-swh-')
+        his_file2 = filename.replace('-whe-', '-wwh-')
+        file_props = {his_file: {'ag_model': 'lpjml', 'cl_model': 'ipsl-cm5a-lr',
+                                 'scenario': 'historical', 'soc': '2005soc', 'co2': 'co2',
+                                 'crop': 'swh', 'irr': 'noirr', 'startyear': 2001,
+                                 'endyear': 2005, 'combi_crop': 'whe',
+                                 'combi_crop_irr': 'whe-noirr'}}
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            shutil.copy(Path(INPUT_DIR, filename), Path(tmp_dir, his_file))
+            # sub-crops with different yields and masks on their grid, with some NaN
+            with xr.open_dataset(Path(INPUT_DIR, filename), decode_times=False) as data:
+                (data * 2).to_netcdf(Path(tmp_dir, his_file2))
+                swh = rng.integers(0, 2, (data.lat.size, data.lon.size)).astype(float)
+                swh[::5, ::3] = np.nan
+                masks = xr.Dataset({'swh_mask': (('lat', 'lon'), swh),
+                                    'wwh_mask': (('lat', 'lon'), 1 - swh)},
+                                   coords={'lat': data.lat.values, 'lon': data.lon.values})
+            masks.to_netcdf(Path(tmp_dir,
+                                 CONFIG.hazard.relative_cropyield.filename_wheat_mask.str()))
+
+            _read_wheat_mask_values.cache_clear()
+            haz_his, _, _ = calc_his_haz_isimip(his_file, file_props, input_dir=Path(tmp_dir),
+                                                bbox=bbox, yearrange_mean=(2001, 2005))
+            swh_mask, _ = _read_wheat_mask_values(Path(tmp_dir), tuple(bbox))
+            self.assertEqual(_read_wheat_mask_values.cache_info().hits, 1)
+            self.assertIs(_read_wheat_mask_values(Path(tmp_dir), tuple(bbox))[0], swh_mask)
+            _read_wheat_mask_values.cache_clear()
+
+            # former combination with dense multiplications
+            haz_sub = []
+            with read_wheat_mask_isimip3(input_dir=Path(tmp_dir), bbox=bbox) as whe_mask:
+                for sub_file, mask in [(his_file, whe_mask.swh_mask),
+                                       (his_file2, whe_mask.wwh_mask)]:
+                    haz = RelativeCropyield()
+                    haz.set_from_isimip_netcdf(input_dir=Path(tmp_dir), filename=sub_file,
+                                               bbox=bbox, scenario='historical',
+                                               yearrange=np.array([2001, 2005]))
+                    haz.intensity = sparse.csr_matrix(np.multiply(haz.intensity.todense(),
+                                                                  mask.values.flatten()))
+                    haz.intensity.data[np.isnan(haz.intensity.data)] = 0.0
+                    haz_sub.append(haz)
+        haz_exp = haz_sub[0]
+        haz_exp.intensity = haz_sub[0].intensity + haz_sub[1].intensity
+        haz_exp.set_rel_yield_to_int(haz_exp.calc_mean((2001, 2005)))
+
+        self.assertEqual(haz_his.crop, 'whe')
+        self.assertIsInstance(haz_his.intensity, sparse.csr_matrix)
+        np.testing.assert_allclose(haz_his.intensity.toarray(), haz_exp.intensity.toarray())
+
+    def test_set_multiple_rc_from_isimip_pool(self):
+        """Test that the hazard sets computed in a pool are written as computed serially"""
+        filename = ('lpjml_ipsl-cm5a-lr_ewembi_historical_2005soc_co2_yield-whe-noirr_'
+                    'annual_FR_DE_DEMO_1861_2005.nc')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_dir = Path(tmp_dir, 'Input')
+            input_dir.mkdir()
+            shutil.copy(Path(INPUT_DIR, filename), input_dir)
+            # a second historical file with different yields
+            with xr.open_dataset(Path(INPUT_DIR, filename), decode_times=False) as data:
+                (data * 2).to_netcdf(Path(input_dir, filename.replace('-whe-', '-mai-')))
+
+            pool = Pool(nodes=2)
+            try:
+                for name, run_pool in [('serial', None), ('pool', pool)]:
+                    Path(tmp_dir, name).mkdir()
+                    set_multiple_rc_from_isimip(input_dir=input_dir,
+                                                output_dir=Path(tmp_dir, name),
+                                                bbox=[0, 42, 10, 52],
+                                                yearrange_his=(2001, 2005),
+                                                yearrange_mean=(2001, 2005), pool=run_pool)
+            finally:
+                pool.close()
+                pool.join()
+                pool.clear()
+
+            files = sorted(path.relative_to(Path(tmp_dir, 'serial'))
+                           for path in Path(tmp_dir, 'serial').rglob('*.hdf5'))
+            self.assertEqual(len(files), 4)
+            self.assertListEqual(files, sorted(path.relative_to(Path(tmp_dir, 'pool'))
+                                               for path in Path(tmp_dir, 'pool').rglob('*.hdf5')))
+            for file in files:
+                with h5py.File(Path(tmp_dir, 'serial', file), 'r') as serial, \
+                        h5py.File(Path(tmp_dir, 'pool', file), 'r') as parallel:
+                    names = []
+                    serial.visit(names.append)
+                    parallel_names = []
+                    parallel.visit(parallel_names.append)
+                    self.assertListEqual(names, parallel_names)
+                    for name in names:
+                        if isinstance(serial[name], h5py.Dataset):
+                            np.testing.assert_array_equal(serial[name][()],
+                                                          parallel[name][()])
+
 # Execute Tests
 if __name__ == "__main__":
     TESTS = unittest.TestLoader().loadTestsFromTestCase(TestRelativeCropyield)
@@ -0,0 +1,294 @@
+"""
+This file is part of CLIMADA.
+
+Copyright (C) 2017 ETH Zurich, CLIMADA contributors listed in AUTHORS.
+
+CLIMADA is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free
+Software Foundation, version 3.
+
+CLIMADA is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with CLIMADA. If not, see <https://www.gnu.org/licenses/>.
+
+---
+
+Coordinate utilities complementing climada.util.coordinates.
+"""
+
+__all__ = [
+    'grid_keys',
+    'grid_residual',
+    'match_grid_points',
+    'grid_country_code',
+    'grid_on_land',
+]
+
+import functools
+import logging
+import os
+
+import numpy as np
+from cartopy.io import shapereader
+
+import climada.util.coordinates as u_coord
+from climada.util.constants import SYSTEM_DIR
+from climada_petals._version import __version__
+
+LOGGER = logging.getLogger(__name__)
+
+GRID_CACHE_MAX_SIZE = 360 * 720
+"""Maximal number of cells of a global grid for which country codes and land mask
+are cached (0.5 degree), finer grids are computed on the fly for the given points"""
+
+GRID_CACHE_VERSION = 1
+"""Version of the cached country codes and land mask, to be increased whenever their
+computation changes"""
+
+
+def grid_keys(lat, lon, res, origin=(0.0, 0.0)):
+    """Integer key of each point on a regular grid.
+
+    Points closer than half the resolution to the same grid node share the
+    same key, which makes the keys robust to floating point noise in the
+    coordinates. Use `grid_residual` to check that points are on the grid.
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the points
+    res : float or tuple(float, float)
+        grid resolution (in lat and lon direction if tuple)
+    origin : tuple(float, float), optional
+        (lat, lon) of any node of the grid. Default: (0, 0)
+
+    Returns
+    -------
+    keys : np.array of int64
+    """
+    res_lat, res_lon = (res, res) if np.isscalar(res) else res
+    lat_i = np.round((np.asarray(lat, dtype=float) - origin[0]) / res_lat).astype(np.int64)
+    lon_i = np.round((np.asarray(lon, dtype=float) - origin[1]) / res_lon).astype(np.int64)
+    # shift to non-negative indices and combine row and column index into one key
+    n_lon = int(np.ceil(360 / res_lon)) + 1
+    n_lat = int(np.ceil(180 / res_lat)) + 1
+    return (lat_i + n_lat) * (3 * n_lon) + (lon_i + n_lon)
+
+def grid_residual(lat, lon, res, origin=(0.0, 0.0)):
+    """Distance of each point to the nearest grid node, in units of the resolution
+    (maximum of lat and lon direction).
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the points
+    res : float or tuple(float, float)
+        grid resolution (in lat and lon direction if tuple)
+    origin : tuple(float, float), optional
+        (lat, lon) of any node of the grid. Default: (0, 0)
+
+    Returns
+    -------
+    residual : np.array
+    """
+    res_lat, res_lon = (res, res) if np.isscalar(res) else res
+    lat_f = (np.asarray(lat, dtype=float) - origin[0]) / res_lat
+    lon_f = (np.asarray(lon, dtype=float) - origin[1]) / res_lon
+    return np.maximum(np.abs(lat_f - np.round(lat_f)), np.abs(lon_f - np.round(lon_f)))
+
+def match_grid_points(lat, lon, lat_ref, lon_ref, res=None, tol=1e-3):
+    """Index of each point in a set of reference points on the same grid.
+
+    The points are joined on integer grid keys (see `grid_keys`) with a sorted
+    search instead of comparing every point with every reference point. If a
+    coordinate appears several times in the reference, the first occurrence is
+    returned. Coordinates must coincide up to `tol` times the resolution.
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the points to locate
+    lat_ref, lon_ref : np.array
+        coordinates of the reference points
+    res : float or tuple(float, float), optional
+        grid resolution. Default: computed from the reference points
+    tol : float, optional
+        tolerated distance of the points to the grid nodes, in units of the
+        resolution. Default: 1e-3
+
+    Returns
+    -------
+    idx : np.array of int
+        index in the reference points of every point
+
+    Raises
+    ------
+    ValueError
+        if a point is not contained in the reference points
+    """
+    lat_ref, lon_ref = np.asarray(lat_ref, dtype=float), np.asarray(lon_ref, dtype=float)
+    if lat_ref.size == 0:
+        raise ValueError('No reference points provided.')
+    if res is None:
+        if lat_ref.size > 1:
+            res = u_coord.get_resolution(lat_ref, lon_ref)
+        else:
+            res = 1.0
+    origin = (lat_ref[0], lon_ref[0])
+    keys_ref = grid_keys(lat_ref, lon_ref, res, origin)
+    keys = grid_keys(lat, lon, res, origin)
+
+    order = np.argsort(keys_ref, kind='stable')
+    pos = np.searchsorted(keys_ref[order], keys)
+    pos[pos == order.size] = 0
+    idx = order[pos]
+    missing = (keys_ref[idx] != keys) | (grid_residual(lat, lon, res, origin) > tol)
+    if np.any(missing):
+        first = np.flatnonzero(missing)[0]
+        raise ValueError(f'{missing.sum()} point(s) not found in the reference points, '
+                         f'e.g. ({np.asarray(lat)[first]}, {np.asarray(lon)[first]}).')
+    return idx
+
+def grid_country_code(lat, lon, res=None):
+    """Numerical ISO3 country code of points on a regular grid.
+
+    The country codes are read from a global raster for the grid definition
+    (resolution and alignment), which is computed once with
+    `climada.util.coordinates.get_country_code` and stored in SYSTEM_DIR.
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the grid cell centers
+    res : float or tuple(float, float), optional
+        grid resolution (in lat and lon direction if tuple).
+        Default: computed from the coordinates
+
+    Returns
+    -------
+    region_id : np.array of int
+        country code of every point, 0 for points not in a country
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    grid = _cached_grid(lat, lon, res)
+    if grid is None:
+        return u_coord.get_country_code(lat, lon, gridded=True)
+    cache, rows, cols = grid
+    return cache['region_id'][rows, cols].astype(int)
+
+def grid_on_land(lat, lon, res=None):
+    """Land mask of points on a regular grid.
+
+    The mask is read from a global raster for the grid definition
+    (resolution and alignment), which is computed once with
+    `climada.util.coordinates.coord_on_land` and stored in SYSTEM_DIR.
+
+    Parameters
+    ----------
+    lat, lon : np.array
+        coordinates of the grid cell centers
+    res : float or tuple(float, float), optional
+        grid resolution (in lat and lon direction if tuple).
+        Default: computed from the coordinates
+
+    Returns
+    -------
+    on_land : np.array of bool
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    grid = _cached_grid(lat, lon, res)
+    if grid is None:
+        return u_coord.coord_on_land(lat, lon)
+    cache, rows, cols = grid
+    return cache['on_land'][rows, cols]
+
+def _cached_grid(lat, lon, res):
+    """Global cache of a grid and the position of the given points in it, or None
+    if the grid cannot be cached."""
+    if lat.size == 0:
+        return None
+    if res is None:
+        if np.unique(lat).size < 2 or np.unique(lon).size < 2:
+            return None
+        res = u_coord.get_resolution(lat, lon)
+    res_lat, res_lon = (res, res) if np.isscalar(res) else res
+    res_lat, res_lon = round(abs(float(res_lat)), 9), round(abs(float(res_lon)), 9)
+    if (180 / res_lat) * (360 / res_lon) > GRID_CACHE_MAX_SIZE:
+        return None
+    # alignment of the grid: cell center offset from the south-western corner
+    off_lat = _grid_offset(lat[0] + 90, res_lat)
+    off_lon = _grid_offset(lon[0] + 180, res_lon)
+    # points not on the grid (e.g. wrong resolution) are computed on the fly
+    if np.any(grid_residual(lat, lon, (res_lat, res_lon),
+                            origin=(off_lat - 90, off_lon - 180)) > 1e-3):
+        LOGGER.debug('Points are not on a regular %s x %s grid.', res_lat, res_lon)
+        return None
+    cache = _load_grid_cache(res_lat, res_lon, off_lat, off_lon)
+    rows = np.round((lat + 90 - off_lat) / res_lat).astype(int)
+    cols = np.round((lon + 180 - off_lon) / res_lon).astype(int)
+    rows = np.clip(rows, 0, cache['region_id'].shape[0] - 1)
+    cols = np.clip(cols, 0, cache['region_id'].shape[1] - 1)
+    return cache, rows, cols
+
+def _grid_offset(coord, res):
+    """Offset of a coordinate (relative to the grid origin) from a multiple of res"""
+    offset = round(coord - np.floor(coord / res + 1e-6) * res, 6)
+    return 0.0 if offset >= res - 1e-6 else max(offset, 0.0)
+
+@functools.lru_cache(maxsize=4)
+def _load_grid_cache(res_lat, res_lon, off_lat, off_lon):
+    """Read the country code and land mask rasters of a global grid from SYSTEM_DIR,
+    or compute and store them if they do not exist yet.
+
+    The cache is only used if it was computed with the same GRID_CACHE_VERSION,
+    package version and natural earth country borders, see _grid_cache_signature.
+
+    Returns
+    -------
+    dict
+        'region_id' (int16) and 'on_land' (bool) arrays of shape (n_lat, n_lon),
+        rows from south to north
+    """
+    file_path = _grid_cache_path(res_lat, res_lon, off_lat, off_lon)
+    signature = _grid_cache_signature()
+    if file_path.is_file():
+        with np.load(file_path) as data:
+            if 'signature' in data and data['signature'].tolist() == signature:
+                return {'region_id': data['region_id'], 'on_land': data['on_land']}
+        LOGGER.info('Cached grid %s is outdated.', file_path)
+
+    LOGGER.info('Computing country codes and land mask of the %s x %s grid, stored in %s.',
+                res_lat, res_lon, file_path)
+    lat_glob = np.arange(-90 + off_lat, 90 - 1e-6, res_lat)
+    lon_glob = np.arange(-180 + off_lon, 180 - 1e-6, res_lon)
+    lon_grid, lat_grid = np.meshgrid(lon_glob, lat_glob)
+    lat_grid, lon_grid = lat_grid.flatten(), lon_grid.flatten()
+    shape = (lat_glob.size, lon_glob.size)
+    cache = {
+        'region_id': np.asarray(u_coord.get_country_code(lat_grid, lon_grid, gridded=True),
+                                dtype=np.int16).reshape(shape),
+        'on_land': np.asarray(u_coord.coord_on_land(lat_grid, lon_grid),
+                              dtype=bool).reshape(shape),
+    }
+    # write to a temporary file first, parallel processes may compute the same grid
+    tmp_path = file_path.with_name(f'{file_path.stem}.{os.getpid()}.tmp.npz')
+    np.savez_compressed(tmp_path, signature=np.array(signature), **cache)
+    os.replace(tmp_path, file_path)
+    return cache
+
+def _grid_cache_path(res_lat, res_lon, off_lat, off_lon):
+    """File in SYSTEM_DIR of the cached country codes and land mask of a global grid"""
+    return SYSTEM_DIR.joinpath(
+        f'country_grid_{res_lat:.6f}_{res_lon:.6f}_{off_lat:.6f}_{off_lon:.6f}.npz')
+
+def _grid_cache_signature():
+    """Version of the grid cache and of the code and data it is computed with: the
+    cache version, the package version and the modification time and size of the
+    natural earth country borders file."""
+    countries_file = shapereader.natural_earth(resolution='10m', category='cultural',
+                                               name='admin_0_countries')
+    stat = os.stat(countries_file)
+    return [str(GRID_CACHE_VERSION), __version__, f'{stat.st_mtime_ns}-{stat.st_size}']
@@ -0,0 +1,110 @@
+"""
+This file is part of CLIMADA.
+
+Copyright (C) 2017 ETH Zurich, CLIMADA contributors listed in AUTHORS.
+
+CLIMADA is free software: you can redistribute it and/or modify it under the
+terms of the GNU General Public License as published by the Free
+Software Foundation, version 3.
+
+CLIMADA is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with CLIMADA. If not, see <https://www.gnu.org/licenses/>.
+
+---
+Test coordinates module.
+"""
+import unittest
+import numpy as np
+
+import climada.util.coordinates as u_coord
+from climada_petals.util.coordinates import (grid_keys, match_grid_points,
+                                             grid_country_code, grid_on_land,
+                                             _load_grid_cache, _grid_cache_path,
+                                             _grid_cache_signature)
+
+class TestMatchGridPoints(unittest.TestCase):
+    """Test coordinate matching on regular grids"""
+
+    def test_grid_keys_unique(self):
+        """Distinct grid nodes get distinct keys, noisy coordinates the same key"""
+        lon, lat = np.meshgrid(np.arange(-179.75, 180, 0.5), np.arange(89.75, -90, -0.5))
+        keys = grid_keys(lat.flatten(), lon.flatten(), 0.5)
+        self.assertEqual(np.unique(keys).size, keys.size)
+        np.testing.assert_array_equal(
+            grid_keys(lat.flatten() + 1e-9, lon.flatten() - 1e-9, 0.5), keys)
+
+    def test_match_grid_points(self):
+        """Subset of a grid is found at the correct indices"""
+        lon, lat = np.meshgrid(np.arange(-4.75, 16, 0.5), np.arange(54.75, 42, -0.5))
+        lat_ref, lon_ref = lat.flatten(), lon.flatten()
+        sub = np.array([5, 0, lat_ref.size - 1, 17, 17])
+        idx = match_grid_points(lat_ref[sub], lon_ref[sub], lat_ref, lon_ref)
+        np.testing.assert_array_equal(idx, sub)
+        idx = match_grid_points(lat_ref[sub], lon_ref[sub], lat_ref, lon_ref, res=0.5)
+        np.testing.assert_array_equal(idx, sub)
+
+    def test_match_grid_points_missing(self):
+        """Points outside of the reference raise an error"""
+        lat_ref, lon_ref = np.array([0.25, 0.25, 0.75]), np.array([0.25, 0.75, 0.25])
+        with self.assertRaises(ValueError):
+            match_grid_points(np.array([0.75]), np.array([0.75]), lat_ref, lon_ref)
+
+    def test_match_grid_points_off_grid(self):
+        """Points between grid nodes raise an error, noisy coordinates are matched"""
+        lat_ref, lon_ref = np.array([0.25, 0.25, 0.75]), np.array([0.25, 0.75, 0.25])
+        with self.assertRaises(ValueError):
+            match_grid_points(np.array([0.4]), np.array([0.25]), lat_ref, lon_ref)
+        np.testing.assert_array_equal(
+            match_grid_points(np.array([0.75 + 1e-7]), np.array([0.25]), lat_ref, lon_ref),
+            [2])
+
+class TestGridCache(unittest.TestCase):
+    """Test cached country codes and land mask of regular grids"""
+
+    def test_grid_country_code(self):
+        """Cached country codes equal the codes computed on the same grid"""
+        lon, lat = np.meshgrid(np.arange(-175, 180, 10.0), np.arange(85, -90, -10.0))
+        lat, lon = lat.flatten(), lon.flatten()
+        region_id = u_coord.get_country_code(lat, lon, gridded=True)
+        np.testing.assert_array_equal(grid_country_code(lat, lon), region_id)
+        # subset of the grid read from the (now existing) cache
+        np.testing.assert_array_equal(grid_country_code(lat[40:80], lon[40:80], res=10),
+                                      region_id[40:80])
+
+    def test_grid_country_code_not_cached(self):
+        """Fine grids and points off the given grid are computed on the fly"""
+        lat, lon = np.array([46.9, 46.95, 47.0]), np.array([7.4, 7.45, 7.5])
+        region_id = u_coord.get_country_code(lat, lon, gridded=True)
+        np.testing.assert_array_equal(grid_country_code(lat, lon), region_id)
+        np.testing.assert_array_equal(grid_country_code(lat, lon, res=0.5), region_id)
+
+    def test_grid_cache_outdated(self):
+        """A cache computed with another version or data is recomputed"""
+        lon, lat = np.meshgrid(np.arange(-170, 180, 20.0), np.arange(80, -90, -20.0))
+        lat, lon = lat.flatten(), lon.flatten()
+        file_path = _grid_cache_path(20.0, 20.0, 10.0, 10.0)
+        shape = (9, 18)
+        np.savez(file_path, signature=np.array(['0', '0', '0']),
+                 region_id=np.zeros(shape, dtype=np.int16), on_land=np.zeros(shape, bool))
+        _load_grid_cache.cache_clear()
+        np.testing.assert_array_equal(grid_country_code(lat, lon, res=20),
+                                      u_coord.get_country_code(lat, lon, gridded=True))
+        with np.load(file_path) as data:
+            self.assertListEqual(data['signature'].tolist(), _grid_cache_signature())
+
+    def test_grid_on_land(self):
+        """Cached land mask equals the mask computed from the land geometry"""
+        lon, lat = np.meshgrid(np.arange(-175, 180, 10.0), np.arange(85, -90, -10.0))
+        lat, lon = lat.flatten(), lon.flatten()
+        np.testing.assert_array_equal(grid_on_land(lat, lon, res=10),
+                                      u_coord.coord_on_land(lat, lon))
+
+# Execute Tests
+if __name__ == "__main__":
+    TESTS = unittest.TestLoader().loadTestsFromTestCase(TestMatchGridPoints)
+    TESTS.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGridCache))
+    unittest.TextTestRunner(verbosity=2).run(TESTS)
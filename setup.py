@@ -69,6 +69,7 @@ setup(
         'statsmodels',
         'tables',
         'tabulate',
+        'threadpoolctl',
         'tqdm',
         'xarray',
         'xlrd',